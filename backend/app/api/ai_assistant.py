@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Dict, Any, Optional
 from ..services.grok_ai import GrokAI
+from ..database import get_database
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,10 +18,10 @@ class ChatResponse(BaseModel):
     success: bool
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_with_ai(message: ChatMessage):
+async def chat_with_ai(message: ChatMessage, db = Depends(get_database)):
     """Chat with the AI Assistant"""
     try:
-        grok_ai = GrokAI()
+        grok_ai = GrokAI(db)
         response = await grok_ai.get_smart_response(message.message, message.context)
         
         return ChatResponse(
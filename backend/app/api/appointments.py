@@ -1,33 +1,78 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from typing import Any, Dict, List, Optional
 from bson import ObjectId
-from datetime import datetime
+from contextlib import nullcontext
+from datetime import datetime, timedelta
 
 from ..models.appointment import Appointment, AppointmentCreate, AppointmentUpdate, AppointmentResponse
 from ..models.user import User
 from .auth import get_current_active_user
 from ..database import get_database
+from ..responses import DocumentSerializer, ORJSONResponse
+from ..services.reminders import reminder_scheduler
+from ..services.scheduling import scheduling_engine, MAX_APPOINTMENT_DAYS, MAX_APPOINTMENT_LENGTH, NON_BLOCKING_STATUSES, SCHEDULING_FIELDS
+from ..services.calendar_cache import calendar_cache
+from ..services.geocoding import GeocodeService
+from ..services.routing import plan_day
 
 router = APIRouter()
 
-def appointment_helper(appointment) -> dict:
-    """Helper function to convert appointment document to dict"""
-    return {
-        "id": str(appointment["_id"]),
-        "title": appointment["title"],
-        "description": appointment.get("description"),
-        "appointment_type": appointment["appointment_type"],
-        "client_id": appointment.get("client_id"),
-        "contractor_id": appointment.get("contractor_id"),
-        "start_time": appointment["start_time"],
-        "end_time": appointment["end_time"],
-        "status": appointment.get("status", "scheduled"),
-        "location": appointment.get("location"),
-        "notes": appointment.get("notes"),
-        "is_all_day": appointment.get("is_all_day", False),
-        "created_at": appointment.get("created_at"),
-        "updated_at": appointment.get("updated_at")
-    }
+# Shapes documents like AppointmentResponse without re-validating them
+appointment_helper = DocumentSerializer(AppointmentResponse, defaults={"status": "scheduled", "is_all_day": False})
+
+def schedule_lock(contractor_id: Optional[str]):
+    """Serialize check-then-write for one contractor's bookings"""
+    return scheduling_engine.lock(contractor_id) if contractor_id else nullcontext()
+
+async def check_conflicts(
+    db,
+    appointment: Dict[str, Any],
+    response: Response,
+    allow_conflicts: bool,
+    exclude_id: Optional[str] = None
+):
+    """Reject (409) or flag an appointment that overlaps the contractor's other bookings"""
+    if appointment["end_time"] <= appointment["start_time"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="end_time must be after start_time"
+        )
+    if appointment["end_time"] - appointment["start_time"] > MAX_APPOINTMENT_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Appointments cannot be longer than {MAX_APPOINTMENT_DAYS} days"
+        )
+    if not appointment.get("contractor_id") or appointment.get("status") in NON_BLOCKING_STATUSES:
+        return
+    conflicts = await scheduling_engine.conflicts(
+        db, appointment["contractor_id"], appointment["start_time"], appointment["end_time"], exclude_id
+    )
+    if not conflicts:
+        return
+    if not allow_conflicts:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "Contractor is already booked for part of this time",
+                "conflicts": [
+                    {**conflict, "start_time": conflict["start_time"].isoformat(), "end_time": conflict["end_time"].isoformat()}
+                    for conflict in conflicts
+                ]
+            }
+        )
+    response.headers["X-Schedule-Conflicts"] = ",".join(conflict["id"] for conflict in conflicts)
+
+async def lost_race(db, appointment: Dict[str, Any], checked_at: datetime, allow_conflicts: bool) -> bool:
+    """Whether another worker booked an overlapping slot between our check at checked_at and our write"""
+    if allow_conflicts or not appointment.get("contractor_id") or appointment.get("status") in NON_BLOCKING_STATUSES:
+        return False
+    return await scheduling_engine.later_overlaps(db, appointment, checked_at)
+
+def race_conflict() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={"message": "Contractor was booked for part of this time by a concurrent request", "conflicts": []}
+    )
 
 @router.get("/", response_model=List[AppointmentResponse])
 async def get_appointments(
@@ -65,37 +110,166 @@ async def get_appointments(
     if contractor_id:
         filter_query["contractor_id"] = contractor_id
     
-    if start_date or end_date:
-        date_filter = {}
-        if start_date:
-            date_filter["$gte"] = start_date
-        if end_date:
-            date_filter["$lte"] = end_date
-        filter_query["start_time"] = date_filter
-    
-    appointments = []
-    async for appointment in db.appointments.find(filter_query).skip(skip).limit(limit):
-        appointments.append(appointment_helper(appointment))
+    # Anything overlapping the range, so multi-day jobs that started earlier are included
+    if start_date:
+        filter_query["end_time"] = {"$gte": start_date}
+    if end_date:
+        filter_query["start_time"] = {"$lte": end_date}
     
-    return appointments
+    cursor = db.appointments.find(filter_query, appointment_helper.projection).sort("start_time", 1).skip(skip).limit(limit)
+    return ORJSONResponse(appointment_helper.many(await cursor.to_list(length=limit)))
 
 @router.post("/", response_model=AppointmentResponse, status_code=status.HTTP_201_CREATED)
 async def create_appointment(
     appointment: AppointmentCreate,
+    response: Response,
+    allow_conflicts: bool = False,
     db = Depends(get_database),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Create a new appointment"""
+    """Create a new appointment (409 on a contractor double booking unless allow_conflicts is set)"""
     # Create new appointment
     appointment_dict = appointment.dict()
     appointment_dict["created_at"] = datetime.utcnow()
     appointment_dict["updated_at"] = datetime.utcnow()
     
-    result = await db.appointments.insert_one(appointment_dict)
-    created_appointment = await db.appointments.find_one({"_id": result.inserted_id})
+    async with schedule_lock(appointment_dict.get("contractor_id")):
+        checked_at = datetime.utcnow()
+        await check_conflicts(db, appointment_dict, response, allow_conflicts)
+        appointment_dict["booked_at"] = datetime.utcnow()
+        result = await db.appointments.insert_one(appointment_dict)
+        created_appointment = await db.appointments.find_one({"_id": result.inserted_id})
+        if await lost_race(db, created_appointment, checked_at, allow_conflicts):
+            await db.appointments.delete_one({"_id": result.inserted_id})
+            raise race_conflict()
+        scheduling_engine.booked(created_appointment)
+    calendar_cache.invalidate(created_appointment)
+    reminder_scheduler.schedule(created_appointment)
+    # Resolved now so route plans for the day rarely wait on the geocoder
+    GeocodeService(db).prefetch(created_appointment.get("location"))
     
     return appointment_helper(created_appointment)
 
+@router.get("/calendar")
+async def get_calendar(
+    start_date: datetime,
+    end_date: datetime,
+    contractor_id: Optional[str] = None,
+    db = Depends(get_database),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Appointments overlapping a window (up to 92 days), grouped by day and then contractor
+
+    A multi-day appointment is listed under every day it covers. Unassigned
+    appointments are grouped under "unassigned".
+    """
+    if end_date <= start_date or end_date - start_date > timedelta(days=92):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Date range must be positive and at most 92 days"
+        )
+    appointments = await calendar_cache.get_range(db, start_date, end_date, appointment_helper.projection)
+    if contractor_id:
+        appointments = [a for a in appointments if a.get("contractor_id") == contractor_id]
+    
+    days: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    for appointment in appointments:
+        item = appointment_helper(appointment)
+        day = max(appointment["start_time"], start_date).replace(hour=0, minute=0, second=0, microsecond=0)
+        last = min(appointment["end_time"], end_date)
+        while day < last:
+            key = day.strftime("%Y-%m-%d")
+            days.setdefault(key, {}).setdefault(appointment.get("contractor_id") or "unassigned", []).append(item)
+            day += timedelta(days=1)
+    
+    return ORJSONResponse({
+        "start_date": start_date,
+        "end_date": end_date,
+        "count": len(appointments),
+        "days": days
+    })
+
+@router.get("/route-plan")
+async def get_route_plan(
+    contractor_id: str,
+    date: datetime,
+    db = Depends(get_database),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Suggested visiting order and times for a contractor's site visits on one day
+
+    Stops are ordered to minimize estimated drive time (nearest neighbor then
+    2-opt), starting from the contractor's address when it can be geocoded,
+    and laid out back to back from the day's first booked start. Appointments
+    without a usable location are returned under "unrouted". Nothing is saved;
+    apply a plan by updating the appointments.
+    """
+    day = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    appointments = await db.appointments.find(
+        {
+            "contractor_id": contractor_id,
+            "start_time": {"$lt": day + timedelta(days=1)},
+            "end_time": {"$gt": day},
+            "status": {"$nin": list(NON_BLOCKING_STATUSES)}
+        },
+        appointment_helper.projection
+    ).sort("start_time", 1).to_list(length=None)
+    
+    depot_address = None
+    if ObjectId.is_valid(contractor_id):
+        contractor = await db.contractors.find_one({"_id": ObjectId(contractor_id)}, {"address": 1})
+        address = (contractor or {}).get("address") or {}
+        depot_address = ", ".join(str(address[part]) for part in ("street", "city", "state", "zip_code") if address.get(part)) or None
+    
+    candidates = [a for a in appointments if a.get("location") and not a.get("is_all_day")]
+    points = await GeocodeService(db).geocode_many(
+        [a["location"] for a in candidates] + ([depot_address] if depot_address else [])
+    )
+    routable = [a for a in candidates if points.get(a["location"])]
+    routed_ids = {a["_id"] for a in routable}
+    unrouted = [appointment_helper(a) for a in appointments if a["_id"] not in routed_ids]
+    
+    result = {"contractor_id": contractor_id, "date": day, "stops": [], "unrouted": unrouted,
+              "current_drive_minutes": 0.0, "optimized_drive_minutes": 0.0}
+    if routable:
+        plan = plan_day(
+            routable,
+            [points[a["location"]] for a in routable],
+            points.get(depot_address) if depot_address else None,
+            day_start=routable[0]["start_time"]
+        )
+        for stop in plan["stops"]:
+            stop["appointment"] = appointment_helper(stop["appointment"])
+        result.update(plan)
+    return ORJSONResponse(result)
+
+@router.get("/availability")
+async def get_availability(
+    contractor_id: str,
+    start_date: datetime,
+    end_date: datetime,
+    day_start_hour: int = Query(8, ge=0, le=23),
+    day_end_hour: int = Query(18, ge=1, le=24),
+    min_minutes: int = Query(30, ge=5, le=24 * 60),
+    db = Depends(get_database),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Free windows for a contractor within working hours over a date range (up to 31 days)"""
+    if end_date <= start_date or end_date - start_date > timedelta(days=31):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Date range must be positive and at most 31 days"
+        )
+    if day_end_hour <= day_start_hour:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="day_end_hour must be after day_start_hour"
+        )
+    free = await scheduling_engine.availability(
+        db, contractor_id, start_date, end_date, day_start_hour, day_end_hour, min_minutes
+    )
+    return {"contractor_id": contractor_id, "start_date": start_date, "end_date": end_date, "free": free}
+
 @router.get("/{appointment_id}", response_model=AppointmentResponse)
 async def get_appointment(
     appointment_id: str,
@@ -122,10 +296,12 @@ async def get_appointment(
 async def update_appointment(
     appointment_id: str,
     appointment_update: AppointmentUpdate,
+    response: Response,
+    allow_conflicts: bool = False,
     db = Depends(get_database),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Update a specific appointment"""
+    """Update a specific appointment (409 on a contractor double booking unless allow_conflicts is set)"""
     if not ObjectId.is_valid(appointment_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -142,14 +318,40 @@ async def update_appointment(
     
     # Update appointment
     update_data = {k: v for k, v in appointment_update.dict().items() if v is not None}
-    if update_data:
-        update_data["updated_at"] = datetime.utcnow()
-        await db.appointments.update_one(
-            {"_id": ObjectId(appointment_id)},
-            {"$set": update_data}
-        )
-    
-    updated_appointment = await db.appointments.find_one({"_id": ObjectId(appointment_id)})
+    merged = {**existing_appointment, **update_data}
+    reschedules = bool(update_data.keys() & SCHEDULING_FIELDS)
+    async with schedule_lock(merged.get("contractor_id")):
+        if reschedules:
+            checked_at = datetime.utcnow()
+            await check_conflicts(db, merged, response, allow_conflicts, exclude_id=appointment_id)
+            update_data["booked_at"] = datetime.utcnow()
+        if update_data:
+            update_data["updated_at"] = datetime.utcnow()
+            if "start_time" in update_data and update_data["start_time"] != existing_appointment.get("start_time"):
+                # A rescheduled appointment gets its reminders again
+                update_data["reminders_sent"] = []
+            await db.appointments.update_one(
+                {"_id": ObjectId(appointment_id)},
+                {"$set": update_data}
+            )
+        
+        updated_appointment = await db.appointments.find_one({"_id": ObjectId(appointment_id)})
+        if reschedules and await lost_race(db, updated_appointment, checked_at, allow_conflicts):
+            # Put back what this request changed; fields other writers touched are left alone
+            restore = {}
+            previous = {k: existing_appointment[k] for k in update_data if k in existing_appointment}
+            unset = {k: "" for k in update_data if k not in existing_appointment}
+            if previous:
+                restore["$set"] = previous
+            if unset:
+                restore["$unset"] = unset
+            await db.appointments.update_one({"_id": ObjectId(appointment_id)}, restore)
+            raise race_conflict()
+        scheduling_engine.booked(updated_appointment, existing_appointment.get("contractor_id"))
+    calendar_cache.invalidate(existing_appointment, updated_appointment)
+    reminder_scheduler.schedule(updated_appointment)
+    if "location" in update_data:
+        GeocodeService(db).prefetch(updated_appointment.get("location"))
     return appointment_helper(updated_appointment)
 
 @router.delete("/{appointment_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -165,9 +367,15 @@ async def delete_appointment(
             detail="Invalid appointment ID"
         )
     
-    result = await db.appointments.delete_one({"_id": ObjectId(appointment_id)})
-    if result.deleted_count == 0:
+    appointment = await db.appointments.find_one_and_delete(
+        {"_id": ObjectId(appointment_id)},
+        projection={"contractor_id": 1, "start_time": 1, "end_time": 1}
+    )
+    if not appointment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Appointment not found"
         )
+    scheduling_engine.removed(appointment.get("contractor_id"), appointment_id)
+    calendar_cache.invalidate(appointment)
+    reminder_scheduler.cancel(appointment_id)
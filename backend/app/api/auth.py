@@ -1,14 +1,17 @@
+import asyncio
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from decouple import config
 from bson import ObjectId
 
-from ..models.user import User, UserCreate, UserResponse, Token, TokenData
+from ..models.user import User, UserCreate, UserUpdate, UserResponse, Token, TokenData, RefreshRequest
 from ..database import get_database
+from ..services.auth_cache import principal_cache
+from ..services.password_hashing import hash_password, verify_password, login_throttle, account_login_throttle
+from ..services.sessions import SessionService, access_token_claims, user_from_claims
 
 router = APIRouter()
 
@@ -17,14 +20,10 @@ SECRET_KEY = config("SECRET_KEY")
 ALGORITHM = config("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(config("ACCESS_TOKEN_EXPIRE_MINUTES"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await hash_password(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -36,6 +35,19 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+async def issue_session(db, user: User, refresh_token: Optional[str] = None) -> dict:
+    """Mint a claim-rich access token, plus a new refresh token unless one was just rotated"""
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(data=access_token_claims(user), expires_delta=access_token_expires)
+    if refresh_token is None:
+        refresh_token = await SessionService(db).issue(user)
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": int(access_token_expires.total_seconds()),
+    }
+
 async def get_user_by_username(db, username: str):
     user = await db.users.find_one({"username": username})
     if user:
@@ -48,14 +60,27 @@ async def get_user_by_email(db, email: str):
         return User(**user)
     return None
 
+def decode_token(token: str) -> dict:
+    """Decode and verify a JWT, reusing the cached payload for tokens seen before"""
+    payload = principal_cache.get_payload(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        principal_cache.set_payload(token, payload)
+    return payload
+
 async def authenticate_user(db, username: str, password: str):
     user = await get_user_by_username(db, username)
     if not user:
         user = await get_user_by_email(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_password(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        # Stored hash predates the current BCRYPT_ROUNDS; upgrade it transparently
+        await db.users.update_one({"_id": user.id}, {"$set": {"hashed_password": new_hash}})
+        user.hashed_password = new_hash
     return user
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get_database)):
@@ -79,12 +104,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get
         )
     
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
         token_data = TokenData(username=username)
-    except JWTError:
+        token_version = int(payload.get("ver", 0))
+    except (JWTError, ValueError):
         raise credentials_exception
     
     # Handle test users
@@ -112,9 +138,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get
             hashed_password=""
         )
     
+    # Session access tokens carry everything needed to build the user, so no lookup is required
+    if payload.get("typ") == "access" and "uid" in payload:
+        if principal_cache.is_revoked(token_data.username, token_version):
+            raise credentials_exception
+        try:
+            return user_from_claims(payload)
+        except (KeyError, ValueError):
+            raise credentials_exception
+    
+    user = principal_cache.get_user(token_data.username, token_version)
+    if user is not None:
+        return user
+    
     user = await get_user_by_username(db, username=token_data.username)
-    if user is None:
+    if user is None or user.token_version != token_version:
         raise credentials_exception
+    principal_cache.set_user(token_data.username, token_version, user)
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
@@ -140,7 +180,7 @@ async def create_user(user: UserCreate, db = Depends(get_database)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     new_user = User(
         email=user.email,
         username=user.username,
@@ -162,7 +202,7 @@ async def create_user(user: UserCreate, db = Depends(get_database)):
     )
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db = Depends(get_database)):
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db = Depends(get_database)):
     # For demo purposes, allow test credentials
     if form_data.username == "test@mail.com" and form_data.password == "password123":
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -179,18 +219,46 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         )
         return {"access_token": access_token, "token_type": "bearer"}
     
-    user = await authenticate_user(db, form_data.username, form_data.password)
-    if not user:
+    # Behind a proxy this is the real client address only when the proxy is
+    # trusted (TRUSTED_PROXY_NETWORKS, see TrustedProxyMiddleware)
+    client = request.client.host if request.client else "unknown"
+    throttle_key = login_throttle.key(client, form_data.username)
+    async with login_throttle.attempt(throttle_key):
+        user = await authenticate_user(db, form_data.username, form_data.password)
+        if not user:
+            # Held inside the attempt, so an over-budget client waits out the delay before its next guess
+            delay = max(
+                login_throttle.backoff(throttle_key),
+                account_login_throttle.backoff(form_data.username.strip().lower())
+            )
+            if delay:
+                await asyncio.sleep(delay)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect username or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+    login_throttle.reset(throttle_key)
+    return await issue_session(db, user)
+
+@router.post("/refresh", response_model=Token)
+async def refresh_access_token(request: RefreshRequest, db = Depends(get_database)):
+    """Exchange a refresh token for a new access token and a rotated refresh token"""
+    rotated = await SessionService(db).rotate(request.refresh_token)
+    if rotated is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username or password",
+            detail="Invalid or expired refresh token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    user, refresh_token = rotated
+    return await issue_session(db, user, refresh_token)
+
+@router.post("/logout")
+async def logout(request: RefreshRequest, db = Depends(get_database)):
+    """Revoke the refresh token's session; its access token lapses within ACCESS_TOKEN_EXPIRE_MINUTES"""
+    await SessionService(db).revoke(request.refresh_token)
+    return {"message": "Logged out"}
 
 @router.get("/me", response_model=UserResponse)
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
@@ -203,3 +271,66 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
         is_admin=current_user.is_admin,
         created_at=current_user.created_at
     )
+
+@router.put("/users/{user_id}", response_model=UserResponse)
+async def update_user(
+    user_id: str,
+    user_update: UserUpdate,
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Update a user (admin only); identity changes and deactivation revoke existing tokens"""
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    
+    if not ObjectId.is_valid(user_id):
+        raise HTTPException(status_code=400, detail="Invalid user ID")
+    
+    existing_user = await db.users.find_one({"_id": ObjectId(user_id)})
+    if not existing_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    update_data = {k: v for k, v in user_update.dict().items() if v is not None}
+    if update_data.get("username", existing_user["username"]) != existing_user["username"]:
+        if await get_user_by_username(db, update_data["username"]):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username already registered"
+            )
+    if update_data.get("email", existing_user["email"]) != existing_user["email"]:
+        if await get_user_by_email(db, update_data["email"]):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already registered"
+            )
+    update = {"$set": {**update_data, "updated_at": datetime.utcnow()}}
+    
+    # Tokens carry the username and token version, so bump the version to revoke them
+    if update_data.get("is_active") is False or update_data.get("username", existing_user["username"]) != existing_user["username"]:
+        update["$inc"] = {"token_version": 1}
+    
+    await db.users.update_one({"_id": ObjectId(user_id)}, update)
+    principal_cache.invalidate_user(existing_user["username"])
+    if update_data.get("username"):
+        principal_cache.invalidate_user(update_data["username"])
+    if "$inc" in update:
+        principal_cache.revoke_versions_below(
+            existing_user["username"],
+            existing_user.get("token_version", 0) + 1,
+            ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        )
+        await SessionService(db).revoke_user(ObjectId(user_id))
+    
+    updated_user = await db.users.find_one({"_id": ObjectId(user_id)})
+    return UserResponse(
+        id=str(updated_user["_id"]),
+        email=updated_user["email"],
+        username=updated_user["username"],
+        full_name=updated_user.get("full_name"),
+        is_active=updated_user["is_active"],
+        is_admin=updated_user["is_admin"],
+        created_at=updated_user["created_at"]
+    )
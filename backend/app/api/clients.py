@@ -7,31 +7,13 @@ from ..models.client import Client, ClientCreate, ClientUpdate, ClientResponse
 from ..models.user import User
 from .auth import get_current_active_user
 from ..database import get_database
+from ..responses import DocumentSerializer, ORJSONResponse
+from ..services.metrics import MetricsService
 
 router = APIRouter()
 
-def client_helper(client) -> dict:
-    """Helper function to convert client document to dict"""
-    return {
-        "id": str(client["_id"]),
-        "first_name": client["first_name"],
-        "last_name": client["last_name"],
-        "email": client["email"],
-        "phone": client.get("phone"),
-        "project_type": client.get("project_type"),
-        "project_description": client.get("project_description"),
-        "budget": client.get("budget"),
-        "timeline": client.get("timeline"),
-        "address": client.get("address"),
-        "preferred_contact": client.get("preferred_contact"),
-        "notes": client.get("notes"),
-        "lead_source": client.get("lead_source"),
-        "is_active": client.get("is_active", True),
-        "preferred_appointment_time": client.get("preferred_appointment_time"),
-        "project_status": client.get("project_status"),
-        "created_at": client.get("created_at"),
-        "updated_at": client.get("updated_at")
-    }
+# Shapes documents like ClientResponse without re-validating them
+client_helper = DocumentSerializer(ClientResponse)
 
 @router.get("/", response_model=List[ClientResponse])
 async def get_clients(
@@ -60,11 +42,8 @@ async def get_clients(
     if is_active is not None:
         filter_query["is_active"] = is_active
     
-    clients = []
-    async for client in db.clients.find(filter_query).skip(skip).limit(limit):
-        clients.append(client_helper(client))
-    
-    return clients
+    cursor = db.clients.find(filter_query, client_helper.projection).skip(skip).limit(limit)
+    return ORJSONResponse(client_helper.many(await cursor.to_list(length=limit)))
 
 @router.post("/", response_model=ClientResponse, status_code=status.HTTP_201_CREATED)
 async def create_client(
@@ -88,6 +67,7 @@ async def create_client(
     
     result = await db.clients.insert_one(client_dict)
     created_client = await db.clients.find_one({"_id": result.inserted_id})
+    await MetricsService(db).lead_captured(client_dict.get("lead_source"), client_dict["created_at"])
     
     if not created_client:
         # Fallback: return the client_dict with the inserted ID
@@ -151,6 +131,7 @@ async def update_client(
         )
     
     updated_client = await db.clients.find_one({"_id": ObjectId(client_id)})
+    await MetricsService(db).lead_changed(existing_client, updated_client)
     return client_helper(updated_client)
 
 @router.delete("/{client_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -166,9 +147,13 @@ async def delete_client(
             detail="Invalid client ID"
         )
     
-    result = await db.clients.delete_one({"_id": ObjectId(client_id)})
-    if result.deleted_count == 0:
+    deleted = await db.clients.find_one_and_delete(
+        {"_id": ObjectId(client_id)},
+        projection={"lead_source": 1, "created_at": 1}
+    )
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Client not found"
         )
+    await MetricsService(db).lead_removed(deleted)
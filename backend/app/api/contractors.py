@@ -7,32 +7,12 @@ from ..models.contractor import Contractor, ContractorCreate, ContractorUpdate,
 from ..models.user import User
 from .auth import get_current_active_user
 from ..database import get_database
+from ..responses import DocumentSerializer, ORJSONResponse
 
 router = APIRouter()
 
-def contractor_helper(contractor) -> dict:
-    """Helper function to convert contractor document to dict"""
-    return {
-        "id": str(contractor["_id"]),
-        "first_name": contractor["first_name"],
-        "last_name": contractor["last_name"],
-        "company_name": contractor.get("company_name"),
-        "email": contractor["email"],
-        "phone": contractor.get("phone"),
-        "specialty": contractor["specialty"],
-        "hourly_rate": contractor.get("hourly_rate"),
-        "rating": contractor.get("rating", 0.0),
-        "availability": contractor.get("availability"),
-        "address": contractor.get("address"),
-        "certifications": contractor.get("certifications", []),
-        "insurance_expiry": contractor.get("insurance_expiry"),
-        "license_number": contractor.get("license_number"),
-        "notes": contractor.get("notes"),
-        "is_active": contractor.get("is_active", True),
-        "is_preferred": contractor.get("is_preferred", False),
-        "created_at": contractor.get("created_at"),
-        "updated_at": contractor.get("updated_at")
-    }
+# Shapes documents like ContractorResponse without re-validating them
+contractor_helper = DocumentSerializer(ContractorResponse, defaults={"rating": 0.0, "certifications": []})
 
 @router.get("/", response_model=List[ContractorResponse])
 async def get_contractors(
@@ -70,11 +50,8 @@ async def get_contractors(
     if is_preferred is not None:
         filter_query["is_preferred"] = is_preferred
     
-    contractors = []
-    async for contractor in db.contractors.find(filter_query).skip(skip).limit(limit):
-        contractors.append(contractor_helper(contractor))
-    
-    return contractors
+    cursor = db.contractors.find(filter_query, contractor_helper.projection).skip(skip).limit(limit)
+    return ORJSONResponse(contractor_helper.many(await cursor.to_list(length=limit)))
 
 @router.post("/", response_model=ContractorResponse, status_code=status.HTTP_201_CREATED)
 async def create_contractor(
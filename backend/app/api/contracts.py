@@ -1,25 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query
 from typing import List, Optional
 from datetime import datetime
-import secrets
 
 from ..models.contract import Contract, ContractCreate, ContractUpdate, ContractResponse, ContractStatus, PaymentStatus
 from ..models.user import User
 from .auth import get_current_active_user
 from ..database import get_database
+from ..responses import DocumentSerializer, ORJSONResponse
 from ..services.pdf_generator import PDFGenerator
 from ..services.email_service import EmailService
+from ..services.sequences import sequence_allocator
 from bson import ObjectId
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-def generate_contract_number():
-    """Generate unique contract number"""
-    timestamp = datetime.now().strftime("%Y%m%d")
-    random_part = secrets.token_hex(3).upper()
-    return f"CON-{timestamp}-{random_part}"
+contract_serializer = DocumentSerializer(ContractResponse)
+# Columns the contracts table and payments page render; line items, terms, scope and
+# signatures stay on the detail endpoint, which the contract dialog loads before opening
+CONTRACT_LIST_FIELDS = (
+    "contract_number,estimate_id,title,client_name,client_email,total,deposit_amount,balance_due,"
+    "status,payment_status,signed_at,created_at,updated_at"
+)
+
+async def generate_contract_number(db):
+    """Next contract number (CON-YYYYMMDD-NNNNN) from the sequence service"""
+    return await sequence_allocator.next_number(db, "CON")
 
 def calculate_contract_totals(line_items, tax_rate, deposit_percentage):
     """Calculate contract totals"""
@@ -43,7 +50,7 @@ async def create_contract(
     
     contract_dict = contract.dict()
     contract_dict.update({
-        "contract_number": generate_contract_number(),
+        "contract_number": await generate_contract_number(db),
         "subtotal": subtotal,
         "tax_amount": tax_amount,
         "total": total,
@@ -74,26 +81,20 @@ async def get_contracts(
     limit: int = 100,
     status: Optional[ContractStatus] = None,
     payment_status: Optional[PaymentStatus] = None,
+    fields: str = Query(CONTRACT_LIST_FIELDS, description="Comma-separated fields to return, or * for full contracts"),
     current_user: User = Depends(get_current_active_user),
     db = Depends(get_database)
 ):
+    """List contracts; only summary columns are returned unless fields asks for more"""
     query = {}
     if status:
         query["status"] = status
     if payment_status:
         query["payment_status"] = payment_status
     
-    cursor = db.contracts.find(query).skip(skip).limit(limit).sort("created_at", -1)
-    contracts = await cursor.to_list(length=limit)
-    
-    return [
-        ContractResponse(
-            id=str(contract["_id"]),
-            estimate_id=str(contract["estimate_id"]) if contract.get("estimate_id") else None,
-            **{k: v for k, v in contract.items() if k not in ["_id", "estimate_id"]}
-        )
-        for contract in contracts
-    ]
+    serializer = contract_serializer.select(fields)
+    cursor = db.contracts.find(query, serializer.projection).skip(skip).limit(limit).sort("created_at", -1)
+    return ORJSONResponse(serializer.many(await cursor.to_list(length=limit)))
 
 @router.get("/{contract_id}", response_model=ContractResponse)
 async def get_contract(
@@ -288,7 +289,7 @@ async def create_contract_from_estimate(
     )
     
     contract_data = {
-        "contract_number": generate_contract_number(),
+        "contract_number": await generate_contract_number(db),
         "estimate_id": ObjectId(estimate_id),
         "title": estimate["title"],
         "client_name": estimate["client_name"],
@@ -1,25 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query
 from typing import List, Optional
 from datetime import datetime, timedelta
-import secrets
 
 from ..models.estimate import Estimate, EstimateCreate, EstimateUpdate, EstimateResponse, EstimateStatus
 from ..models.user import User
 from .auth import get_current_active_user
 from ..database import get_database
+from ..responses import DocumentSerializer, ORJSONResponse
 from ..services.pdf_generator import PDFGenerator
 from ..services.email_service import EmailService
+from ..services.metrics import MetricsService
+from ..services.sequences import sequence_allocator
 from bson import ObjectId
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-def generate_estimate_number():
-    """Generate unique estimate number"""
-    timestamp = datetime.now().strftime("%Y%m%d")
-    random_part = secrets.token_hex(3).upper()
-    return f"EST-{timestamp}-{random_part}"
+estimate_serializer = DocumentSerializer(EstimateResponse)
+# Columns the estimates table renders; line items, terms and notes stay on the detail endpoint
+ESTIMATE_LIST_FIELDS = "estimate_number,title,client_name,client_email,total,status,valid_until,created_at,updated_at"
+
+async def generate_estimate_number(db):
+    """Next estimate number (EST-YYYYMMDD-NNNNN) from the sequence service"""
+    return await sequence_allocator.next_number(db, "EST")
 
 def calculate_totals(line_items, tax_rate):
     """Calculate estimate totals"""
@@ -39,7 +43,7 @@ async def create_estimate(
     
     estimate_dict = estimate.dict()
     estimate_dict.update({
-        "estimate_number": generate_estimate_number(),
+        "estimate_number": await generate_estimate_number(db),
         "subtotal": subtotal,
         "tax_amount": tax_amount,
         "total": total,
@@ -51,6 +55,7 @@ async def create_estimate(
     new_estimate = Estimate(**estimate_dict)
     result = await db.estimates.insert_one(new_estimate.dict(by_alias=True))
     created_estimate = await db.estimates.find_one({"_id": result.inserted_id})
+    await MetricsService(db).estimate_created(created_estimate)
     
     return EstimateResponse(
         id=str(created_estimate["_id"]),
@@ -62,23 +67,18 @@ async def get_estimates(
     skip: int = 0,
     limit: int = 100,
     status: Optional[EstimateStatus] = None,
+    fields: str = Query(ESTIMATE_LIST_FIELDS, description="Comma-separated fields to return, or * for full estimates"),
     current_user: User = Depends(get_current_active_user),
     db = Depends(get_database)
 ):
+    """List estimates; only summary columns are returned unless fields asks for more"""
     query = {}
     if status:
         query["status"] = status
     
-    cursor = db.estimates.find(query).skip(skip).limit(limit).sort("created_at", -1)
-    estimates = await cursor.to_list(length=limit)
-    
-    return [
-        EstimateResponse(
-            id=str(estimate["_id"]),
-            **{k: v for k, v in estimate.items() if k != "_id"}
-        )
-        for estimate in estimates
-    ]
+    serializer = estimate_serializer.select(fields)
+    cursor = db.estimates.find(query, serializer.projection).skip(skip).limit(limit).sort("created_at", -1)
+    return ORJSONResponse(serializer.many(await cursor.to_list(length=limit)))
 
 @router.get("/{estimate_id}", response_model=EstimateResponse)
 async def get_estimate(
@@ -133,6 +133,7 @@ async def update_estimate(
     )
     
     updated_estimate = await db.estimates.find_one({"_id": ObjectId(estimate_id)})
+    await MetricsService(db).estimate_changed(existing_estimate, updated_estimate)
     return EstimateResponse(
         id=str(updated_estimate["_id"]),
         **{k: v for k, v in updated_estimate.items() if k != "_id"}
@@ -209,6 +210,7 @@ async def send_estimate(
             {"_id": ObjectId(estimate_id)},
             {"$set": {"status": EstimateStatus.SENT, "updated_at": datetime.utcnow()}}
         )
+        await MetricsService(db).estimate_changed(estimate, {**estimate, "status": EstimateStatus.SENT})
         
         return {"message": "Estimate sent successfully"}
     
@@ -232,7 +234,7 @@ async def duplicate_estimate(
     # Create duplicate
     duplicate_data = {k: v for k, v in original_estimate.items() if k not in ["_id", "estimate_number", "pdf_url", "created_at", "updated_at"]}
     duplicate_data.update({
-        "estimate_number": generate_estimate_number(),
+        "estimate_number": await generate_estimate_number(db),
         "title": f"{original_estimate['title']} (Copy)",
         "status": EstimateStatus.DRAFT,
         "created_by": current_user.id,
@@ -243,6 +245,7 @@ async def duplicate_estimate(
     new_estimate = Estimate(**duplicate_data)
     result = await db.estimates.insert_one(new_estimate.dict(by_alias=True))
     created_estimate = await db.estimates.find_one({"_id": result.inserted_id})
+    await MetricsService(db).estimate_created(created_estimate)
     
     return EstimateResponse(
         id=str(created_estimate["_id"]),
@@ -258,9 +261,11 @@ async def delete_estimate(
     if not ObjectId.is_valid(estimate_id):
         raise HTTPException(status_code=400, detail="Invalid estimate ID")
     
-    result = await db.estimates.delete_one({"_id": ObjectId(estimate_id)})
+    deleted_estimate = await db.estimates.find_one_and_delete({"_id": ObjectId(estimate_id)})
     
-    if result.deleted_count == 0:
+    if not deleted_estimate:
         raise HTTPException(status_code=404, detail="Estimate not found")
     
+    await MetricsService(db).estimate_deleted(deleted_estimate)
+    
     return {"message": "Estimate deleted successfully"}
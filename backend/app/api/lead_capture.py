@@ -2,12 +2,17 @@ from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import Optional
 from datetime import datetime
 from bson import ObjectId
+import asyncio
 import logging
+import time
 
 from ..models.client import ClientCreate, Client
 from ..database import get_database
 from ..services.email_service import EmailService
 from ..services.grok_ai import GrokAI
+from ..services.settings_cache import settings_cache
+from ..services.metrics import MetricsService
+from .workflow import created_at_filter
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -60,6 +65,7 @@ async def capture_lead(
         # Save lead to database
         result = await db.clients.insert_one(lead_info)
         lead_id = str(result.inserted_id)
+        await MetricsService(db).lead_captured(lead_info["lead_source"], lead_info["created_at"])
         
         # Send welcome email
         email_service = EmailService()
@@ -279,40 +285,62 @@ async def configure_lead_routing(
     
     await db.settings.update_one(
         {},
-        {"$set": {"lead_routing": config}},
+        {"$set": {"lead_routing": config}, "$inc": {"settings_version": 1}},
         upsert=True
     )
+    settings_cache.invalidate()
     
     return {"success": True, "message": "Lead routing configured"}
 
 @router.get("/lead-stats")
 async def get_lead_stats(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
     db=Depends(get_database)
 ):
     """
-    Get lead capture statistics
+    Get lead capture statistics for a created_at range (defaults to today)
     """
+    started = time.perf_counter()
+    if start_date is None and end_date is None:
+        start_date = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    
     pipeline = [
+        {"$match": created_at_filter(start_date, end_date)},
         {
-            "$match": {
-                "created_at": {"$gte": datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)}
-            }
-        },
-        {
-            "$group": {
-                "_id": {
-                    "lead_source": "$lead_source",
-                    "project_type": "$project_type"
-                },
-                "count": {"$sum": 1},
-                "avg_score": {"$avg": "$lead_score"}
+            "$facet": {
+                "breakdown": [
+                    {
+                        "$group": {
+                            "_id": {
+                                "lead_source": "$lead_source",
+                                "project_type": "$project_type"
+                            },
+                            "count": {"$sum": 1},
+                            "avg_score": {"$avg": "$lead_score"}
+                        }
+                    }
+                ],
+                "summary": [
+                    {"$group": {"_id": None, "count": {"$sum": 1}, "avg_score": {"$avg": "$lead_score"}}}
+                ]
             }
         }
     ]
     
-    stats = await db.clients.aggregate(pipeline).to_list(None)
+    # The all-time total comes from collection metadata rather than a full count
+    facets, total_leads = await asyncio.gather(
+        db.clients.aggregate(pipeline).to_list(None),
+        db.clients.estimated_document_count()
+    )
+    facets = facets[0] if facets else {"breakdown": [], "summary": []}
+    summary = facets["summary"][0] if facets["summary"] else {"count": 0, "avg_score": None}
     
     return {
-        "today_stats": stats,
-        "total_leads": await db.clients.count_documents({})
+        "today_stats": facets["breakdown"],
+        "range_leads": summary["count"],
+        "range_avg_score": summary["avg_score"],
+        "total_leads": total_leads,
+        "range": {"start_date": start_date, "end_date": end_date},
+        "query_ms": round((time.perf_counter() - started) * 1000, 1)
     }
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from ..models.user import User
+from ..database import get_database
+from ..services.metrics import MetricsService
+from ..services.stripe_service import stripe_call_stats
+from .auth import get_current_active_user
+
+router = APIRouter()
+
+@router.get("/")
+async def get_metrics(
+    days: int = Query(30, ge=1, le=366),
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Dashboard metrics read from the precomputed rollups"""
+    service = MetricsService(db)
+    return {
+        "totals": await service.get_totals(),
+        "daily": await service.get_daily(days)
+    }
+
+@router.get("/stripe")
+async def get_stripe_call_metrics(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Per-operation Stripe call counts, retries and latency for this process (admin only)"""
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return stripe_call_stats.snapshot()
+
+@router.post("/rebuild")
+async def rebuild_metrics(
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Recompute the rollups from source collections (admin only; also runs nightly)"""
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return await MetricsService(db).rebuild()
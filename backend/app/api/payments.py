@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from typing import Dict, Any
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+import orjson
 import stripe
 from decouple import config
 
@@ -8,7 +9,11 @@ from ..models.contract import Contract, ContractCreate, PaymentStatus
 from ..models.user import User
 from .auth import get_current_active_user
 from ..database import get_database
-from ..services.stripe_service import StripeService
+from ..services.stripe_service import StripeService, idempotency_key
+from ..services.stripe_events import stripe_event_processor
+from ..services.payment_ledger import PaymentLedger
+from ..services.dunning import dunning_engine
+from ..responses import ORJSONResponse
 from bson import ObjectId
 import logging
 
@@ -17,6 +22,8 @@ logger = logging.getLogger(__name__)
 
 # Initialize Stripe
 stripe.api_key = config("STRIPE_SECRET_KEY")
+# Point at a stripe-mock server (e.g. http://localhost:12111) for local runs and tests
+stripe.api_base = config("STRIPE_API_BASE", default=stripe.api_base)
 
 @router.post("/create-payment-intent")
 async def create_payment_intent(
@@ -37,14 +44,17 @@ async def create_payment_intent(
         # Create payment intent for deposit amount
         amount = int(contract["deposit_amount"] * 100)  # Convert to cents
         
-        payment_intent = stripe_service.create_payment_intent(
+        metadata = {
+            "contract_id": contract_id,
+            "client_email": contract["client_email"],
+            "contract_number": contract["contract_number"]
+        }
+        # Same key for a repeated request, so a double submit reuses the intent
+        payment_intent = await stripe_service.create_payment_intent(
             amount=amount,
             currency="usd",
-            metadata={
-                "contract_id": contract_id,
-                "client_email": contract["client_email"],
-                "contract_number": contract["contract_number"]
-            }
+            metadata=metadata,
+            idempotency_key=idempotency_key(f"contract-{contract_id}-deposit", {"amount": amount, "metadata": metadata})
         )
         
         # Update contract with payment intent ID
@@ -58,18 +68,29 @@ async def create_payment_intent(
             "payment_intent_id": payment_intent.id
         }
     
+    except stripe.error.IdempotencyError as e:
+        logger.warning(f"Error creating payment intent: {e}")
+        raise HTTPException(status_code=409, detail="A conflicting payment request for this contract was just made; try again")
     except Exception as e:
         logger.error(f"Error creating payment intent: {e}")
         raise HTTPException(status_code=500, detail="Error creating payment intent")
 
+def require_admin(current_user: User):
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+
 @router.post("/webhook")
 async def stripe_webhook(request: Request, db = Depends(get_database)):
+    """Verify and store the event; processing happens on the event workers"""
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
     endpoint_secret = config("STRIPE_WEBHOOK_SECRET")
     
     try:
-        event = stripe.Webhook.construct_event(
+        stripe.Webhook.construct_event(
             payload, sig_header, endpoint_secret
         )
     except ValueError:
@@ -79,31 +100,57 @@ async def stripe_webhook(request: Request, db = Depends(get_database)):
         logger.error("Invalid signature")
         raise HTTPException(status_code=400, detail="Invalid signature")
     
-    # Handle the event
-    if event["type"] == "payment_intent.succeeded":
-        payment_intent = event["data"]["object"]
-        contract_id = payment_intent["metadata"].get("contract_id")
-        
-        if contract_id and ObjectId.is_valid(contract_id):
-            # Update contract payment status
-            await db.contracts.update_one(
-                {"_id": ObjectId(contract_id)},
-                {
-                    "$set": {
-                        "payment_status": PaymentStatus.PARTIAL,
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
-            logger.info(f"Payment succeeded for contract {contract_id}")
-    
-    elif event["type"] == "payment_intent.payment_failed":
-        payment_intent = event["data"]["object"]
-        contract_id = payment_intent["metadata"].get("contract_id")
-        logger.warning(f"Payment failed for contract {contract_id}")
-    
+    # Store the event exactly as Stripe sent it
+    await stripe_event_processor.ingest(db, orjson.loads(payload))
     return {"status": "success"}
 
+@router.get("/events")
+async def list_stripe_events(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    contract_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Recent stored webhook events, e.g. status=failed to find ones to replay (admin only)"""
+    require_admin(current_user)
+    query = {}
+    if status_filter:
+        query["status"] = status_filter
+    if contract_id:
+        query["contract_id"] = contract_id
+    cursor = db.stripe_events.find(query, {"payload": 0}).sort("created", -1).limit(limit)
+    return await cursor.to_list(length=limit)
+
+@router.post("/events/replay")
+async def replay_stripe_events(
+    event_ids: Optional[List[str]] = Query(None, alias="event_id"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    event_types: Optional[List[str]] = Query(None, alias="type"),
+    contract_id: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Re-run stored events matching the filters (admin only)"""
+    require_admin(current_user)
+    if not any([event_ids, since, until, event_types, contract_id]):
+        raise HTTPException(status_code=400, detail="Give at least one filter")
+    replayed = await stripe_event_processor.replay(db, event_ids, since, until, event_types, contract_id)
+    return {"replayed": replayed}
+
+@router.post("/events/backfill")
+async def backfill_stripe_events(
+    since: datetime,
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Pull events Stripe sent while webhooks were failing (admin only, last 30 days)"""
+    require_admin(current_user)
+    if since < datetime.utcnow() - timedelta(days=30):
+        raise HTTPException(status_code=400, detail="Stripe only keeps events for 30 days")
+    return await stripe_event_processor.backfill(db, since)
+
 @router.get("/payment-status/{contract_id}")
 async def get_payment_status(
     contract_id: str,
@@ -125,16 +172,12 @@ async def get_payment_status(
         "balance_due": contract["balance_due"]
     }
     
-    # Get Stripe payment details if available
+    # Stripe payment details as last recorded in the ledger
     if contract.get("stripe_payment_intent_id"):
-        try:
-            payment_intent = stripe.PaymentIntent.retrieve(
-                contract["stripe_payment_intent_id"]
-            )
-            payment_info["stripe_status"] = payment_intent.status
-            payment_info["amount_received"] = payment_intent.amount_received / 100
-        except Exception as e:
-            logger.error(f"Error retrieving Stripe payment: {e}")
+        payment_intent = await PaymentLedger(db).payment_intent(contract["stripe_payment_intent_id"])
+        if payment_intent:
+            payment_info["stripe_status"] = payment_intent["status"]
+            payment_info["amount_received"] = payment_intent["amount_received"]
     
     return payment_info
 
@@ -160,15 +203,17 @@ async def process_balance_payment(
         # Create payment intent for balance amount
         amount = int(contract["balance_due"] * 100)  # Convert to cents
         
-        payment_intent = stripe_service.create_payment_intent(
+        metadata = {
+            "contract_id": contract_id,
+            "client_email": contract["client_email"],
+            "contract_number": contract["contract_number"],
+            "payment_type": "balance"
+        }
+        payment_intent = await stripe_service.create_payment_intent(
             amount=amount,
             currency="usd",
-            metadata={
-                "contract_id": contract_id,
-                "client_email": contract["client_email"],
-                "contract_number": contract["contract_number"],
-                "payment_type": "balance"
-            }
+            metadata=metadata,
+            idempotency_key=idempotency_key(f"contract-{contract_id}-balance", {"amount": amount, "metadata": metadata})
         )
         
         return {
@@ -176,6 +221,9 @@ async def process_balance_payment(
             "payment_intent_id": payment_intent.id
         }
     
+    except stripe.error.IdempotencyError as e:
+        logger.warning(f"Error creating balance payment intent: {e}")
+        raise HTTPException(status_code=409, detail="A conflicting payment request for this contract was just made; try again")
     except Exception as e:
         logger.error(f"Error creating balance payment intent: {e}")
         raise HTTPException(status_code=500, detail="Error creating payment intent")
@@ -189,31 +237,88 @@ async def get_contract_transactions(
     if not ObjectId.is_valid(contract_id):
         raise HTTPException(status_code=400, detail="Invalid contract ID")
     
-    contract = await db.contracts.find_one({"_id": ObjectId(contract_id)})
+    contract = await db.contracts.find_one({"_id": ObjectId(contract_id)}, {"_id": 1})
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
     
-    transactions = []
-    
-    if contract.get("stripe_payment_intent_id"):
-        try:
-            # Get all charges for this customer
-            charges = stripe.Charge.list(
-                limit=100,
-                metadata={"contract_id": contract_id}
-            )
-            
-            for charge in charges.data:
-                transactions.append({
-                    "id": charge.id,
-                    "amount": charge.amount / 100,
-                    "status": charge.status,
-                    "created": charge.created,
-                    "description": charge.description,
-                    "receipt_url": charge.receipt_url
-                })
-        
-        except Exception as e:
-            logger.error(f"Error retrieving transactions: {e}")
-    
-    return transactions
+    return await PaymentLedger(db).transactions(contract_id)
+
+@router.post("/reconcile")
+async def reconcile_payments(
+    hours: int = Query(48, ge=1, le=24 * 365 * 3),
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Sync the payments ledger with Stripe for the last `hours` (admin only; also runs periodically)"""
+    require_admin(current_user)
+    return await PaymentLedger(db).reconcile(datetime.utcnow() - timedelta(hours=hours))
+
+def dunning_run_id(run_id: str) -> ObjectId:
+    if not ObjectId.is_valid(run_id):
+        raise HTTPException(status_code=400, detail="Invalid run ID")
+    return ObjectId(run_id)
+
+@router.post("/dunning/runs")
+async def start_dunning_run(
+    dry_run: bool = False,
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Invoice and remind every contract with a balance due, in the background (admin only)
+
+    dry_run only counts the contracts that would get a reminder.
+    """
+    require_admin(current_user)
+    run = await dunning_engine.start_run(db, triggered_by=current_user.username, dry_run=dry_run)
+    if not run:
+        raise HTTPException(status_code=409, detail="A dunning run is already in progress")
+    return ORJSONResponse(run, status_code=status.HTTP_202_ACCEPTED)
+
+@router.get("/dunning/runs")
+async def list_dunning_runs(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Recent dunning runs with their progress counters (admin only)"""
+    require_admin(current_user)
+    cursor = db.dunning_runs.find({}).sort("started_at", -1).limit(limit)
+    return ORJSONResponse(await cursor.to_list(length=limit))
+
+@router.get("/dunning/runs/{run_id}")
+async def get_dunning_run(
+    run_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """One dunning run (admin only)"""
+    require_admin(current_user)
+    run = await db.dunning_runs.find_one({"_id": dunning_run_id(run_id)})
+    if not run:
+        raise HTTPException(status_code=404, detail="Dunning run not found")
+    return ORJSONResponse(run)
+
+@router.post("/dunning/runs/{run_id}/resume")
+async def resume_dunning_run(
+    run_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Continue a failed or cancelled run from its last checkpoint (admin only)"""
+    require_admin(current_user)
+    run = await dunning_engine.resume(db, dunning_run_id(run_id))
+    if not run:
+        raise HTTPException(status_code=409, detail="Run is not failed or cancelled, or another run is in progress")
+    return ORJSONResponse(run, status_code=status.HTTP_202_ACCEPTED)
+
+@router.post("/dunning/runs/{run_id}/cancel")
+async def cancel_dunning_run(
+    run_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Stop a running run after its current batch (admin only)"""
+    require_admin(current_user)
+    if not await dunning_engine.cancel(db, dunning_run_id(run_id)):
+        raise HTTPException(status_code=409, detail="Run is not in progress")
+    return {"status": "cancelled"}
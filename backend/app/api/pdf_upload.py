@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from typing import List
+from typing import Any, Dict, List
+import asyncio
 import aiofiles
 import os
 from datetime import datetime
@@ -7,6 +8,7 @@ from datetime import datetime
 from ..models.user import User
 from .auth import get_current_active_user
 from ..services.pdf_parser import PDFParser
+from ..services.upload_spool import spool_upload
 import cloudinary.uploader
 from decouple import config
 import logging
@@ -23,6 +25,13 @@ cloudinary.config(
 
 UPLOAD_DIR = "uploads"
 ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg", ".gif", ".doc", ".docx"}
+CLOUDINARY_CHUNK_SIZE = 6 * 1024 * 1024  # Cloudinary requires chunks of at least 5 MB
+
+async def upload_to_cloudinary(path: str, **options) -> Dict[str, Any]:
+    """Chunked Cloudinary upload on a worker thread; the SDK blocks for the whole transfer"""
+    return await asyncio.to_thread(
+        cloudinary.uploader.upload_large, path, chunk_size=CLOUDINARY_CHUNK_SIZE, **options
+    )
 
 @router.post("/pdf")
 async def upload_pdf(
@@ -35,32 +44,33 @@ async def upload_pdf(
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Upload to Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            content,
-            resource_type="raw",
-            folder="vendor_documents",
-            public_id=f"{vendor_id}_{int(datetime.now().timestamp())}" if vendor_id else f"doc_{int(datetime.now().timestamp())}"
-        )
-        
-        # Parse PDF content
-        pdf_parser = PDFParser()
-        extracted_data = await pdf_parser.extract_data_from_pdf(content)
-        
-        return {
-            "message": "PDF uploaded and processed successfully",
-            "file_url": upload_result["secure_url"],
-            "extracted_data": extracted_data,
-            "file_info": {
-                "filename": file.filename,
-                "size": len(content),
-                "upload_time": datetime.utcnow().isoformat()
+        # Spool to disk so the parser and uploader share one bounded copy
+        async with spool_upload(file) as upload:
+            # Parse PDF content
+            pdf_parser = PDFParser()
+            extracted_data = await pdf_parser.extract_data_from_pdf(upload.path)
+            
+            # Upload to Cloudinary
+            upload_result = await upload_to_cloudinary(
+                upload.path,
+                resource_type="raw",
+                folder="vendor_documents",
+                public_id=f"{vendor_id}_{int(datetime.now().timestamp())}" if vendor_id else f"doc_{int(datetime.now().timestamp())}"
+            )
+            
+            return {
+                "message": "PDF uploaded and processed successfully",
+                "file_url": upload_result["secure_url"],
+                "extracted_data": extracted_data,
+                "file_info": {
+                    "filename": file.filename,
+                    "size": upload.size,
+                    "upload_time": datetime.utcnow().isoformat()
+                }
             }
-        }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading PDF: {e}")
         raise HTTPException(status_code=500, detail="Error processing PDF file")
@@ -75,30 +85,31 @@ async def upload_image(
         raise HTTPException(status_code=400, detail="Only image files are allowed")
     
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Upload to Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            content,
-            folder="images",
-            public_id=f"img_{int(datetime.now().timestamp())}"
-        )
-        
-        return {
-            "message": "Image uploaded successfully",
-            "file_url": upload_result["secure_url"],
-            "thumbnail_url": upload_result.get("eager", [{}])[0].get("secure_url") if upload_result.get("eager") else None,
-            "file_info": {
-                "filename": file.filename,
-                "size": len(content),
-                "width": upload_result.get("width"),
-                "height": upload_result.get("height"),
-                "format": upload_result.get("format"),
-                "upload_time": datetime.utcnow().isoformat()
+        async with spool_upload(file) as upload:
+            # Upload to Cloudinary
+            upload_result = await upload_to_cloudinary(
+                upload.path,
+                resource_type="image",
+                folder="images",
+                public_id=f"img_{int(datetime.now().timestamp())}"
+            )
+            
+            return {
+                "message": "Image uploaded successfully",
+                "file_url": upload_result["secure_url"],
+                "thumbnail_url": upload_result.get("eager", [{}])[0].get("secure_url") if upload_result.get("eager") else None,
+                "file_info": {
+                    "filename": file.filename,
+                    "size": upload.size,
+                    "width": upload_result.get("width"),
+                    "height": upload_result.get("height"),
+                    "format": upload_result.get("format"),
+                    "upload_time": datetime.utcnow().isoformat()
+                }
             }
-        }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading image: {e}")
         raise HTTPException(status_code=500, detail="Error uploading image")
@@ -117,28 +128,28 @@ async def upload_document(
         )
     
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Upload to Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            content,
-            resource_type="raw",
-            folder="documents",
-            public_id=f"doc_{int(datetime.now().timestamp())}"
-        )
-        
-        return {
-            "message": "Document uploaded successfully",
-            "file_url": upload_result["secure_url"],
-            "file_info": {
-                "filename": file.filename,
-                "size": len(content),
-                "format": upload_result.get("format"),
-                "upload_time": datetime.utcnow().isoformat()
+        async with spool_upload(file) as upload:
+            # Upload to Cloudinary
+            upload_result = await upload_to_cloudinary(
+                upload.path,
+                resource_type="raw",
+                folder="documents",
+                public_id=f"doc_{int(datetime.now().timestamp())}"
+            )
+            
+            return {
+                "message": "Document uploaded successfully",
+                "file_url": upload_result["secure_url"],
+                "file_info": {
+                    "filename": file.filename,
+                    "size": upload.size,
+                    "format": upload_result.get("format"),
+                    "upload_time": datetime.utcnow().isoformat()
+                }
             }
-        }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading document: {e}")
         raise HTTPException(status_code=500, detail="Error uploading document")
@@ -165,25 +176,30 @@ async def bulk_upload(
                 })
                 continue
             
-            # Read file content
-            content = await file.read()
-            
             # Determine resource type
             resource_type = "image" if file_extension in ['.png', '.jpg', '.jpeg', '.gif'] else "raw"
             
-            # Upload to Cloudinary
-            upload_result = cloudinary.uploader.upload(
-                content,
-                resource_type=resource_type,
-                folder="bulk_uploads",
-                public_id=f"bulk_{int(datetime.now().timestamp())}_{file.filename}"
-            )
-            
+            async with spool_upload(file) as upload:
+                # Upload to Cloudinary
+                upload_result = await upload_to_cloudinary(
+                    upload.path,
+                    resource_type=resource_type,
+                    folder="bulk_uploads",
+                    public_id=f"bulk_{int(datetime.now().timestamp())}_{file.filename}"
+                )
+                
+                results.append({
+                    "filename": file.filename,
+                    "status": "success",
+                    "file_url": upload_result["secure_url"],
+                    "size": upload.size
+                })
+        
+        except HTTPException as e:
             results.append({
                 "filename": file.filename,
-                "status": "success",
-                "file_url": upload_result["secure_url"],
-                "size": len(content)
+                "status": "error",
+                "message": e.detail
             })
         
         except Exception as e:
@@ -7,23 +7,12 @@ from ..models.service import Service, ServiceCreate, ServiceUpdate, ServiceRespo
 from ..models.user import User
 from .auth import get_current_active_user
 from ..database import get_database
+from ..responses import DocumentSerializer, ORJSONResponse
 
 router = APIRouter()
 
-def service_helper(service) -> dict:
-    """Helper function to convert service document to dict"""
-    return {
-        "id": str(service["_id"]),
-        "name": service["name"],
-        "description": service.get("description"),
-        "category": service["category"],
-        "base_price": service.get("base_price"),
-        "unit": service.get("unit", "each"),
-        "estimated_duration": service.get("estimated_duration"),
-        "is_active": service.get("is_active", True),
-        "created_at": service.get("created_at"),
-        "updated_at": service.get("updated_at")
-    }
+# Shapes documents like ServiceResponse without re-validating them
+service_helper = DocumentSerializer(ServiceResponse, defaults={"unit": "each", "is_active": True})
 
 @router.get("/", response_model=List[ServiceResponse])
 async def get_services(
@@ -51,11 +40,8 @@ async def get_services(
     if is_active is not None:
         filter_query["is_active"] = is_active
     
-    services = []
-    async for service in db.services.find(filter_query).skip(skip).limit(limit):
-        services.append(service_helper(service))
-    
-    return services
+    cursor = db.services.find(filter_query, service_helper.projection).skip(skip).limit(limit)
+    return ORJSONResponse(service_helper.many(await cursor.to_list(length=limit)))
 
 @router.post("/", response_model=ServiceResponse, status_code=status.HTTP_201_CREATED)
 async def create_service(
@@ -1,22 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from typing import List, Optional
 from bson import ObjectId
 from datetime import datetime
+from decouple import config
 
 from ..models.settings import Settings, SettingsUpdate, SettingsResponse, CompanyInfo, IntegrationCredentials, FeatureFlags, UserPermissions
 from ..models.user import User
 from ..database import get_database
+from ..services.settings_cache import settings_cache, SettingsSnapshot
+from ..middleware import etag_matches
 from .auth import get_current_user
 
 router = APIRouter()
 
+SETTINGS_PUBLIC_MAX_AGE = int(config("SETTINGS_PUBLIC_MAX_AGE", default=60))
+
+def snapshot_headers(snapshot: SettingsSnapshot, cache_control: str) -> dict:
+    return {"ETag": snapshot.etag, "Cache-Control": cache_control}
+
+def not_modified(request: Request, snapshot: SettingsSnapshot) -> bool:
+    """True when the client's If-None-Match already names the current snapshot"""
+    return etag_matches(request.headers.get("if-none-match"), snapshot.etag)
+
 @router.get("/company", response_model=CompanyInfo)
 async def get_company_info(
+    request: Request,
+    response: Response,
     db=Depends(get_database),
     current_user: User = Depends(get_current_user)
 ):
     """Get company information (public endpoint for branding)"""
-    settings = await db.settings.find_one({})
+    settings = await settings_cache.get(db)
+    headers = snapshot_headers(settings, f"private, max-age={SETTINGS_PUBLIC_MAX_AGE}")
+    if not_modified(request, settings):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
     if not settings:
         # Return default company info if no settings exist
         return CompanyInfo()
@@ -35,16 +53,16 @@ async def get_settings(
             detail="Admin access required"
         )
     
-    settings = await db.settings.find_one({})
+    settings = await settings_cache.get(db)
     if not settings:
         # Create default settings if none exist
         default_settings = Settings()
         result = await db.settings.insert_one(default_settings.dict(by_alias=True, exclude={"id"}))
-        settings = await db.settings.find_one({"_id": result.inserted_id})
+        settings = settings_cache.store(await db.settings.find_one({"_id": result.inserted_id}))
     
     return SettingsResponse(
-        id=str(settings["_id"]),
-        **{k: v for k, v in settings.items() if k != "_id"}
+        id=str(settings.get("_id")),
+        **{k: v for k, v in settings.data.items() if k != "_id"}
     )
 
 @router.put("/", response_model=SettingsResponse)
@@ -60,7 +78,7 @@ async def update_settings(
             detail="Admin access required"
         )
     
-    # Get existing settings
+    # Read the live document rather than the snapshot so concurrent admins don't overwrite each other
     existing_settings = await db.settings.find_one({})
     if not existing_settings:
         # Create new settings if none exist
@@ -91,19 +109,25 @@ async def update_settings(
         
         await db.settings.update_one(
             {"_id": existing_settings["_id"]},
-            {"$set": update_data}
+            {"$set": update_data, "$inc": {"settings_version": 1}}
         )
         settings = await db.settings.find_one({"_id": existing_settings["_id"]})
     
+    settings = settings_cache.store(settings)
+    
     return SettingsResponse(
-        id=str(settings["_id"]),
-        **{k: v for k, v in settings.items() if k != "_id"}
+        id=str(settings.get("_id")),
+        **{k: v for k, v in settings.data.items() if k != "_id"}
     )
 
 @router.get("/public", response_model=dict)
-async def get_public_settings(db=Depends(get_database)):
+async def get_public_settings(request: Request, response: Response, db=Depends(get_database)):
     """Get public settings (no authentication required)"""
-    settings = await db.settings.find_one({})
+    settings = await settings_cache.get(db)
+    headers = snapshot_headers(settings, f"public, max-age={SETTINGS_PUBLIC_MAX_AGE}")
+    if not_modified(request, settings):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
     if not settings:
         # Return default public settings
         return {
@@ -137,7 +161,7 @@ async def test_integration(
             detail="Admin access required"
         )
     
-    settings = await db.settings.find_one({})
+    settings = await settings_cache.get(db)
     if not settings:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
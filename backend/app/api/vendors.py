@@ -1,18 +1,56 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
 
-from ..models.vendor import Vendor, VendorCreate, VendorUpdate, VendorResponse
+from ..models.vendor import Vendor, VendorCreate, VendorUpdate, VendorResponse, PriceTableLayout, PricingInfo
 from ..models.user import User
 from .auth import get_current_active_user
 from ..database import get_database
 from ..services.pdf_parser import PDFParser
+from ..services.upload_spool import spool_upload
+from ..services.vendor_pricing import VendorPricingService
 from bson import ObjectId
+import asyncio
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Pricing lives in the vendor_prices collection, never embedded in list reads
+VENDOR_LIST_PROJECTION = {"pricing": 0, "pricing_layout": 0}
+
+async def vendor_response(
+    pricing_service: VendorPricingService,
+    vendor: dict,
+    include_pricing: bool = True,
+    pricing_skip: int = 0,
+    pricing_limit: int = 100,
+    pricing_page: Optional[Tuple[List[dict], int]] = None
+) -> VendorResponse:
+    """Build a VendorResponse, optionally attaching one page of the vendor's prices
+
+    pricing_page, when given, is that page and the total count already loaded
+    for several vendors at once.
+    """
+    await pricing_service.migrate_embedded_pricing(vendor)
+    
+    pricing = []
+    pricing_count = None
+    if pricing_page is not None:
+        pricing, pricing_count = pricing_page
+    elif include_pricing:
+        pricing, pricing_count = await asyncio.gather(
+            pricing_service.get_pricing(vendor["_id"], pricing_skip, pricing_limit),
+            pricing_service.count_pricing(vendor["_id"])
+        )
+    
+    return VendorResponse(
+        id=str(vendor["_id"]),
+        pricing=pricing,
+        pricing_count=pricing_count,
+        **{k: v for k, v in vendor.items() if k not in ["_id", "pricing", "pricing_layout"]}
+    )
+
 @router.post("/", response_model=VendorResponse)
 async def create_vendor(
     vendor: VendorCreate,
@@ -20,18 +58,20 @@ async def create_vendor(
     db = Depends(get_database)
 ):
     vendor_dict = vendor.dict()
+    pricing = vendor_dict.pop("pricing", [])
     vendor_dict["created_by"] = current_user.id
     vendor_dict["created_at"] = datetime.utcnow()
     vendor_dict["updated_at"] = datetime.utcnow()
     
     new_vendor = Vendor(**vendor_dict)
-    result = await db.vendors.insert_one(new_vendor.dict(by_alias=True))
-    created_vendor = await db.vendors.find_one({"_id": result.inserted_id})
+    result = await db.vendors.insert_one(new_vendor.dict(by_alias=True, exclude={"pricing", "pricing_layout"}))
     
-    return VendorResponse(
-        id=str(created_vendor["_id"]),
-        **{k: v for k, v in created_vendor.items() if k != "_id"}
-    )
+    pricing_service = VendorPricingService(db)
+    if pricing:
+        await pricing_service.merge_pricing(result.inserted_id, pricing)
+    
+    created_vendor = await db.vendors.find_one({"_id": result.inserted_id})
+    return await vendor_response(pricing_service, created_vendor)
 
 @router.get("/", response_model=List[VendorResponse])
 async def get_vendors(
@@ -39,6 +79,8 @@ async def get_vendors(
     limit: int = 100,
     category: Optional[str] = None,
     search: Optional[str] = None,
+    include_pricing: bool = False,
+    pricing_limit: int = Query(20, ge=1, le=500),
     current_user: User = Depends(get_current_active_user),
     db = Depends(get_database)
 ):
@@ -54,35 +96,63 @@ async def get_vendors(
             {"specialties": {"$regex": search, "$options": "i"}}
         ]
     
-    cursor = db.vendors.find(query).skip(skip).limit(limit)
+    # Legacy embedded pricing is only loaded when it may need migrating
+    projection = {"pricing_layout": 0} if include_pricing else VENDOR_LIST_PROJECTION
+    cursor = db.vendors.find(query, projection).skip(skip).limit(limit)
     vendors = await cursor.to_list(length=limit)
     
-    return [
-        VendorResponse(
-            id=str(vendor["_id"]),
-            **{k: v for k, v in vendor.items() if k != "_id"}
-        )
+    pricing_service = VendorPricingService(db)
+    if not include_pricing:
+        return await asyncio.gather(*[vendor_response(pricing_service, vendor, False) for vendor in vendors])
+    
+    # Legacy embedded pricing is moved first so the batched read below sees it
+    await asyncio.gather(*[pricing_service.migrate_embedded_pricing(vendor) for vendor in vendors])
+    pages = await pricing_service.get_pricing_pages([vendor["_id"] for vendor in vendors], pricing_limit)
+    return await asyncio.gather(*[
+        vendor_response(pricing_service, vendor, pricing_page=pages[vendor["_id"]])
         for vendor in vendors
-    ]
+    ])
 
 @router.get("/{vendor_id}", response_model=VendorResponse)
 async def get_vendor(
     vendor_id: str,
+    include_pricing: bool = True,
+    pricing_skip: int = Query(0, ge=0),
+    pricing_limit: int = Query(100, ge=1, le=1000),
     current_user: User = Depends(get_current_active_user),
     db = Depends(get_database)
 ):
     if not ObjectId.is_valid(vendor_id):
         raise HTTPException(status_code=400, detail="Invalid vendor ID")
     
-    vendor = await db.vendors.find_one({"_id": ObjectId(vendor_id)})
+    vendor = await db.vendors.find_one({"_id": ObjectId(vendor_id)}, {"pricing_layout": 0})
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
     
-    return VendorResponse(
-        id=str(vendor["_id"]),
-        **{k: v for k, v in vendor.items() if k != "_id"}
+    return await vendor_response(
+        VendorPricingService(db), vendor, include_pricing, pricing_skip, pricing_limit
     )
 
+@router.get("/{vendor_id}/pricing", response_model=List[PricingInfo])
+async def get_vendor_pricing(
+    vendor_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Page through a vendor's price list"""
+    if not ObjectId.is_valid(vendor_id):
+        raise HTTPException(status_code=400, detail="Invalid vendor ID")
+    
+    vendor = await db.vendors.find_one({"_id": ObjectId(vendor_id)}, {"pricing": 1})
+    if not vendor:
+        raise HTTPException(status_code=404, detail="Vendor not found")
+    
+    pricing_service = VendorPricingService(db)
+    await pricing_service.migrate_embedded_pricing(vendor)
+    return await pricing_service.get_pricing(vendor["_id"], skip, limit)
+
 @router.put("/{vendor_id}", response_model=VendorResponse)
 async def update_vendor(
     vendor_id: str,
@@ -93,11 +163,15 @@ async def update_vendor(
     if not ObjectId.is_valid(vendor_id):
         raise HTTPException(status_code=400, detail="Invalid vendor ID")
     
-    existing_vendor = await db.vendors.find_one({"_id": ObjectId(vendor_id)})
+    existing_vendor = await db.vendors.find_one({"_id": ObjectId(vendor_id)}, {"pricing": 1})
     if not existing_vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
     
+    pricing_service = VendorPricingService(db)
+    await pricing_service.migrate_embedded_pricing(existing_vendor)
+    
     update_data = {k: v for k, v in vendor_update.dict().items() if v is not None}
+    pricing = update_data.pop("pricing", None)
     update_data["updated_at"] = datetime.utcnow()
     
     await db.vendors.update_one(
@@ -105,11 +179,11 @@ async def update_vendor(
         {"$set": update_data}
     )
     
-    updated_vendor = await db.vendors.find_one({"_id": ObjectId(vendor_id)})
-    return VendorResponse(
-        id=str(updated_vendor["_id"]),
-        **{k: v for k, v in updated_vendor.items() if k != "_id"}
-    )
+    if pricing is not None:
+        await pricing_service.replace_pricing(ObjectId(vendor_id), pricing)
+    
+    updated_vendor = await db.vendors.find_one({"_id": ObjectId(vendor_id)}, {"pricing_layout": 0})
+    return await vendor_response(pricing_service, updated_vendor)
 
 @router.delete("/{vendor_id}")
 async def delete_vendor(
@@ -134,9 +208,16 @@ async def delete_vendor(
 async def upload_vendor_pricing(
     vendor_id: str,
     file: UploadFile = File(...),
+    mode: str = Query("auto", regex="^(auto|table|text)$"),
     current_user: User = Depends(get_current_active_user),
     db = Depends(get_database)
 ):
+    """Extract pricing from a vendor PDF
+
+    mode=table parses tabular price sheets by column position (reusing the layout
+    cached on the vendor), mode=text scans free text lines, and mode=auto tries the
+    table parser first and falls back to free text.
+    """
     if not ObjectId.is_valid(vendor_id):
         raise HTTPException(status_code=400, detail="Invalid vendor ID")
     
@@ -150,20 +231,35 @@ async def upload_vendor_pricing(
     try:
         # Parse PDF for pricing information
         pdf_parser = PDFParser()
-        content = await file.read()
-        pricing_data = await pdf_parser.extract_pricing_from_pdf(content)
+        pricing_data = []
+        layout = None
+        async with spool_upload(file) as upload:
+            if mode in ("auto", "table"):
+                cached_layout = PriceTableLayout(**vendor["pricing_layout"]) if vendor.get("pricing_layout") else None
+                pricing_data, layout = await pdf_parser.extract_pricing_table(upload.path, cached_layout)
+            
+            if not pricing_data and mode != "table":
+                pricing_data = await pdf_parser.extract_pricing_from_pdf(upload.path)
         
-        # Update vendor with extracted pricing
-        await db.vendors.update_one(
-            {"_id": ObjectId(vendor_id)},
-            {
-                "$push": {"pricing": {"$each": pricing_data}},
-                "$set": {"updated_at": datetime.utcnow()}
-            }
-        )
+        # Merge extracted pricing into vendor_prices, writing only new or changed items
+        pricing_service = VendorPricingService(db)
+        await pricing_service.migrate_embedded_pricing(vendor)
+        merge_counts = await pricing_service.merge_pricing(vendor["_id"], pricing_data)
+        
+        update_fields = {"updated_at": datetime.utcnow()}
+        if layout is not None:
+            update_fields["pricing_layout"] = layout.dict()
+        await db.vendors.update_one({"_id": ObjectId(vendor_id)}, {"$set": update_fields})
         
-        return {"message": f"Successfully extracted {len(pricing_data)} pricing items", "items": pricing_data}
+        return {
+            "message": f"Successfully extracted {len(pricing_data)} pricing items",
+            "mode": "table" if layout is not None and pricing_data else "text",
+            "merge": merge_counts,
+            "items": pricing_data
+        }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing PDF: {e}")
         raise HTTPException(status_code=500, detail="Error processing PDF file")
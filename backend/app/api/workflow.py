@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, BackgroundTasks
+from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 from bson import ObjectId
+import asyncio
 import logging
+import time
 
 from ..database import get_database
 from ..services.email_service import EmailService
+from ..services.settings_cache import settings_cache
 from ..models.user import User
 from .auth import get_current_active_user
 
@@ -128,8 +131,8 @@ class WorkflowEngine:
     async def _assign_lead_to_rep(self, lead_id: str, lead_data: Dict[str, Any]):
         """Assign lead to sales rep based on routing rules"""
         # Get routing rules from settings
-        settings = await self.db.settings.find_one({})
-        routing_rules = settings.get("lead_routing", {}).get("routing_rules", {}) if settings else {}
+        settings = await settings_cache.get(self.db)
+        routing_rules = settings.get("lead_routing", {}).get("routing_rules", {})
         
         assigned_rep = None
         
@@ -388,17 +391,47 @@ async def process_scheduled_tasks(
     
     return {"success": True, "message": "Scheduled tasks processing started"}
 
+def created_at_filter(start_date: Optional[datetime], end_date: Optional[datetime]) -> Dict[str, Any]:
+    """$match stage body for an optional created_at range (served by the created_at indexes)"""
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be before end_date")
+    date_range = {}
+    if start_date:
+        date_range["$gte"] = start_date
+    if end_date:
+        date_range["$lte"] = end_date
+    return {"created_at": date_range} if date_range else {}
+
+async def count_by_status(collection, match: Dict[str, Any]) -> Dict[str, int]:
+    """Count a collection's documents per status in one pass"""
+    rows = await collection.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]).to_list(length=None)
+    return {row["_id"]: row["count"] for row in rows if row["_id"] is not None}
+
 @router.get("/workflow-stats")
 async def get_workflow_stats(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
     db=Depends(get_database),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get workflow automation statistics"""
-    stats = {
-        "pending_tasks": await db.tasks.count_documents({"status": "pending"}),
-        "scheduled_emails": await db.scheduled_emails.count_documents({"status": "scheduled"}),
-        "completed_workflows": await db.tasks.count_documents({"status": "completed"}),
-        "failed_emails": await db.scheduled_emails.count_documents({"status": "failed"})
-    }
+    """Get workflow automation statistics, optionally limited to a created_at range"""
+    started = time.perf_counter()
+    match = created_at_filter(start_date, end_date)
+    tasks, emails = await asyncio.gather(
+        count_by_status(db.tasks, match),
+        count_by_status(db.scheduled_emails, match)
+    )
     
-    return stats
+    return {
+        "pending_tasks": tasks.get("pending", 0),
+        "scheduled_emails": emails.get("scheduled", 0),
+        "completed_workflows": tasks.get("completed", 0),
+        "failed_emails": emails.get("failed", 0),
+        "tasks_by_status": tasks,
+        "emails_by_status": emails,
+        "range": {"start_date": start_date, "end_date": end_date},
+        "query_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
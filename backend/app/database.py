@@ -1,4 +1,5 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
 from decouple import config
 import logging
 
@@ -23,6 +24,11 @@ class MockDatabase:
         self.contractors = MockCollection()
         self.vendors = MockCollection()
         self.payments = MockCollection()
+        self.ledger_sync = MockCollection()
+        self.metrics_rollups = MockCollection()
+        self.stripe_events = MockCollection()
+        self.dunning_runs = MockCollection()
+        self.counters = MockCollection()
 
 class MockCollection:
     """Mock collection that returns sample data for development"""
@@ -30,7 +36,7 @@ class MockCollection:
         self.data = []
         self.counter = 1
     
-    async def find_one(self, query=None):
+    async def find_one(self, query=None, projection=None):
         if query and "_id" in query:
             # First check if it's in our stored data
             for doc in self.data:
@@ -75,7 +81,7 @@ class MockCollection:
         # For other queries, return None to allow new records
         return None
     
-    def find(self, query=None):
+    def find(self, query=None, projection=None):
         # Return sample clients list plus any stored data as async iterator
         class AsyncIterator:
             def __init__(self, data):
@@ -106,6 +112,13 @@ class MockCollection:
             def limit(self, n):
                 self._limit_count = n
                 return self
+            
+            def sort(self, *args, **kwargs):
+                return self
+            
+            async def to_list(self, length=None):
+                results = [doc async for doc in self]
+                return results if length is None else results[:length]
         
         # Start with stored data
         data = list(self.data)
@@ -177,11 +190,31 @@ class MockCollection:
         self.data.append(document.copy())
         return type('MockResult', (), {'inserted_id': document["_id"]})()
     
-    async def update_one(self, query, update):
+    async def update_one(self, query, update, upsert=False):
         return type('MockResult', (), {'modified_count': 1})()
     
+    async def update_many(self, query, update):
+        return type('MockResult', (), {'modified_count': 0})()
+    
     async def delete_one(self, query):
         return type('MockResult', (), {'deleted_count': 1})()
+    
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, **kwargs):
+        # Only counter upserts are emulated; conditional claims never match in mock mode
+        if not upsert or "$inc" not in update:
+            return None
+        document = next((doc for doc in self.data if doc.get("_id") == query.get("_id")), None)
+        if document is None:
+            document = {"_id": query.get("_id")}
+            self.data.append(document)
+        for field, amount in update["$inc"].items():
+            document[field] = document.get(field, 0) + amount
+        return document
+    
+    async def find_one_and_delete(self, query, projection=None):
+        document = await self.find_one(query, projection)
+        self.data = [doc for doc in self.data if doc is not document]
+        return document
 
 async def get_database():
     """Get database connection or mock database for development"""
@@ -192,23 +225,117 @@ async def get_database():
     logger.info("Using mock database for development")
     return MockDatabase()
 
+# How long startup waits for a MongoDB server before falling back to the mock database
+MONGODB_CONNECT_TIMEOUT_MS = int(config("MONGODB_CONNECT_TIMEOUT_MS", default=5000))
+
 async def connect_to_mongo():
     """Create database connection"""
     try:
         # Try DATABASE_URL first (MongoDB Atlas), fallback to MONGODB_URL (local)
         mongo_url = config("DATABASE_URL", default=config("MONGODB_URL", default="mongodb://localhost:27017"))
-        db.client = AsyncIOMotorClient(mongo_url)
+        db.client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS)
         db.database = db.client[config("DATABASE_NAME")]
         
         # Test the connection
         await db.client.admin.command('ping')
         logger.info(f"Successfully connected to MongoDB at {mongo_url}")
+        
+        await ensure_indexes(db.database)
     except Exception as e:
         logger.warning(f"MongoDB connection failed: {e}. Using mock database for development.")
+        if db.client:
+            db.client.close()
+        db.client = None
         db.database = None
 
+async def _create_index(database, collection: str, keys, **options) -> bool:
+    try:
+        await database[collection].create_index(keys, **options)
+        return True
+    except Exception as e:
+        # e.g. the same keys already indexed under another name, or duplicate values
+        logger.error(f"Could not create index {options.get('name')} on {collection}: {e}")
+        return False
+
+async def _create_unique_number_index(database, collection: str, field: str, name: str) -> bool:
+    """Unique index on a document number, refused with a clear error when legacy data has duplicates"""
+    only_numbers = {field: {"$type": "string"}}
+    duplicates = await database[collection].aggregate([
+        {"$match": only_numbers},
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": 10}
+    ]).to_list(length=10)
+    if duplicates:
+        logger.error(
+            f"Not creating {name}: {collection} has duplicate {field} values "
+            f"({', '.join(str(d['_id']) for d in duplicates)}); renumber them and restart"
+        )
+        return False
+    return await _create_index(database, collection, field, unique=True, partialFilterExpression=only_numbers, name=name)
+
+async def ensure_indexes(database):
+    """Create the indexes hot queries rely on (no-op when they already exist)
+
+    Each index is attempted on its own, so one that cannot be built is logged
+    and the rest are still created.
+    """
+    created = [
+        await _create_index(
+            database, "vendor_prices", [("vendor_id", ASCENDING), ("item_key", ASCENDING)],
+            unique=True, name="vendor_item_unique"
+        ),
+        await _create_index(
+            database, "appointments", [("start_time", ASCENDING), ("end_time", ASCENDING)],
+            name="appointment_time_range"
+        ),
+        await _create_index(
+            database, "appointments", [("contractor_id", ASCENDING), ("start_time", ASCENDING), ("end_time", ASCENDING)],
+            name="contractor_schedule"
+        ),
+    ]
+    for collection in ("clients", "tasks", "scheduled_emails"):
+        created.append(await _create_index(database, collection, "created_at", name="created_at"))
+    created += [
+        # stripe_events uses the Stripe event id as _id, which dedupes deliveries
+        await _create_index(
+            database, "stripe_events", [("contract_id", ASCENDING), ("status", ASCENDING), ("created", ASCENDING)],
+            name="stripe_event_partition"
+        ),
+        await _create_index(database, "stripe_events", [("status", ASCENDING), ("created", ASCENDING)], name="stripe_event_status"),
+        await _create_index(
+            database, "payments", [("contract_id", ASCENDING), ("object", ASCENDING), ("created", ASCENDING)],
+            name="payments_by_contract"
+        ),
+        await _create_index(database, "payments", [("object", ASCENDING), ("created", ASCENDING)], name="payments_by_date"),
+        # Equality on payment_status, then _id for the dunning cursor's sort, then its filters
+        await _create_index(
+            database, "contracts",
+            [("payment_status", ASCENDING), ("_id", ASCENDING), ("balance_due", ASCENDING), ("status", ASCENDING)],
+            name="dunning_scan"
+        ),
+        await _create_index(
+            database, "dunning_runs", "status",
+            unique=True, partialFilterExpression={"status": "running"}, name="one_running_dunning_run"
+        ),
+        await _create_index(database, "dunning_runs", "started_at", name="dunning_runs_started"),
+        # Numbers come from the counters collection; these make a duplicate fail loudly
+        await _create_unique_number_index(database, "estimates", "estimate_number", "estimate_number_unique"),
+        await _create_unique_number_index(database, "contracts", "contract_number", "contract_number_unique"),
+        await _create_index(database, "refresh_sessions", "token_hash", unique=True, name="refresh_token_hash_unique"),
+        await _create_index(database, "refresh_sessions", "family_id", name="refresh_family"),
+        await _create_index(database, "refresh_sessions", "user_id", name="refresh_user"),
+        await _create_index(database, "refresh_sessions", "expires_at", expireAfterSeconds=0, name="refresh_expiry_ttl"),
+    ]
+    if all(created):
+        logger.info("Database indexes ensured")
+    else:
+        logger.error(f"{created.count(False)} database indexes could not be created; see errors above")
+
 async def close_mongo_connection():
     """Close database connection"""
     if db.client:
         db.client.close()
+        db.client = None
+        db.database = None
         logger.info("MongoDB connection closed")
@@ -1,15 +1,27 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
-from starlette.middleware.base import BaseHTTPMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 import os
 from pathlib import Path
 
-from .api import auth, vendors, estimates, contracts, payments, pdf_upload, clients, contractors, appointments, services, marketing, settings, lead_capture, workflow, ai_assistant
+from .services.pdf_parser import shutdown_process_pool
+from .services.password_hashing import shutdown_hash_pool
+from .services.stripe_service import shutdown_stripe_pool
+from .services.sms_service import close_sms_transport
+from .services.metrics import run_nightly_rebuild
+from .services.reminders import reminder_scheduler
+from .services.stripe_events import stripe_event_processor
+from .services.payment_ledger import run_reconciliation
+from .services.dunning import dunning_engine
+from .database import get_database, connect_to_mongo, close_mongo_connection
+from .responses import ORJSONResponse
+from .middleware import ConditionalGetMiddleware, CompressionMiddleware, RedirectCORSMiddleware, RequestContextMiddleware, TrustedProxyMiddleware
+from .api import auth, vendors, estimates, contracts, payments, pdf_upload, clients, contractors, appointments, services, marketing, settings, lead_capture, workflow, ai_assistant, metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,15 +31,33 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up...")
-    # Skip MongoDB for now - using mock data
+    # Falls back to the mock database when no MongoDB server answers
+    await connect_to_mongo()
+    metrics_rebuild = asyncio.create_task(run_nightly_rebuild(get_database))
+    reminders = asyncio.create_task(reminder_scheduler.run(get_database))
+    await stripe_event_processor.start(get_database)
+    reconciliation = asyncio.create_task(run_reconciliation(get_database))
+    dunning = asyncio.create_task(dunning_engine.run(get_database))
     yield
     # Shutdown
     logger.info("Shutting down...")
+    metrics_rebuild.cancel()
+    reminders.cancel()
+    await stripe_event_processor.stop()
+    reconciliation.cancel()
+    dunning.cancel()
+    await dunning_engine.stop()
+    shutdown_process_pool()
+    shutdown_hash_pool()
+    shutdown_stripe_pool()
+    await close_sms_transport()
+    await close_mongo_connection()
 
 app = FastAPI(
     title="CRM & Estimating API",
     description="A comprehensive CRM and estimating application with vendor management",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -46,6 +76,19 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         content={"detail": exc.detail},
     )
 
+# ETags / 304s for JSON reads, with a short server-side cache for rarely changing resources
+app.add_middleware(
+    ConditionalGetMiddleware,
+    cached_routes={
+        "/api/leads/public/lead-form": 300,
+        "/api/vendors/categories/list": 60,
+        "/api/marketing/platforms": 60,
+    },
+)
+
+# Compress large list responses (hashing for ETags above happens on the uncompressed body)
+app.add_middleware(CompressionMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -61,22 +104,14 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-# Add a middleware to handle redirects properly for CORS
-class CORSRedirectMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        
-        # If it's a redirect response, add CORS headers
-        if isinstance(response, RedirectResponse):
-            response.headers["Access-Control-Allow-Origin"] = "*"
-            response.headers["Access-Control-Allow-Credentials"] = "true"
-            response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-            response.headers["Access-Control-Allow-Headers"] = "*"
-            response.headers["Access-Control-Expose-Headers"] = "*"
-        
-        return response
-
-app.add_middleware(CORSRedirectMiddleware)
+# CORS headers on trailing-slash and other redirects
+app.add_middleware(RedirectCORSMiddleware)
+
+# Outer: request IDs and timing cover the whole stack
+app.add_middleware(RequestContextMiddleware)
+
+# Outermost: everything below sees the real client address
+app.add_middleware(TrustedProxyMiddleware)
 
 # Mount static files if directory exists
 static_dir = Path(__file__).parent.parent / "static"
@@ -99,6 +134,7 @@ app.include_router(payments.router, prefix="/api/payments", tags=["Payments"])
 app.include_router(pdf_upload.router, prefix="/api/upload", tags=["File Upload"])
 app.include_router(marketing.router, prefix="/api/marketing", tags=["Marketing"])
 app.include_router(settings.router, prefix="/api/settings", tags=["Settings"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["Metrics"])
 
 @app.get("/")
 async def root():
@@ -0,0 +1,322 @@
+import hashlib
+import ipaddress
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from decouple import config
+import logging
+
+from .services.auth_cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is used when brotli is not installed
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_MAX_ENTRIES = int(config("RESPONSE_CACHE_MAX_ENTRIES", default=2000))
+SLOW_REQUEST_MS = float(config("SLOW_REQUEST_MS", default=1000))
+COMPRESSION_MIN_SIZE = int(config("COMPRESSION_MIN_SIZE", default=1024))
+COMPRESSION_LEVEL = int(config("COMPRESSION_LEVEL", default=6))
+# Peers whose X-Forwarded-For is believed (the load balancer's network)
+TRUSTED_PROXY_NETWORKS = config("TRUSTED_PROXY_NETWORKS", default="127.0.0.1/32,::1/128")
+
+REDIRECT_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Credentials": "true",
+    "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Expose-Headers": "*",
+}
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def content_etag(body: bytes) -> str:
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+def _resource_prefix(path: str) -> str:
+    """/api/vendors/123/pricing -> /api/vendors, the unit writes invalidate"""
+    return "/".join(path.split("/")[:3])
+
+class ConditionalGetMiddleware:
+    """ETag / If-None-Match handling for JSON GET responses, plus a per-route TTL cache
+
+    Every 200 JSON response to a GET gets a weak ETag (the handler's own, or a
+    hash of the body) and a Cache-Control header, and is turned into a 304
+    when the client already holds that version. Paths listed in cached_routes
+    are additionally served from memory for the given number of seconds, keyed
+    by query string and Authorization header; any successful write under the
+    same /api/<resource> prefix drops them.
+    """
+
+    def __init__(self, app: ASGIApp, cached_routes: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.cached_routes = cached_routes or {}
+        max_ttl = max(self.cached_routes.values(), default=0)
+        self.cache = TTLCache(RESPONSE_CACHE_MAX_ENTRIES, max_ttl)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] != "GET":
+            await self._forward_write(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        ttl = self.cached_routes.get(scope["path"])
+        authorization = request_headers.get("authorization")
+        cache_key = (scope["path"], scope["query_string"], authorization)
+
+        if ttl:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                status, headers, body = cached
+                await self._respond(send, request_headers, status, list(headers), body)
+                return
+
+        start_message: Optional[Message] = None
+        chunks: List[bytes] = []
+        buffering = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, buffering
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                buffering = message["status"] == 200 and headers.get("content-type", "").startswith("application/json")
+                if buffering:
+                    start_message = message
+                else:
+                    await send(message)
+                return
+
+            if not buffering:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=list(start_message["headers"]))
+            if "etag" not in headers:
+                headers["ETag"] = content_etag(body)
+            if "cache-control" not in headers:
+                if ttl:
+                    visibility = "private" if authorization else "public"
+                    headers["Cache-Control"] = f"{visibility}, max-age={ttl}"
+                else:
+                    headers["Cache-Control"] = "private, no-cache"
+
+            if ttl:
+                self.cache.set(cache_key, (start_message["status"], tuple(headers.raw), body), ttl)
+            await self._respond(send, request_headers, start_message["status"], headers.raw, body)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _respond(self, send: Send, request_headers: Headers, status: int,
+                       raw_headers: List[Tuple[bytes, bytes]], body: bytes):
+        headers = MutableHeaders(raw=raw_headers)
+        if etag_matches(request_headers.get("if-none-match"), headers["etag"]):
+            not_modified = [(k, v) for k, v in raw_headers if k in (b"etag", b"cache-control", b"vary")]
+            await send({"type": "http.response.start", "status": 304, "headers": not_modified})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _forward_write(self, scope: Scope, receive: Receive, send: Send):
+        """Pass a non-GET request through and invalidate cached reads of the resource it changed"""
+        if not self.cached_routes:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                prefix = _resource_prefix(scope["path"])
+                self.cache.pop_where(lambda key: key[0].startswith(prefix))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+# Not 304: conditional GET responses must keep CORSMiddleware's headers
+REDIRECT_STATUSES = frozenset((301, 302, 303, 307, 308))
+
+class RedirectCORSMiddleware:
+    """Add permissive CORS headers to redirects (e.g. FastAPI's trailing-slash 307s)"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and message["status"] in REDIRECT_STATUSES:
+                headers = MutableHeaders(scope=message)
+                for key, value in REDIRECT_CORS_HEADERS.items():
+                    headers[key] = value
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+class TrustedProxyMiddleware:
+    """Take the client address from X-Forwarded-For, but only as far as trusted proxies vouch for it
+
+    When the connecting peer is in one of the trusted networks, the header is
+    read from the right, skipping addresses that are themselves trusted
+    proxies; the first other address is the one our proxy saw connect, and
+    everything to its left is whatever the client chose to send. (uvicorn's
+    --forwarded-allow-ips takes no network ranges and, with '*', trusts the
+    leftmost, client-supplied entry.)
+    """
+
+    def __init__(self, app: ASGIApp, trusted_networks: str = TRUSTED_PROXY_NETWORKS):
+        self.app = app
+        self.networks = [ipaddress.ip_network(item.strip()) for item in trusted_networks.split(",") if item.strip()]
+
+    def trusted(self, host: Optional[str]) -> bool:
+        try:
+            address = ipaddress.ip_address(host)
+        except (TypeError, ValueError):
+            return False
+        return any(address in network for network in self.networks)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] in ("http", "websocket"):
+            client = scope.get("client")
+            if client and self.trusted(client[0]):
+                headers = Headers(scope=scope)
+                forwarded_for = headers.get("x-forwarded-for")
+                if forwarded_for:
+                    hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+                    for hop in reversed(hops):
+                        if not self.trusted(hop):
+                            scope["client"] = (hop, 0)
+                            break
+                proto = headers.get("x-forwarded-proto")
+                if proto:
+                    scope["scheme"] = proto.split(",")[-1].strip()
+        await self.app(scope, receive, send)
+
+class RequestContextMiddleware:
+    """Assign each request an ID and time it
+
+    The ID comes from an incoming X-Request-ID header or is generated, is
+    stored in request.state.request_id and echoed back. The handler time is
+    reported in a Server-Timing header and requests slower than
+    SLOW_REQUEST_MS are logged.
+    """
+
+    def __init__(self, app: ASGIApp, slow_request_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get("x-request-id") or uuid.uuid4().hex
+        scope.setdefault("state", {})["request_id"] = request_id
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1")),
+                    (b"server-timing", f"app;dur={elapsed_ms:.1f}".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms >= self.slow_request_ms:
+                logger.warning(
+                    f"Slow request {request_id}: {scope['method']} {scope['path']} -> {status_code} in {elapsed_ms:.0f} ms"
+                )
+
+class BrotliResponder:
+    """Brotli-compress single-chunk responses of compressible types (streams pass through)"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        start_message: Optional[Message] = None
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if start_message is None:
+                await send(message)
+                return
+
+            initial, start_message = start_message, None
+            headers = MutableHeaders(raw=initial["headers"])
+            body = message.get("body", b"")
+            compressible = (
+                "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                and not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+            )
+            if compressible:
+                body = brotli.compress(body, quality=min(COMPRESSION_LEVEL, 11))
+                headers["Content-Encoding"] = "br"
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = {**message, "body": body}
+            await send(initial)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+class CompressionMiddleware:
+    """Brotli when the client accepts it and brotli is installed, otherwise gzip"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+            if brotli is not None and "br" in accept_encoding:
+                await BrotliResponder(self.app, self.minimum_size)(scope, receive, send)
+                return
+            if "gzip" in accept_encoding:
+                await GZipResponder(self.app, self.minimum_size, compresslevel=COMPRESSION_LEVEL)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -25,6 +25,39 @@ class PricingInfo(BaseModel):
     min_quantity: Optional[int] = 1
     max_quantity: Optional[int] = None
     description: Optional[str] = None
+    confidence: Optional[float] = None  # Extraction confidence for prices parsed from vendor PDFs
+
+class PriceTableColumn(BaseModel):
+    key: str  # PriceTableRow field the column maps to
+    header: str
+    x: float  # left edge of the column header on the page
+
+class PriceTableLayout(BaseModel):
+    """Column layout of a vendor's tabular price sheet, cached per vendor"""
+    columns: List[PriceTableColumn]
+    detected_at: datetime = Field(default_factory=datetime.utcnow)
+
+class PriceTableRow(BaseModel):
+    """One typed row of a vendor price sheet (same shape as our price list CSV)"""
+    color: str
+    vendor_name: Optional[str] = None
+    thickness: Optional[str] = None
+    material: Optional[str] = None
+    size: Optional[str] = None
+    price: float
+    cost: Optional[float] = None
+
+    def to_pricing_info(self) -> PricingInfo:
+        item_name = " ".join(part for part in [self.color, self.thickness, self.material, self.size] if part)
+        description = " - ".join(part for part in [self.material, self.color, self.thickness, self.size] if part)
+        return PricingInfo(
+            item_name=item_name,
+            category=self.material.lower() if self.material else "materials",
+            unit="sq ft",
+            price=self.price,
+            description=description,
+            confidence=1.0
+        )
 
 class Vendor(BaseModel):
     id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
@@ -35,6 +68,7 @@ class Vendor(BaseModel):
     contact_info: ContactInfo = ContactInfo()
     address: Address = Address()
     pricing: List[PricingInfo] = []
+    pricing_layout: Optional[PriceTableLayout] = None
     rating: Optional[float] = None
     notes: Optional[str] = None
     documents: List[str] = []  # Cloudinary URLs
@@ -80,6 +114,7 @@ class VendorResponse(BaseModel):
     contact_info: ContactInfo
     address: Address
     pricing: List[PricingInfo] = []
+    pricing_count: Optional[int] = None
     rating: Optional[float] = None
     notes: Optional[str] = None
     documents: List[str] = []
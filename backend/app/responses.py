@@ -0,0 +1,104 @@
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Optional, Type
+import orjson
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON
+from starlette.responses import JSONResponse
+
+def _default(value: Any) -> Any:
+    """Types orjson does not handle natively"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.dict()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson; ObjectIds become strings"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+# Scalar field types a stored value is converted to, as pydantic would
+COERCED_TYPES = (str, int, float)
+
+def _coerce(value: Any, target: type) -> Any:
+    """value as target when it is a number or numeric string pydantic would accept; otherwise unchanged"""
+    if value is None or type(value) is target or not isinstance(value, (str, int, float, Decimal)):
+        return value
+    try:
+        if target is str:
+            return value if isinstance(value, bool) else str(value)
+        if target is float:
+            return float(value)
+        number = float(value)
+        return int(number) if number.is_integer() else value
+    except (TypeError, ValueError):
+        return value
+
+class DocumentSerializer:
+    """Turn Mongo documents into response dicts shaped like a response model, without validating them
+
+    The field list and defaults come from the response model, and the same
+    list drives a Mongo projection so unused fields never leave the database.
+    List endpoints return ORJSONResponse(serializer.many(docs)) directly, which
+    skips FastAPI's per-item re-validation and jsonable_encoder pass; the
+    response_model on the route still documents the shape. Fields declared as
+    str, int or float are still converted the way pydantic would (a budget
+    stored as 50000 comes out as "50000" on a str field); other values are
+    passed through as stored.
+    """
+
+    def __init__(self, model: Type[BaseModel], defaults: Optional[Dict[str, Any]] = None):
+        self.model = model
+        self.fields: Dict[str, Any] = {
+            name: field.default for name, field in model.__fields__.items() if name != "id"
+        }
+        self.fields.update(defaults or {})
+        self.projection: Dict[str, int] = {name: 1 for name in self.fields}
+        self.coerced: Dict[str, type] = {
+            name: field.type_ for name, field in model.__fields__.items()
+            if name in self.fields and field.shape == SHAPE_SINGLETON and field.type_ in COERCED_TYPES
+        }
+
+    def __call__(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        result = {"id": str(document["_id"])}
+        for name, default in self.fields.items():
+            result[name] = document.get(name, default)
+        for name, target in self.coerced.items():
+            value = result[name]
+            if value is not None and type(value) is not target:
+                result[name] = _coerce(value, target)
+        return result
+
+    def many(self, documents: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [self(document) for document in documents]
+
+    def select(self, fields: str) -> "DocumentSerializer":
+        """Serializer for a comma-separated subset of fields ("*" keeps them all; id is always included)"""
+        if fields.strip() == "*":
+            return self
+        names = [name.strip() for name in fields.split(",") if name.strip() and name.strip() != "id"]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown field(s): {', '.join(unknown)}"
+            )
+        subset = DocumentSerializer.__new__(DocumentSerializer)
+        subset.model = self.model
+        subset.fields = {name: self.fields[name] for name in names}
+        subset.projection = {name: 1 for name in subset.fields}
+        subset.coerced = {name: target for name, target in self.coerced.items() if name in subset.fields}
+        return subset
@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from decouple import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+AUTH_CACHE_TTL_SECONDS = float(config("AUTH_CACHE_TTL_SECONDS", default=60))
+AUTH_CACHE_MAX_ENTRIES = int(config("AUTH_CACHE_MAX_ENTRIES", default=10000))
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after a time-to-live"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def pop_where(self, predicate) -> int:
+        """Drop every entry whose key matches predicate"""
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class PrincipalCache:
+    """Per-process cache of decoded JWTs and the users they authenticate
+
+    Decoded payloads are keyed by the raw token string and never outlive the
+    token's exp claim. Users are keyed by (sub, token version), so bumping a
+    user's token_version revokes cached principals on every instance within
+    AUTH_CACHE_TTL_SECONDS even though each process keeps its own cache.
+    """
+
+    def __init__(self, max_entries: int = AUTH_CACHE_MAX_ENTRIES, ttl: float = AUTH_CACHE_TTL_SECONDS):
+        self.tokens = TTLCache(max_entries, ttl)
+        self.principals = TTLCache(max_entries, ttl)
+        # username -> lowest token version still accepted; only needs to outlive access tokens
+        self.revocations = TTLCache(max_entries, float("inf"))
+
+    def get_payload(self, token: str) -> Optional[Dict[str, Any]]:
+        return self.tokens.get(token)
+
+    def set_payload(self, token: str, payload: Dict[str, Any]):
+        exp = payload.get("exp")
+        ttl = exp - time.time() if isinstance(exp, (int, float)) else None
+        self.tokens.set(token, payload, ttl)
+
+    def get_user(self, username: str, token_version: int):
+        return self.principals.get((username, token_version))
+
+    def set_user(self, username: str, token_version: int, user):
+        self.principals.set((username, token_version), user)
+
+    def revoke_versions_below(self, username: str, token_version: int, ttl: float):
+        """Reject this user's claim-only access tokens older than token_version on this instance"""
+        self.revocations.set(username, token_version, ttl)
+
+    def is_revoked(self, username: str, token_version: int) -> bool:
+        min_version = self.revocations.get(username)
+        return min_version is not None and token_version < min_version
+
+    def invalidate_user(self, username: str):
+        removed = self.principals.pop_where(lambda key: key[0] == username)
+        if removed:
+            logger.info(f"Invalidated {removed} cached principal(s) for {username}")
+
+    def clear(self):
+        self.tokens.clear()
+        self.principals.clear()
+        self.revocations.clear()
+
+principal_cache = PrincipalCache()
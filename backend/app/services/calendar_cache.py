@@ -0,0 +1,93 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from decouple import config
+import logging
+
+from .auth_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Bounds how long another worker's appointment writes can go unseen
+CALENDAR_CACHE_SECONDS = float(config("CALENDAR_CACHE_SECONDS", default=60))
+CALENDAR_CACHE_MONTHS = int(config("CALENDAR_CACHE_MONTHS", default=36))
+
+Month = Tuple[int, int]
+
+def month_start(month: Month) -> datetime:
+    return datetime(month[0], month[1], 1)
+
+def next_month(month: Month) -> Month:
+    return (month[0] + 1, 1) if month[1] == 12 else (month[0], month[1] + 1)
+
+def months_between(start: datetime, end: datetime) -> List[Month]:
+    """Months overlapping [start, end)"""
+    months = []
+    month = (start.year, start.month)
+    while month_start(month) < end:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+def overlaps(document: Dict[str, Any], start: datetime, end: datetime) -> bool:
+    return document["start_time"] < end and document["end_time"] > start
+
+class CalendarCache:
+    """Appointments bucketed by calendar month, for month and week views
+
+    A bucket holds every appointment overlapping its month, so multi-day jobs
+    that started earlier are included. Missing buckets for a request are filled
+    by one overlap query over their combined span (served by the
+    (start_time, end_time) index). Appointment writes drop the buckets their
+    old and new times touch; a generation counter keeps a query that raced
+    with a write from caching what it read.
+    """
+
+    def __init__(self, max_months: int = CALENDAR_CACHE_MONTHS, ttl: float = CALENDAR_CACHE_SECONDS):
+        self.buckets = TTLCache(max_months, ttl)
+        self.generation = 0
+
+    async def get_range(self, db, start: datetime, end: datetime,
+                        projection: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        """Appointments overlapping [start, end), ordered by start_time"""
+        months = months_between(start, end)
+        cached = {month: self.buckets.get(month) for month in months}
+        missing = [month for month, bucket in cached.items() if bucket is None]
+        if missing:
+            generation = self.generation
+            span_start, span_end = month_start(missing[0]), month_start(next_month(missing[-1]))
+            cursor = db.appointments.find(
+                {"start_time": {"$lt": span_end}, "end_time": {"$gt": span_start}},
+                {**(projection or {}), "start_time": 1, "end_time": 1}
+            ).sort("start_time", 1)
+            documents = await cursor.to_list(length=None)
+            for month in missing:
+                bucket = [doc for doc in documents if overlaps(doc, month_start(month), month_start(next_month(month)))]
+                cached[month] = bucket
+                if generation == self.generation:
+                    self.buckets.set(month, bucket)
+
+        seen = set()
+        appointments = []
+        for month in months:
+            for document in cached[month]:
+                if document["_id"] not in seen and overlaps(document, start, end):
+                    seen.add(document["_id"])
+                    appointments.append(document)
+        appointments.sort(key=lambda document: document["start_time"])
+        return appointments
+
+    def invalidate(self, *appointments: Optional[Dict[str, Any]]):
+        """Drop the months touched by each appointment's time range"""
+        self.generation += 1
+        for appointment in appointments:
+            start, end = (appointment or {}).get("start_time"), (appointment or {}).get("end_time")
+            if not isinstance(start, datetime) or not isinstance(end, datetime):
+                continue
+            for month in months_between(start, max(end, start)) or [(start.year, start.month)]:
+                self.buckets.pop(month)
+
+    def clear(self):
+        self.generation += 1
+        self.buckets.clear()
+
+calendar_cache = CalendarCache()
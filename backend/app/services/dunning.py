@@ -0,0 +1,408 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from decouple import config
+import logging
+
+from ..models.contract import ContractStatus, PaymentStatus
+from .email_service import EmailService
+from .sms_service import SMSService
+from .stripe_service import StripeService, idempotency_key
+
+logger = logging.getLogger(__name__)
+
+DUNNING_BATCH_SIZE = int(config("DUNNING_BATCH_SIZE", default=500))
+# Contracts worked on at once; Stripe and SMS calls are further bounded by
+# their own pools and pacing
+DUNNING_CONCURRENCY = int(config("DUNNING_CONCURRENCY", default=25))
+# Open SMTP connections at once; most relays throttle above a handful
+DUNNING_EMAIL_CONCURRENCY = int(config("DUNNING_EMAIL_CONCURRENCY", default=5))
+DUNNING_CREATE_INVOICES = config("DUNNING_CREATE_INVOICES", default=True, cast=bool)
+# Payment terms printed on the Stripe invoice
+DUNNING_INVOICE_DAYS_UNTIL_DUE = int(config("DUNNING_INVOICE_DAYS_UNTIL_DUE", default=7))
+# Start a run every DUNNING_INTERVAL_HOURS from the background loop (off by
+# default: runs then only start from the admin endpoint)
+DUNNING_AUTO_RUN = config("DUNNING_AUTO_RUN", default=False, cast=bool)
+DUNNING_INTERVAL_HOURS = float(config("DUNNING_INTERVAL_HOURS", default=24))
+DUNNING_CHECK_MINUTES = float(config("DUNNING_CHECK_MINUTES", default=15))
+# A running run whose heartbeat is older than this is assumed dead and resumed
+DUNNING_STALE_MINUTES = float(config("DUNNING_STALE_MINUTES", default=30))
+# How often a live run refreshes its heartbeat, independent of batch progress
+DUNNING_HEARTBEAT_SECONDS = float(config("DUNNING_HEARTBEAT_SECONDS", default=60))
+# Days after signing (or creation) a balance falls due when the contract has
+# neither payment_due_date nor completion_date
+DUNNING_TERMS_DAYS = int(config("DUNNING_TERMS_DAYS", default=30))
+
+def _parse_stages(value: str) -> List[Tuple[str, int]]:
+    stages = []
+    for item in value.split(","):
+        name, _, days = item.strip().partition(":")
+        stages.append((name, int(days)))
+    return sorted(stages, key=lambda stage: stage[1])
+
+# stage:days relative to the due date; stage names are EmailService reminder types
+DUNNING_STAGES = _parse_stages(config("DUNNING_STAGES", default="gentle:-3,urgent:7,final:30"))
+
+DUNNING_STATUSES = [PaymentStatus.PENDING.value, PaymentStatus.OVERDUE.value]
+DUNNING_CONTRACT_STATUSES = [ContractStatus.SIGNED.value, ContractStatus.COMPLETED.value]
+DUNNING_PROJECTION = {
+    "contract_number": 1, "client_name": 1, "client_email": 1, "client_phone": 1,
+    "balance_due": 1, "payment_status": 1, "status": 1, "payment_due_date": 1,
+    "completion_date": 1, "signed_at": 1, "created_at": 1, "stripe_customer_id": 1, "dunning": 1
+}
+RUN_COUNTERS = ("scanned", "due", "reminded", "invoiced", "emails", "sms", "skipped", "undelivered", "errors")
+
+def dunning_query() -> Dict[str, Any]:
+    """Contracts owing money; served by the dunning_scan index in _id order"""
+    return {
+        "payment_status": {"$in": DUNNING_STATUSES},
+        "balance_due": {"$gt": 0},
+        "status": {"$in": DUNNING_CONTRACT_STATUSES},
+    }
+
+def due_date(contract: Dict[str, Any]) -> datetime:
+    if contract.get("payment_due_date"):
+        return contract["payment_due_date"]
+    if contract.get("completion_date"):
+        return contract["completion_date"]
+    return (contract.get("signed_at") or contract["created_at"]) + timedelta(days=DUNNING_TERMS_DAYS)
+
+def due_stage(contract: Dict[str, Any], as_of: datetime) -> Optional[str]:
+    """The latest stage the contract has reached, unless that one was already sent
+
+    A contract first seen late (say 10 days overdue) gets only the latest
+    stage, not every stage it skipped.
+    """
+    days = (as_of - due_date(contract)).days
+    reached = [name for name, offset in DUNNING_STAGES if days >= offset]
+    if not reached:
+        return None
+    stage = reached[-1]
+    if stage in ((contract.get("dunning") or {}).get("stages_sent") or []):
+        return None
+    return stage
+
+class DunningEngine:
+    """Invoices and payment reminders for contracts with an outstanding balance
+
+    A run walks every owing contract in _id order, one indexed batch of
+    DUNNING_BATCH_SIZE at a time, and after each batch checkpoints the last
+    _id and its counters into its dunning_runs document; a heartbeat every
+    DUNNING_HEARTBEAT_SECONDS marks it alive between checkpoints. A run that
+    stops (crash, deploy, cancel) resumes from that cursor, and the stage date is
+    fixed when the run starts, so a resumed run decides exactly as the
+    original would have.
+
+    Within a batch, contracts are processed concurrently. Each contract's
+    stage is claimed with one conditional update on the contract (like the
+    appointment reminders), so a contract never gets the same stage twice,
+    whether from the rerun part of a resumed batch or from two processes.
+    When no channel delivers, the claim is released again and the stage is
+    noted in dunning.failed_stages, so the next run retries it.
+    The first stage also creates and sends a Stripe invoice for the balance.
+    It goes through the facade with contract-derived idempotency keys, and
+    the invoice id is kept on the contract for later stages.
+    """
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+        self._active: Set[ObjectId] = set()
+        self._email_slots: Optional[asyncio.Semaphore] = None
+
+    def _spawn(self, db, run: Dict[str, Any]):
+        task = asyncio.create_task(self.execute(db, run))
+        self._tasks.add(task)
+        self._active.add(run["_id"])
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._active.discard(run["_id"]))
+
+    async def _heartbeat(self, db, run_id: ObjectId):
+        """Keep a slow batch from looking dead to the stale-run check"""
+        while True:
+            await asyncio.sleep(DUNNING_HEARTBEAT_SECONDS)
+            try:
+                await db.dunning_runs.update_one(
+                    {"_id": run_id, "status": "running"}, {"$set": {"heartbeat_at": datetime.utcnow()}}
+                )
+            except Exception as e:
+                logger.warning(f"Dunning run {run_id} heartbeat failed: {e}")
+
+    async def start_run(self, db, triggered_by: str, dry_run: bool = False) -> Optional[Dict[str, Any]]:
+        """Create a run and start it in the background; None when one is already running"""
+        now = datetime.utcnow()
+        run = {
+            "_id": ObjectId(),
+            "status": "running",
+            "dry_run": dry_run,
+            "as_of": now,
+            "cursor": None,
+            "counts": {name: 0 for name in RUN_COUNTERS},
+            "batches": 0,
+            "triggered_by": triggered_by,
+            "started_at": now,
+            "heartbeat_at": now,
+            "finished_at": None,
+            "error": None,
+        }
+        try:
+            # The partial unique index on status allows one running run at a time
+            await db.dunning_runs.insert_one(run)
+        except DuplicateKeyError:
+            return None
+        self._spawn(db, run)
+        logger.info(f"Dunning run {run['_id']} started by {triggered_by}")
+        return run
+
+    async def resume(self, db, run_id: ObjectId, stale_only: bool = False) -> Optional[Dict[str, Any]]:
+        """Take over a run and continue it from its checkpoint
+
+        With stale_only, only a running run whose heartbeat has lapsed is taken
+        (its process died mid-run); otherwise only a failed or cancelled one.
+        """
+        now = datetime.utcnow()
+        query: Dict[str, Any] = {"_id": run_id}
+        if stale_only:
+            query.update({"status": "running", "heartbeat_at": {"$lt": now - timedelta(minutes=DUNNING_STALE_MINUTES)}})
+        else:
+            query["status"] = {"$in": ["failed", "cancelled"]}
+        try:
+            run = await db.dunning_runs.find_one_and_update(
+                query,
+                {"$set": {"status": "running", "heartbeat_at": now, "finished_at": None, "error": None}, "$inc": {"resumes": 1}},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return None
+        if run:
+            self._spawn(db, run)
+            logger.info(f"Dunning run {run_id} resumed from {run.get('cursor')}")
+        return run
+
+    async def cancel(self, db, run_id: ObjectId) -> bool:
+        """Stop a running run at its next checkpoint"""
+        result = await db.dunning_runs.update_one(
+            {"_id": run_id, "status": "running"},
+            {"$set": {"status": "cancelled", "finished_at": datetime.utcnow()}}
+        )
+        return result.modified_count > 0
+
+    async def execute(self, db, run: Dict[str, Any]):
+        run_id = run["_id"]
+        cursor_id = run.get("cursor")
+        slots = asyncio.Semaphore(DUNNING_CONCURRENCY)
+
+        async def guarded(contract):
+            async with slots:
+                try:
+                    return await self.process(db, run, contract)
+                except Exception as e:
+                    logger.error(f"Dunning failed for contract {contract['_id']}: {e}")
+                    return Counter(errors=1)
+
+        heartbeat = asyncio.create_task(self._heartbeat(db, run_id))
+        try:
+            while True:
+                query = dunning_query()
+                if cursor_id is not None:
+                    query["_id"] = {"$gt": cursor_id}
+                batch = await db.contracts.find(query, DUNNING_PROJECTION).sort("_id", 1).limit(
+                    DUNNING_BATCH_SIZE
+                ).to_list(length=DUNNING_BATCH_SIZE)
+                if not batch:
+                    break
+                counts = Counter(scanned=len(batch))
+                for result in await asyncio.gather(*(guarded(contract) for contract in batch)):
+                    counts.update(result)
+                cursor_id = batch[-1]["_id"]
+                # Recorded even when the run was cancelled meanwhile, since the batch's work is done
+                checkpoint = await db.dunning_runs.find_one_and_update(
+                    {"_id": run_id},
+                    {
+                        "$set": {"cursor": cursor_id, "heartbeat_at": datetime.utcnow()},
+                        "$inc": {"batches": 1, **{f"counts.{name}": value for name, value in counts.items()}}
+                    },
+                    projection={"status": 1},
+                    return_document=ReturnDocument.AFTER
+                )
+                if not checkpoint or checkpoint["status"] != "running":
+                    logger.info(f"Dunning run {run_id} was cancelled")
+                    return
+        except asyncio.CancelledError:
+            # Shutdown: leave it running so the next start resumes it once stale
+            raise
+        except Exception as e:
+            logger.error(f"Dunning run {run_id} failed: {e}")
+            await db.dunning_runs.update_one(
+                {"_id": run_id, "status": "running"},
+                {"$set": {"status": "failed", "error": str(e), "finished_at": datetime.utcnow()}}
+            )
+            return
+        finally:
+            heartbeat.cancel()
+
+        await db.dunning_runs.update_one(
+            {"_id": run_id, "status": "running"},
+            {"$set": {"status": "completed", "finished_at": datetime.utcnow()}}
+        )
+        logger.info(f"Dunning run {run_id} completed")
+
+    async def process(self, db, run: Dict[str, Any], contract: Dict[str, Any]) -> Counter:
+        as_of = run["as_of"]
+        stage = due_stage(contract, as_of)
+        if not stage:
+            return Counter(skipped=1)
+        if run.get("dry_run"):
+            return Counter(due=1)
+
+        due = due_date(contract)
+        update: Dict[str, Any] = {
+            "$addToSet": {"dunning.stages_sent": stage},
+            "$set": {"dunning.run_id": run["_id"]}
+        }
+        if as_of > due:
+            update["$set"]["payment_status"] = PaymentStatus.OVERDUE
+        claimed = await db.contracts.find_one_and_update(
+            {**dunning_query(), "_id": contract["_id"], "dunning.stages_sent": {"$ne": stage}},
+            update,
+            projection={"_id": 1}
+        )
+        if not claimed:
+            # Paid, or claimed by another process, since the batch was read
+            return Counter(skipped=1)
+
+        counts = Counter(due=1)
+        invoice = {
+            "invoice_number": (contract.get("dunning") or {}).get("invoice_number") or contract.get("contract_number"),
+            "payment_link": (contract.get("dunning") or {}).get("invoice_url") or "#",
+        }
+        if DUNNING_CREATE_INVOICES and not (contract.get("dunning") or {}).get("invoice_id"):
+            try:
+                invoice = await self.invoice(db, contract)
+                counts["invoiced"] += 1
+            except Exception as e:
+                # The reminder still goes out, quoting the contract number
+                logger.error(f"Dunning invoice for contract {contract['_id']} failed: {e}")
+                counts["errors"] += 1
+
+        invoice_data = {
+            **invoice,
+            "amount": contract["balance_due"],
+            "due_date": due.strftime("%B %d, %Y"),
+        }
+        sends = []
+        if contract.get("client_email"):
+            sends.append(("emails", self._email(contract, invoice_data, stage)))
+        if contract.get("client_phone"):
+            sends.append(("sms", SMSService().send_payment_reminder(
+                contract["client_phone"], contract["client_name"], contract["balance_due"], invoice_data["due_date"]
+            )))
+        results = await asyncio.gather(*(send for _, send in sends), return_exceptions=True)
+        for (channel, _), result in zip(sends, results):
+            if result is False or isinstance(result, Exception):
+                counts["errors"] += 1
+            else:
+                counts[channel] += 1
+        if not any(counts[channel] for channel, _ in sends):
+            # Nothing reached the client: release the claim so a later run tries again
+            await db.contracts.update_one(
+                {"_id": contract["_id"]},
+                {
+                    "$pull": {"dunning.stages_sent": stage},
+                    "$addToSet": {"dunning.failed_stages": stage},
+                    "$set": {"dunning.last_failed_at": datetime.utcnow()}
+                }
+            )
+            counts["undelivered"] += 1
+            return counts
+        await db.contracts.update_one(
+            {"_id": contract["_id"]},
+            {
+                "$set": {"dunning.last_stage": stage, "dunning.last_sent_at": datetime.utcnow()},
+                "$pull": {"dunning.failed_stages": stage}
+            }
+        )
+        counts["reminded"] += 1
+        return counts
+
+    async def _email(self, contract: Dict[str, Any], invoice_data: Dict[str, Any], stage: str):
+        if self._email_slots is None:
+            self._email_slots = asyncio.Semaphore(DUNNING_EMAIL_CONCURRENCY)
+        async with self._email_slots:
+            await EmailService().send_payment_reminder(
+                contract["client_email"], contract["client_name"], invoice_data, reminder_type=stage
+            )
+
+    async def invoice(self, db, contract: Dict[str, Any]) -> Dict[str, Any]:
+        """Create and send a Stripe invoice for the balance; returns the fields reminders quote"""
+        stripe_service = StripeService()
+        contract_id = str(contract["_id"])
+        customer_id = contract.get("stripe_customer_id")
+        if not customer_id:
+            customer_params = {
+                "email": contract["client_email"],
+                "name": contract["client_name"],
+                "metadata": {"contract_id": contract_id},
+            }
+            customer = await stripe_service.create_customer(
+                **customer_params,
+                idempotency_key=idempotency_key(f"contract-{contract_id}-customer", customer_params)
+            )
+            customer_id = customer.id
+            await db.contracts.update_one({"_id": contract["_id"]}, {"$set": {"stripe_customer_id": customer_id}})
+
+        amount = int(round(contract["balance_due"] * 100))
+        invoice_params = {
+            "customer_id": customer_id,
+            "amount": amount,
+            "description": f"Balance due for contract {contract.get('contract_number')}",
+            "metadata": {"contract_id": contract_id, "payment_type": "balance"},
+            "days_until_due": DUNNING_INVOICE_DAYS_UNTIL_DUE,
+        }
+        invoice = await stripe_service.create_invoice(
+            **invoice_params,
+            idempotency_key=idempotency_key(f"contract-{contract_id}-dunning", invoice_params)
+        )
+        fields = {
+            "invoice_id": invoice.id,
+            "invoice_number": invoice.get("number") or contract.get("contract_number"),
+            "invoice_url": invoice.get("hosted_invoice_url"),
+        }
+        await db.contracts.update_one(
+            {"_id": contract["_id"]},
+            {"$set": {f"dunning.{name}": value for name, value in fields.items()}}
+        )
+        return {"invoice_number": fields["invoice_number"], "payment_link": fields["invoice_url"] or "#"}
+
+    async def run(self, get_db):
+        """Background loop: resume runs whose process died, and start scheduled runs"""
+        db = await get_db()
+        while True:
+            try:
+                stale = db.dunning_runs.find(
+                    {"status": "running", "heartbeat_at": {"$lt": datetime.utcnow() - timedelta(minutes=DUNNING_STALE_MINUTES)}},
+                    {"_id": 1}
+                )
+                async for run in stale:
+                    # A run this process is still executing is slow, not dead
+                    if run["_id"] not in self._active:
+                        await self.resume(db, run["_id"], stale_only=True)
+                if DUNNING_AUTO_RUN:
+                    latest = await db.dunning_runs.find(
+                        {"dry_run": False}, {"started_at": 1}
+                    ).sort("started_at", -1).limit(1).to_list(length=1)
+                    if not latest or latest[0]["started_at"] < datetime.utcnow() - timedelta(hours=DUNNING_INTERVAL_HOURS):
+                        await self.start_run(db, triggered_by="schedule")
+            except Exception as e:
+                logger.error(f"Dunning scheduler failed: {e}")
+            await asyncio.sleep(DUNNING_CHECK_MINUTES * 60)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+dunning_engine = DunningEngine()
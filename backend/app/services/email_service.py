@@ -1,3 +1,4 @@
+import asyncio
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -430,14 +431,17 @@ class EmailService:
                 for attachment in attachments:
                     msg.attach(attachment)
             
-            # Send email
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_username, self.smtp_password)
-                server.send_message(msg)
+            # smtplib blocks, so the SMTP conversation runs on a worker thread
+            await asyncio.to_thread(self._deliver, msg)
             
             logger.info(f"Email sent successfully to {to_email}")
         
         except Exception as e:
             logger.error(f"Failed to send email to {to_email}: {e}")
             raise
+
+    def _deliver(self, msg: MIMEMultipart):
+        with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
+            server.starttls()
+            server.login(self.smtp_username, self.smtp_password)
+            server.send_message(msg)
@@ -0,0 +1,117 @@
+import asyncio
+import re
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+import httpx
+from decouple import config
+import logging
+
+from .auth_cache import TTLCache
+from .sms_service import SenderPacer
+
+logger = logging.getLogger(__name__)
+
+# "nominatim" looks up unknown addresses; "none" only uses the geocodes table
+GEOCODER_PROVIDER = config("GEOCODER_PROVIDER", default="nominatim")
+GEOCODER_URL = config("GEOCODER_URL", default="https://nominatim.openstreetmap.org/search")
+GEOCODER_USER_AGENT = config("GEOCODER_USER_AGENT", default="stonecraft-crm/1.0")
+# Nominatim's usage policy allows one request per second
+GEOCODER_MIN_INTERVAL_SECONDS = float(config("GEOCODER_MIN_INTERVAL_SECONDS", default=1.0))
+GEOCODER_TIMEOUT_SECONDS = float(config("GEOCODER_TIMEOUT_SECONDS", default=5.0))
+
+Point = Tuple[float, float]
+
+# Process-wide front for the geocodes collection; addresses never move, so
+# entries only age out to bound memory. Misses are memoized as ()
+_memo = TTLCache(max_entries=20000, ttl=float("inf"))
+# One pacer for the whole process, so concurrent route plans and background
+# lookups together stay within the provider's rate limit
+_pacer = SenderPacer(1.0 / GEOCODER_MIN_INTERVAL_SECONDS if GEOCODER_MIN_INTERVAL_SECONDS > 0 else 0)
+# Background lookups started on appointment writes, kept referenced until done
+_background: Set[asyncio.Task] = set()
+
+def normalize_address(address: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", address.lower())).strip()
+
+class GeocodeService:
+    """Address -> (lat, lng), looked up once and kept in the geocodes collection
+
+    Documents are keyed by the normalized address, so repeated appointments at
+    the same site never reach the provider again. Misses are stored too (with
+    no coordinates) so an unresolvable location is not retried on every plan.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def geocode_many(self, addresses: Iterable[str]) -> Dict[str, Optional[Point]]:
+        """Coordinates for each address (None when it cannot be resolved)"""
+        keys = {address: normalize_address(address) for address in addresses if address and address.strip()}
+        found: Dict[str, Optional[Point]] = {}
+        for key in set(keys.values()):
+            cached = _memo.get(key)
+            if cached is not None:
+                found[key] = cached or None
+
+        pending = [key for key in set(keys.values()) if key not in found]
+        if pending:
+            async for document in self.db.geocodes.find({"_id": {"$in": pending}}):
+                point = (document["lat"], document["lng"]) if document.get("lat") is not None else None
+                found[document["_id"]] = point
+                _memo.set(document["_id"], point or ())
+
+        unknown = [(address, key) for address, key in keys.items() if key not in found]
+        if unknown and GEOCODER_PROVIDER == "nominatim":
+            async with httpx.AsyncClient(timeout=GEOCODER_TIMEOUT_SECONDS,
+                                         headers={"User-Agent": GEOCODER_USER_AGENT}) as client:
+                for address, key in unknown:
+                    if key in found:
+                        continue
+                    await _pacer.wait()
+                    # Another call may have resolved it while this one waited
+                    cached = _memo.get(key)
+                    if cached is not None:
+                        found[key] = cached or None
+                        continue
+                    try:
+                        point = await self._lookup(client, address)
+                    except Exception as e:
+                        # Not stored, so the next plan retries it
+                        logger.warning(f"Geocoding failed for {address!r}: {e}")
+                        continue
+                    found[key] = point
+                    _memo.set(key, point or ())
+                    await self.db.geocodes.update_one(
+                        {"_id": key},
+                        {"$set": {
+                            "address": address,
+                            "lat": point[0] if point else None,
+                            "lng": point[1] if point else None,
+                            "geocoded_at": datetime.utcnow()
+                        }},
+                        upsert=True
+                    )
+
+        return {address: found.get(key) for address, key in keys.items()}
+
+    def prefetch(self, address: Optional[str]):
+        """Geocode an address in the background so later route plans find it stored"""
+        if not address or not address.strip() or _memo.get(normalize_address(address)) is not None:
+            return
+        task = asyncio.create_task(self._prefetch(address))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    async def _prefetch(self, address: str):
+        try:
+            await self.geocode_many([address])
+        except Exception as e:
+            logger.warning(f"Background geocoding failed for {address!r}: {e}")
+
+    async def _lookup(self, client: httpx.AsyncClient, address: str) -> Optional[Point]:
+        response = await client.get(GEOCODER_URL, params={"q": address, "format": "json", "limit": 1})
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            return None
+        return float(results[0]["lat"]), float(results[0]["lon"])
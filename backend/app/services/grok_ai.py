@@ -8,15 +8,18 @@ import logging
 from datetime import datetime, timedelta
 import re
 
+from .metrics import MetricsService, OPEN_ESTIMATE_STATUSES
+
 logger = logging.getLogger(__name__)
 
 class GrokAI:
-    def __init__(self):
+    def __init__(self, db=None):
         # Note: This is a placeholder for Grok AI integration
         # You would need to replace with actual Grok AI API credentials and endpoints
         self.api_key = config("GROK_AI_API_KEY", default="")
         self.base_url = config("GROK_AI_BASE_URL", default="https://api.grok.ai/v1")
         self.conversation_history = []
+        self.db = db
 
     async def get_smart_response(self, user_message: str, context: Dict[str, Any] = None) -> str:
         """Get a smart response for the AI Assistant - Simple interface, incredible power"""
@@ -208,13 +211,15 @@ class GrokAI:
             's': '→ Settings',
             'm': '→ Marketing',
             'help': self._get_help_message(),
-            'stats': await self._get_quick_stats(),
             'nc': '→ Clients (Ready to add new client)',
             'ne': '→ Estimates (Ready to create new estimate)',
             'np': '→ Payments (Ready to add new payment)',
             'na': '→ Calendar (Ready to schedule appointment)',
         }
         
+        if msg == 'stats':
+            return await self._get_quick_stats()
+        
         if msg in shortcuts:
             return shortcuts[msg]
         
@@ -434,64 +439,102 @@ class GrokAI:
 
 Just type what you need - I understand everything! 🎯"""
 
+    async def _get_metrics_summary(self, days: int = 7) -> Optional[Dict[str, Any]]:
+        """Precomputed dashboard rollups, or None when no database is available"""
+        if self.db is None:
+            return None
+        try:
+            return await MetricsService(self.db).get_summary(days)
+        except Exception as e:
+            logger.warning(f"Failed to load metrics for assistant: {e}")
+            return None
+
+    def _metrics_unavailable(self, title: str) -> str:
+        return f"{title}\n\nLive numbers aren't available right now. Try again in a moment."
+
     async def _get_quick_stats(self) -> str:
         """Get quick statistics"""
-        # This would connect to your actual database
-        return """📊 **Quick Stats**
-
-• Active Clients: 127
-• Pending Estimates: 23
-• Overdue Payments: 8
-• This Week's Revenue: $45,280
-• Appointments Today: 12
+        summary = await self._get_metrics_summary(7)
+        if summary is None:
+            return self._metrics_unavailable("📊 **Quick Stats**")
+        totals, week = summary["totals"], summary["window"]
+        by_status = totals.get("estimates", {}).get("by_status", {})
+        pending = sum(by_status.get(status, 0) for status in OPEN_ESTIMATE_STATUSES)
+        return f"""📊 **Quick Stats**
+
+• Total Clients: {totals.get("leads", {}).get("count", 0)}
+• Pending Estimates: {pending}
+• Pipeline Value: ${totals.get("pipeline_value", 0):,.0f}
+• This Week's Revenue: ${week["revenue"]:,.0f}
+• New Leads This Week: {week["leads"]}
 
 *Live data from your CRM*"""
 
     async def _get_revenue_analysis(self) -> str:
         """Get revenue analysis"""
-        return """💰 **Revenue Analysis**
-
-• Monthly Revenue: $156,840
-• Growth Rate: +12.3%
-• Top Client: ABC Corp ($23,400)
-• Avg Invoice: $2,180
-• Collection Rate: 94.2%
+        summary = await self._get_metrics_summary(30)
+        if summary is None:
+            return self._metrics_unavailable("💰 **Revenue Analysis**")
+        totals, month = summary["totals"], summary["window"]
+        payments = totals.get("payments", {})
+        average = month["revenue"] / month["payments"] if month["payments"] else 0
+        return f"""💰 **Revenue Analysis**
+
+• Last 30 Days Revenue: ${month["revenue"]:,.0f}
+• Payments Last 30 Days: {month["payments"]}
+• Avg Payment: ${average:,.0f}
+• All-Time Collected: ${payments.get("collected", 0):,.0f}
+• Open Pipeline: ${totals.get("pipeline_value", 0):,.0f}
 
 *Updated in real-time*"""
 
     async def _get_client_analysis(self) -> str:
         """Get client analysis"""
-        return """👥 **Client Analysis**
-
-• Total Clients: 127
-• Active This Month: 89
-• New This Month: 12
-• Top Industry: Construction (34%)
-• Avg Project Value: $8,900
+        summary = await self._get_metrics_summary(30)
+        if summary is None:
+            return self._metrics_unavailable("👥 **Client Analysis**")
+        leads, month = summary["totals"].get("leads", {}), summary["window"]
+        by_source = leads.get("by_source", {})
+        top_source = max(by_source, key=by_source.get) if by_source else "n/a"
+        return f"""👥 **Client Analysis**
+
+• Total Clients: {leads.get("count", 0)}
+• New Last 30 Days: {month["leads"]}
+• Top Lead Source: {top_source} ({by_source.get(top_source, 0)})
 
 *Client insights*"""
 
     async def _get_payment_analysis(self) -> str:
         """Get payment analysis"""
-        return """💳 **Payment Analysis**
+        summary = await self._get_metrics_summary(30)
+        if summary is None:
+            return self._metrics_unavailable("💳 **Payment Analysis**")
+        payments, month = summary["totals"].get("payments", {}), summary["window"]
+        return f"""💳 **Payment Analysis**
 
-• Total Outstanding: $67,890
-• Overdue Amount: $12,340
-• Avg Payment Time: 28 days
-• This Month Collected: $134,560
-• Success Rate: 96.8%
+• Collected Last 30 Days: ${month["revenue"]:,.0f}
+• Payments Last 30 Days: {month["payments"]}
+• All-Time Collected: ${payments.get("collected", 0):,.0f} across {payments.get("count", 0)} payments
 
 *Payment tracking*"""
 
     async def _get_estimate_analysis(self) -> str:
         """Get estimate analysis"""
-        return """📋 **Estimate Analysis**
-
-• Pending Estimates: 23
-• Win Rate: 68.4%
-• Avg Estimate: $12,450
-• This Month Created: 34
-• Conversion Time: 12 days
+        summary = await self._get_metrics_summary(30)
+        if summary is None:
+            return self._metrics_unavailable("📋 **Estimate Analysis**")
+        estimates, month = summary["totals"].get("estimates", {}), summary["window"]
+        by_status = estimates.get("by_status", {})
+        pending = sum(by_status.get(status, 0) for status in OPEN_ESTIMATE_STATUSES)
+        decided = by_status.get("accepted", 0) + by_status.get("rejected", 0)
+        win_rate = by_status.get("accepted", 0) / decided * 100 if decided else 0
+        average = sum(estimates.get("value_by_status", {}).values()) / estimates["count"] if estimates.get("count") else 0
+        return f"""📋 **Estimate Analysis**
+
+• Pending Estimates: {pending}
+• Win Rate: {win_rate:.1f}%
+• Avg Estimate: ${average:,.0f}
+• Created Last 30 Days: {month["estimates_created"]}
 
 *Estimate performance*"""
 
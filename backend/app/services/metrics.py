@@ -0,0 +1,309 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pymongo import UpdateOne
+from decouple import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+METRICS_REBUILD_HOUR = int(config("METRICS_REBUILD_HOUR", default=3))  # UTC
+OPEN_ESTIMATE_STATUSES = ("draft", "sent", "viewed")
+TOTALS_ID = "totals"
+DAILY_PREFIX = "daily:"
+# Rollup fields recomputed from each source collection, on the totals and daily docs
+ESTIMATE_FIELDS = (("estimates", "pipeline_value"), ("estimates_created", "estimates_value"))
+LEAD_FIELDS = (("leads",), ("leads", "leads_by_source"))
+# Recomputed from the payments ledger, once it holds any charges
+PAYMENT_FIELDS = (("payments",), ("revenue", "payments"))
+
+def _key(value: Optional[str]) -> str:
+    """Make a status or lead source safe to use as a field name"""
+    if not value:
+        return "unknown"
+    return str(getattr(value, "value", value)).replace(".", "_").replace("$", "_")
+
+def _day(moment: Optional[datetime] = None) -> str:
+    return (moment or datetime.utcnow()).strftime("%Y-%m-%d")
+
+def _estimate_deltas(estimate: Dict[str, Any], sign: int) -> Dict[str, float]:
+    status = _key(estimate.get("status", "draft"))
+    total = float(estimate.get("total") or 0) * sign
+    deltas = {
+        "estimates.count": sign,
+        f"estimates.by_status.{status}": sign,
+        f"estimates.value_by_status.{status}": total,
+    }
+    if status in OPEN_ESTIMATE_STATUSES:
+        deltas["pipeline_value"] = total
+    return deltas
+
+def _lead_deltas(lead_source: Optional[str], sign: int) -> Tuple[Dict[str, int], Dict[str, int]]:
+    source = _key(lead_source)
+    return (
+        {"leads.count": sign, f"leads.by_source.{source}": sign},
+        {"leads": sign, f"leads_by_source.{source}": sign},
+    )
+
+def _flatten(document: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """Nested rollup fields as dotted paths, e.g. {"leads.by_source.web": 3}"""
+    flat = {}
+    for name, value in document.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{name}."))
+        else:
+            flat[prefix + name] = value
+    return flat
+
+def _owned(path: str, fields: Iterable[str]) -> bool:
+    return any(path == field or path.startswith(field + ".") for field in fields)
+
+class MetricsService:
+    """Dashboard numbers kept as rollup documents in metrics_rollups
+
+    One "totals" document holds running counters (estimates and their value by
+    status, open pipeline value, payments collected, leads by source) and one
+    "daily:YYYY-MM-DD" document per day holds that day's activity. Write paths
+    apply $inc deltas so reads are a single indexed lookup; rebuild() recomputes
+    everything derivable from the source collections, at startup when the
+    totals are missing and nightly to correct drift.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def _apply(self, totals: Dict[str, float], daily: Optional[Dict[str, float]] = None,
+                     moment: Optional[datetime] = None):
+        # Metrics must never fail the write that triggered them
+        try:
+            totals = {k: v for k, v in totals.items() if v}
+            if totals:
+                await self.db.metrics_rollups.update_one(
+                    {"_id": TOTALS_ID},
+                    {"$inc": totals, "$set": {"updated_at": datetime.utcnow()}},
+                    upsert=True
+                )
+            if daily:
+                day = _day(moment)
+                await self.db.metrics_rollups.update_one(
+                    {"_id": DAILY_PREFIX + day},
+                    {"$inc": daily, "$set": {"date": day}},
+                    upsert=True
+                )
+        except Exception as e:
+            logger.warning(f"Failed to update metrics rollups: {e}")
+
+    async def estimate_created(self, estimate: Dict[str, Any]):
+        await self._apply(
+            _estimate_deltas(estimate, 1),
+            {"estimates_created": 1, "estimates_value": float(estimate.get("total") or 0)},
+            estimate.get("created_at")
+        )
+
+    async def estimate_changed(self, before: Dict[str, Any], after: Dict[str, Any]):
+        deltas = _estimate_deltas(before, -1)
+        for key, value in _estimate_deltas(after, 1).items():
+            deltas[key] = deltas.get(key, 0) + value
+        await self._apply(deltas)
+
+    async def estimate_deleted(self, estimate: Dict[str, Any]):
+        await self._apply(_estimate_deltas(estimate, -1))
+
+    async def payment_collected(self, amount: float, moment: Optional[datetime] = None):
+        await self._apply(
+            {"payments.collected": amount, "payments.count": 1},
+            {"revenue": amount, "payments": 1},
+            moment
+        )
+
+    async def lead_captured(self, lead_source: Optional[str], moment: Optional[datetime] = None):
+        await self._apply(*_lead_deltas(lead_source, 1), moment)
+
+    async def lead_changed(self, before: Dict[str, Any], after: Dict[str, Any]):
+        if _key(before.get("lead_source")) == _key(after.get("lead_source")):
+            return
+        totals, daily = _lead_deltas(before.get("lead_source"), -1)
+        added_totals, added_daily = _lead_deltas(after.get("lead_source"), 1)
+        for deltas, added in ((totals, added_totals), (daily, added_daily)):
+            for key, value in added.items():
+                deltas[key] = deltas.get(key, 0) + value
+        # The day the lead was captured keeps its count, only the source moves
+        await self._apply(totals, daily, before.get("created_at"))
+
+    async def lead_removed(self, client: Dict[str, Any]):
+        await self._apply(*_lead_deltas(client.get("lead_source"), -1), client.get("created_at"))
+
+    async def get_totals(self) -> Dict[str, Any]:
+        totals = await self.db.metrics_rollups.find_one({"_id": TOTALS_ID})
+        if not totals:
+            return {}
+        totals.pop("_id", None)
+        return totals
+
+    async def get_daily(self, days: int = 30, end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Daily rollups for the last `days` days, oldest first"""
+        end = end or datetime.utcnow()
+        start = end - timedelta(days=days - 1)
+        cursor = self.db.metrics_rollups.find(
+            {"_id": {"$gte": DAILY_PREFIX + _day(start), "$lte": DAILY_PREFIX + _day(end)}},
+            {"_id": 0}
+        ).sort("_id", 1)
+        return await cursor.to_list(length=days)
+
+    async def get_summary(self, days: int = 7) -> Dict[str, Any]:
+        """Totals plus sums over the last `days` days, for dashboards and the assistant"""
+        totals, daily = await asyncio.gather(self.get_totals(), self.get_daily(days))
+        window = {"days": days, "revenue": 0.0, "payments": 0, "leads": 0, "estimates_created": 0}
+        for day in daily:
+            for field in ("revenue", "payments", "leads", "estimates_created"):
+                window[field] += day.get(field, 0)
+        return {"totals": totals, "window": window}
+
+    async def _correct(self, totals: Dict[str, Any], daily: Dict[str, Dict[str, Any]],
+                       fields: Tuple[Tuple[str, ...], Tuple[str, ...]]) -> int:
+        """Move the rollup fields owned by one source collection to the recomputed values
+
+        Each document gets the difference between the recomputed and current
+        values as an $inc, so deltas applied by writes while the rebuild ran are
+        kept rather than overwritten. Call it right after that collection's
+        aggregates so the window between snapshot and correction stays short.
+        """
+        total_fields, daily_fields = fields
+        targets = {TOTALS_ID: {k: v for k, v in _flatten(totals).items() if _owned(k, total_fields)}}
+        for day, values in daily.items():
+            targets[DAILY_PREFIX + day] = {k: v for k, v in _flatten(values).items() if _owned(k, daily_fields)}
+
+        current = {}
+        async for document in self.db.metrics_rollups.find({"_id": {"$regex": f"^({TOTALS_ID}$|{DAILY_PREFIX})"}}):
+            owned = total_fields if document["_id"] == TOTALS_ID else daily_fields
+            current[document["_id"]] = {k: v for k, v in _flatten(document).items() if _owned(k, owned)}
+
+        operations = []
+        for doc_id in targets.keys() | current.keys():
+            target, held = targets.get(doc_id, {}), current.get(doc_id, {})
+            inc, reset = {}, {}
+            for path in target.keys() | held.keys():
+                value, existing = target.get(path, 0), held.get(path, 0)
+                if not isinstance(existing, (int, float)) or isinstance(existing, bool):
+                    reset[path] = value
+                elif value != existing:
+                    inc[path] = value - existing
+            if not inc and not reset and doc_id in current:
+                continue
+            update = {"$set": {**reset, **({"date": doc_id[len(DAILY_PREFIX):]} if doc_id != TOTALS_ID else {})}}
+            if inc:
+                update["$inc"] = inc
+            if not update["$set"]:
+                del update["$set"]
+            operations.append(UpdateOne({"_id": doc_id}, update, upsert=True))
+        if operations:
+            await self.db.metrics_rollups.bulk_write(operations, ordered=False)
+        return len(operations)
+
+    async def rebuild(self) -> Dict[str, int]:
+        """Recompute estimate, lead and (when the ledger is populated) payment rollups"""
+        started = datetime.utcnow()
+        empty_day = lambda: {"estimates_created": 0, "estimates_value": 0.0, "leads": 0, "leads_by_source": {}, "revenue": 0.0, "payments": 0}
+        daily: Dict[str, Dict[str, Any]] = {}
+
+        estimates_by_status = await self.db.estimates.aggregate([
+            {"$group": {"_id": "$status", "count": {"$sum": 1}, "value": {"$sum": {"$ifNull": ["$total", 0]}}}}
+        ]).to_list(length=None)
+        estimates_by_day = await self.db.estimates.aggregate([
+            {"$match": {"created_at": {"$type": "date"}}},
+            {"$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                "count": {"$sum": 1},
+                "value": {"$sum": {"$ifNull": ["$total", 0]}}
+            }}
+        ]).to_list(length=None)
+        estimates = {"count": 0, "by_status": {}, "value_by_status": {}}
+        pipeline_value = 0.0
+        for row in estimates_by_status:
+            status = _key(row["_id"])
+            estimates["count"] += row["count"]
+            estimates["by_status"][status] = row["count"]
+            estimates["value_by_status"][status] = row["value"]
+            if status in OPEN_ESTIMATE_STATUSES:
+                pipeline_value += row["value"]
+        for row in estimates_by_day:
+            day = daily.setdefault(row["_id"], empty_day())
+            day["estimates_created"] = row["count"]
+            day["estimates_value"] = row["value"]
+        await self._correct({"estimates": estimates, "pipeline_value": pipeline_value}, daily, ESTIMATE_FIELDS)
+
+        leads_by_source = await self.db.clients.aggregate([
+            {"$group": {"_id": "$lead_source", "count": {"$sum": 1}}}
+        ]).to_list(length=None)
+        leads_by_day = await self.db.clients.aggregate([
+            {"$match": {"created_at": {"$type": "date"}}},
+            {"$group": {
+                "_id": {"day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}, "source": "$lead_source"},
+                "count": {"$sum": 1}
+            }}
+        ]).to_list(length=None)
+        leads = {"count": 0, "by_source": {}}
+        for row in leads_by_source:
+            source = _key(row["_id"])
+            leads["count"] += row["count"]
+            leads["by_source"][source] = leads["by_source"].get(source, 0) + row["count"]
+        for row in leads_by_day:
+            day = daily.setdefault(row["_id"]["day"], empty_day())
+            source = _key(row["_id"].get("source"))
+            day["leads"] += row["count"]
+            day["leads_by_source"][source] = day["leads_by_source"].get(source, 0) + row["count"]
+        await self._correct({"leads": leads}, daily, LEAD_FIELDS)
+
+        # Without a ledger the webhook-maintained payment counters are the only
+        # record, so they are left as they are
+        if await self.db.payments.find_one({"object": "charge"}, {"_id": 1}) is not None:
+            payments_by_day = await self.db.payments.aggregate([
+                {"$match": {"object": "charge", "status": "succeeded", "created": {"$type": "date"}}},
+                {"$group": {
+                    "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created"}},
+                    "count": {"$sum": 1},
+                    "amount": {"$sum": "$amount"}
+                }}
+            ]).to_list(length=None)
+            payments = {"collected": 0.0, "count": 0}
+            for row in payments_by_day:
+                payments["collected"] += row["amount"]
+                payments["count"] += row["count"]
+                day = daily.setdefault(row["_id"], empty_day())
+                day["revenue"] = row["amount"]
+                day["payments"] = row["count"]
+            await self._correct({"payments": payments}, daily, PAYMENT_FIELDS)
+
+        finished = datetime.utcnow()
+        await self.db.metrics_rollups.update_one(
+            {"_id": TOTALS_ID},
+            {"$set": {"rebuilt_at": started, "updated_at": finished}},
+            upsert=True
+        )
+        logger.info(f"Rebuilt metrics rollups: {len(daily)} days in {(finished - started).total_seconds():.1f}s")
+        return {"days": len(daily), "estimates": estimates["count"], "leads": leads["count"]}
+
+def _seconds_until_rebuild(now: datetime) -> float:
+    next_run = now.replace(hour=METRICS_REBUILD_HOUR, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+async def run_nightly_rebuild(get_db):
+    """Background loop: rebuild rollups once a day at METRICS_REBUILD_HOUR UTC
+
+    Also rebuilds at startup when there is no totals document yet, so the
+    deltas applied by estimate and client writes start from real counts.
+    """
+    try:
+        db = await get_db()
+        if await db.metrics_rollups.find_one({"_id": TOTALS_ID}, {"_id": 1}) is None:
+            await MetricsService(db).rebuild()
+    except Exception as e:
+        logger.error(f"Startup metrics rebuild failed: {e}")
+    while True:
+        await asyncio.sleep(_seconds_until_rebuild(datetime.utcnow()))
+        try:
+            await MetricsService(await get_db()).rebuild()
+        except Exception as e:
+            logger.error(f"Nightly metrics rebuild failed: {e}")
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from decouple import config
+import logging
+
+from .auth_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(config("BCRYPT_ROUNDS", default=12))
+PASSWORD_HASH_WORKERS = int(config("PASSWORD_HASH_WORKERS", default=min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(config("PASSWORD_HASH_MAX_PENDING", default=PASSWORD_HASH_WORKERS * 16))
+PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS = float(config("PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS", default=10.0))
+LOGIN_MAX_ATTEMPTS = int(config("LOGIN_MAX_ATTEMPTS", default=10))
+LOGIN_WINDOW_SECONDS = float(config("LOGIN_WINDOW_SECONDS", default=300))
+# Failed logins per username (across all addresses) before its failures are slowed down
+LOGIN_MAX_ATTEMPTS_PER_ACCOUNT = int(config("LOGIN_MAX_ATTEMPTS_PER_ACCOUNT", default=50))
+LOGIN_BACKOFF_BASE_SECONDS = float(config("LOGIN_BACKOFF_BASE_SECONDS", default=1.0))
+LOGIN_MAX_BACKOFF_SECONDS = float(config("LOGIN_MAX_BACKOFF_SECONDS", default=30.0))
+
+# Hashes with fewer rounds than BCRYPT_ROUNDS are reported as needing an update,
+# so raising the work factor upgrades stored hashes as users log in
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+_hash_pool: Optional[ThreadPoolExecutor] = None
+_hash_slots: Optional[asyncio.Semaphore] = None
+
+def _get_hash_pool() -> ThreadPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _hash_pool
+
+def _get_hash_slots() -> asyncio.Semaphore:
+    global _hash_slots
+    if _hash_slots is None:
+        _hash_slots = asyncio.Semaphore(PASSWORD_HASH_MAX_PENDING)
+    return _hash_slots
+
+def shutdown_hash_pool():
+    """Shut down the bcrypt thread pool (called on application shutdown)"""
+    global _hash_pool, _hash_slots
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
+    _hash_slots = None
+
+async def _run_in_hash_pool(func, *args):
+    """Run a bcrypt call on the dedicated pool, capping how many callers may queue for it"""
+    slots = _get_hash_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning("Password hashing pool saturated, rejecting request")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_hash_pool(), func, *args)
+    finally:
+        slots.release()
+
+async def hash_password(password: str) -> str:
+    return await _run_in_hash_pool(pwd_context.hash, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password off the event loop
+
+    Returns (valid, new_hash); new_hash is set when the stored hash uses an
+    outdated work factor and should be replaced.
+    """
+    if not hashed_password:
+        return False, None
+    try:
+        return await _run_in_hash_pool(pwd_context.verify_and_update, plain_password, hashed_password)
+    except ValueError:
+        logger.warning("Stored password hash is not a recognised format")
+        return False, None
+
+class LoginThrottle:
+    """Fixed-window count of failed login attempts per key, answered with backoff
+
+    Nothing is ever refused outright, so a correct password always logs in and
+    nobody can lock a user out by failing on purpose. Instead, failures beyond
+    max_attempts in a window are answered ever more slowly (backoff()). Keyed
+    on (client address, username), attempt() also lets an over-budget key have
+    only one attempt in flight, which together with the delay caps how fast
+    one client can guess one account; keyed on the username alone (any
+    address) only the delay applies.
+    """
+
+    def __init__(self, max_attempts: int = LOGIN_MAX_ATTEMPTS, window: float = LOGIN_WINDOW_SECONDS):
+        self.max_attempts = max_attempts
+        self.window = window
+        self._windows = TTLCache(100000, window)
+        self._in_flight: Dict[str, int] = {}
+
+    @staticmethod
+    def key(client: str, username: str) -> str:
+        return f"{client}|{username.strip().lower()}"
+
+    def failures(self, key: str) -> int:
+        window = self._windows.get(key)
+        return window[1] if window else 0
+
+    @asynccontextmanager
+    async def attempt(self, key: str):
+        """Hold the key's slot for one login attempt; 429 if an over-budget key already has one running"""
+        if self._in_flight.get(key) and self.failures(key) >= self.max_attempts:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, please try again later",
+                headers={"Retry-After": str(max(1, int(LOGIN_MAX_BACKOFF_SECONDS)))},
+            )
+        self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            self._in_flight[key] -= 1
+            if not self._in_flight[key]:
+                del self._in_flight[key]
+
+    def backoff(self, key: str) -> float:
+        """Record a failed attempt; returns how long to hold its response, doubling past the budget"""
+        now = time.monotonic()
+        started_at, failures = self._windows.get(key) or (now, 0)
+        failures += 1
+        self._windows.set(key, (started_at, failures), started_at + self.window - now)
+        excess = failures - self.max_attempts
+        if excess <= 0:
+            return 0.0
+        return min(LOGIN_BACKOFF_BASE_SECONDS * 2 ** (excess - 1), LOGIN_MAX_BACKOFF_SECONDS)
+
+    def reset(self, key: str):
+        self._windows.pop(key)
+
+login_throttle = LoginThrottle()
+account_login_throttle = LoginThrottle(max_attempts=LOGIN_MAX_ATTEMPTS_PER_ACCOUNT)
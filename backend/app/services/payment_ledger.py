@@ -0,0 +1,199 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from pymongo import UpdateOne
+from decouple import config
+import logging
+
+from .stripe_service import StripeService
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_RECONCILE_MINUTES = float(config("PAYMENT_RECONCILE_MINUTES", default=60))
+PAYMENT_RECONCILE_LOOKBACK_HOURS = float(config("PAYMENT_RECONCILE_LOOKBACK_HOURS", default=48))
+# First reconciliation of a new ledger imports Stripe history from this date (YYYY-MM-DD; default: all of it)
+PAYMENT_BACKFILL_SINCE = config("PAYMENT_BACKFILL_SINCE", default="1970-01-01")
+EPOCH = datetime(1970, 1, 1)
+
+def _timestamp(value: Optional[int]) -> Optional[datetime]:
+    return datetime.utcfromtimestamp(value) if value else None
+
+def _id(value: Any) -> Optional[str]:
+    """Stripe fields can hold an id or an expanded object"""
+    if isinstance(value, dict):
+        return value.get("id")
+    return value
+
+class PaymentLedger:
+    """Local copy of Stripe charges and payment intents in the payments collection
+
+    Webhook events keep it current and a periodic reconciliation against the
+    Stripe API fills anything a webhook missed, so the transaction and status
+    endpoints read one indexed collection instead of calling Stripe per page
+    view. Entries use the Stripe id as _id, so writing the same object twice
+    just refreshes it. The last successful reconciliation is recorded in
+    ledger_sync so startup can tell an empty or stale ledger from a current one.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def _contract_for_intent(self, payment_intent_id: Optional[str]) -> Optional[str]:
+        if not payment_intent_id:
+            return None
+        intent = await self.db.payments.find_one({"_id": payment_intent_id}, {"contract_id": 1})
+        return (intent or {}).get("contract_id")
+
+    def _intent_entry(self, intent: Dict[str, Any], source: str) -> Dict[str, Any]:
+        return {
+            "object": "payment_intent",
+            "contract_id": (intent.get("metadata") or {}).get("contract_id"),
+            "status": intent.get("status"),
+            "amount": (intent.get("amount") or 0) / 100,
+            "amount_received": (intent.get("amount_received") or 0) / 100,
+            "currency": intent.get("currency"),
+            "customer": _id(intent.get("customer")),
+            "payment_type": (intent.get("metadata") or {}).get("payment_type", "deposit"),
+            "created": _timestamp(intent.get("created")),
+            "source": source,
+            "synced_at": datetime.utcnow(),
+        }
+
+    async def _charge_entry(self, charge: Dict[str, Any], source: str) -> Dict[str, Any]:
+        payment_intent_id = _id(charge.get("payment_intent"))
+        contract_id = (charge.get("metadata") or {}).get("contract_id")
+        if not contract_id:
+            # Charges do not inherit the intent's metadata
+            contract_id = await self._contract_for_intent(payment_intent_id)
+        return {
+            "object": "charge",
+            "contract_id": contract_id,
+            "payment_intent_id": payment_intent_id,
+            "status": charge.get("status"),
+            "paid": bool(charge.get("paid")),
+            "amount": (charge.get("amount") or 0) / 100,
+            "amount_refunded": (charge.get("amount_refunded") or 0) / 100,
+            "currency": charge.get("currency"),
+            "description": charge.get("description"),
+            "receipt_url": charge.get("receipt_url"),
+            "customer": _id(charge.get("customer")),
+            "created": _timestamp(charge.get("created")),
+            "source": source,
+            "synced_at": datetime.utcnow(),
+        }
+
+    async def record_payment_intent(self, intent: Dict[str, Any], source: str = "webhook"):
+        await self.db.payments.update_one(
+            {"_id": intent["id"]},
+            {"$set": self._intent_entry(intent, source)},
+            upsert=True
+        )
+        # Older API versions embed the intent's charges
+        for charge in ((intent.get("charges") or {}).get("data") or []):
+            await self.record_charge(charge, source)
+
+    async def record_charge(self, charge: Dict[str, Any], source: str = "webhook"):
+        await self.db.payments.update_one(
+            {"_id": charge["id"]},
+            {"$set": await self._charge_entry(charge, source)},
+            upsert=True
+        )
+
+    async def transactions(self, contract_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        cursor = self.db.payments.find(
+            {"contract_id": contract_id, "object": "charge"},
+            {"amount": 1, "amount_refunded": 1, "status": 1, "created": 1, "description": 1, "receipt_url": 1}
+        ).sort("created", -1).limit(limit)
+        return [
+            {
+                "id": charge["_id"],
+                "amount": charge["amount"],
+                "amount_refunded": charge.get("amount_refunded", 0),
+                "status": charge["status"],
+                "created": int((charge["created"] - datetime(1970, 1, 1)).total_seconds()) if charge.get("created") else None,
+                "description": charge.get("description"),
+                "receipt_url": charge.get("receipt_url")
+            }
+            for charge in await cursor.to_list(length=limit)
+        ]
+
+    async def payment_intent(self, payment_intent_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.payments.find_one(
+            {"_id": payment_intent_id, "object": "payment_intent"},
+            {"status": 1, "amount_received": 1}
+        )
+
+    async def backfill_since(self) -> Optional[datetime]:
+        """Where a startup reconciliation should begin, or None when the ledger is current
+
+        A ledger that was never reconciled imports history from
+        PAYMENT_BACKFILL_SINCE; one last reconciled longer ago than the regular
+        lookback resumes from that run, so downtime leaves no gap.
+        """
+        state = await self.db.ledger_sync.find_one({"_id": "payments"})
+        if not state or not state.get("reconciled_at"):
+            return datetime.strptime(PAYMENT_BACKFILL_SINCE, "%Y-%m-%d")
+        lookback = timedelta(hours=PAYMENT_RECONCILE_LOOKBACK_HOURS)
+        if datetime.utcnow() - state["reconciled_at"] > lookback:
+            return state["reconciled_at"] - lookback
+        return None
+
+    async def reconcile(self, since: datetime) -> Dict[str, int]:
+        """Upsert every payment intent and charge Stripe has created since `since`"""
+        created = {"gte": max(0, int((since - EPOCH).total_seconds()))}
+        started = datetime.utcnow()
+        stripe_service = StripeService()
+        intents, charges = await asyncio.gather(
+            stripe_service.list_all("PaymentIntent", created=created),
+            stripe_service.list_all("Charge", created=created)
+        )
+        # Intents first so charges can find their contract through them
+        if intents:
+            await self.db.payments.bulk_write([
+                UpdateOne({"_id": intent["id"]}, {"$set": self._intent_entry(intent, "reconcile")}, upsert=True)
+                for intent in intents
+            ], ordered=False)
+        if charges:
+            await self.db.payments.bulk_write([
+                UpdateOne({"_id": charge["id"]}, {"$set": await self._charge_entry(charge, "reconcile")}, upsert=True)
+                for charge in charges
+            ], ordered=False)
+        await self.db.ledger_sync.update_one(
+            {"_id": "payments"},
+            {"$set": {"reconciled_at": started, "since": since}},
+            upsert=True
+        )
+        logger.info(
+            f"Reconciled {len(intents)} payment intents and {len(charges)} charges "
+            f"in {(datetime.utcnow() - started).total_seconds():.1f}s"
+        )
+        return {"payment_intents": len(intents), "charges": len(charges)}
+
+async def handle_payment_intent_event(db, event: Dict[str, Any], replay: bool):
+    await PaymentLedger(db).record_payment_intent(event["data"]["object"])
+
+async def handle_charge_event(db, event: Dict[str, Any], replay: bool):
+    await PaymentLedger(db).record_charge(event["data"]["object"])
+
+async def run_reconciliation(get_db):
+    """Background loop: reconcile the ledger against Stripe every PAYMENT_RECONCILE_MINUTES
+
+    Starts with a backfill when the ledger has never been reconciled or the
+    last run is older than the lookback window.
+    """
+    try:
+        ledger = PaymentLedger(await get_db())
+        since = await ledger.backfill_since()
+        if since:
+            logger.info(f"Backfilling payment ledger from {since:%Y-%m-%d %H:%M}")
+            await ledger.reconcile(since)
+    except Exception as e:
+        logger.error(f"Payment ledger backfill failed: {e}")
+    while True:
+        await asyncio.sleep(PAYMENT_RECONCILE_MINUTES * 60)
+        try:
+            await PaymentLedger(await get_db()).reconcile(
+                datetime.utcnow() - timedelta(hours=PAYMENT_RECONCILE_LOOKBACK_HOURS)
+            )
+        except Exception as e:
+            logger.error(f"Payment ledger reconciliation failed: {e}")
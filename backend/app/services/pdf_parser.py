@@ -1,33 +1,196 @@
 import PyPDF2
 import re
-from typing import List, Dict, Any
+import os
+import mmap
+import asyncio
+import tempfile
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import List, Dict, Any, Union, BinaryIO, AsyncIterator, Optional, Iterator, Callable, Tuple
+from decouple import config
 import logging
 from io import BytesIO
 
+from ..models.vendor import PriceTableLayout
+from .price_table import Fragment, extract_table
+
 logger = logging.getLogger(__name__)
 
+# A PDF can be passed as raw bytes, a path on disk (e.g. a spooled upload) or a seekable file object
+PDFSource = Union[bytes, str, BinaryIO]
+
+PDF_PARSER_WORKERS = int(config("PDF_PARSER_WORKERS", default=os.cpu_count() or 2))
+PAGES_PER_SHARD = int(config("PDF_PAGES_PER_SHARD", default=8))
+PAGE_TIMEOUT_SECONDS = float(config("PDF_PAGE_TIMEOUT_SECONDS", default=5.0))
+# Documents up to this many pages are extracted in a thread: for them, shipping
+# shards to worker processes costs more than it saves
+PDF_SERIAL_PAGE_LIMIT = int(config("PDF_SERIAL_PAGE_LIMIT", default=16))
+SHARD_POLL_SECONDS = 0.05
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=max(PDF_PARSER_WORKERS, 1))
+    return _process_pool
+
+def _parallel() -> bool:
+    """Process sharding only pays off with more than one worker and more than one CPU"""
+    return PDF_PARSER_WORKERS > 1 and (os.cpu_count() or 1) > 1
+
+def _drop_broken_pool(pool: ProcessPoolExecutor):
+    """Forget a pool that broke (a worker died), so the next submit starts a fresh one"""
+    global _process_pool
+    if _process_pool is pool:
+        _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+async def _await_shard(future: concurrent.futures.Future, timeout: float) -> Any:
+    """The result of a shard, timing out only once a worker has had it for timeout seconds
+
+    Time spent queued behind other documents' shards does not count, so a busy
+    pool cannot make a healthy shard look stuck.
+    """
+    waiter = asyncio.wrap_future(future)
+    while not future.running() and not future.done():
+        await asyncio.wait({waiter}, timeout=SHARD_POLL_SECONDS)
+    return await asyncio.wait_for(waiter, timeout=timeout)
+
+def shutdown_process_pool():
+    """Stop the page extraction workers (called on application shutdown)"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+@contextmanager
+def _open_pdf(source: PDFSource) -> Iterator[PyPDF2.PdfReader]:
+    """Open a PdfReader without copying the document into memory where possible"""
+    if isinstance(source, str):
+        with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield PyPDF2.PdfReader(mapped)
+    elif hasattr(source, "read"):
+        source.seek(0)
+        yield PyPDF2.PdfReader(source)
+    else:
+        yield PyPDF2.PdfReader(BytesIO(source))
+
+@contextmanager
+def _as_path(source: PDFSource) -> Iterator[str]:
+    """Give worker processes a path to map instead of pickling the document per shard"""
+    if isinstance(source, str):
+        yield source
+        return
+    with tempfile.NamedTemporaryFile(prefix="pdf_", suffix=".pdf") as tmp:
+        if hasattr(source, "read"):
+            source.seek(0)
+            while True:
+                chunk = source.read(1024 * 1024)
+                if not chunk:
+                    break
+                tmp.write(chunk)
+        else:
+            tmp.write(source)
+        tmp.flush()
+        yield tmp.name
+
+def _count_pages(source: PDFSource) -> int:
+    with _open_pdf(source) as reader:
+        return len(reader.pages)
+
+def _page_fragments(reader: PyPDF2.PdfReader, i: int) -> List[Fragment]:
+    """Positioned text fragments of page i"""
+    fragments: List[Fragment] = []
+
+    def visit(text, cm, tm, font_dict, font_size):
+        if text.strip():
+            x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+            y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+            fragments.append((round(x, 1), round(y, 1), text.strip()))
+
+    reader.pages[i].extract_text(visitor_text=visit)
+    return fragments
+
+def _page_text(reader: PyPDF2.PdfReader, i: int) -> str:
+    return reader.pages[i].extract_text() or ""
+
+def _extract_pages(source: PDFSource, start: int, end: int, extract_page: Callable[[PyPDF2.PdfReader, int], Any]) -> List[Any]:
+    """Run extract_page over pages [start, end); runs inside a worker process"""
+    with _open_pdf(source) as reader:
+        return [extract_page(reader, i) for i in range(start, end)]
+
+def _extract_page_range(source: PDFSource, start: int, end: int) -> List[str]:
+    """Extract text for pages [start, end)"""
+    return _extract_pages(source, start, end, _page_text)
+
+def _count_or_extract(
+    source: PDFSource,
+    extract_page: Callable[[PyPDF2.PdfReader, int], Any],
+    empty_page: Any
+) -> Tuple[int, Optional[List[Any]]]:
+    """Page count, plus every page's result when the document is extracted in this thread
+
+    Small documents (and every document when sharding cannot help) are read
+    here with the same reader that counted the pages; a page that fails to
+    extract yields empty_page.
+    """
+    with _open_pdf(source) as reader:
+        page_count = len(reader.pages)
+        if page_count > PDF_SERIAL_PAGE_LIMIT and _parallel():
+            return page_count, None
+        pages = []
+        for i in range(page_count):
+            try:
+                pages.append(extract_page(reader, i))
+            except Exception as e:
+                logger.error(f"Error extracting PDF page {i + 1}: {e}")
+                pages.append(empty_page)
+        return page_count, pages
+
+# Each pricing pattern carries a base confidence; named groups keep "price first" lines the right way round
+PRICING_PATTERNS = [
+    # Pattern for "Item - $Price" format
+    ("dash", 0.8, re.compile(r'(?P<name>[A-Za-z0-9\s\-\.]+)\s*[-–—]\s*(?P<dollar>\$)?(?P<price>\d+(?:\.\d{2})?)', re.IGNORECASE)),
+    # Pattern for "Item: $Price" format
+    ("colon", 0.8, re.compile(r'(?P<name>[A-Za-z0-9\s\-\.]+):\s*(?P<dollar>\$)?(?P<price>\d+(?:\.\d{2})?)', re.IGNORECASE)),
+    # Pattern for tabular data
+    ("tabular", 0.6, re.compile(r'(?P<name>[A-Za-z0-9\s\-\.]+)\s+(?P<dollar>\$)?(?P<price>\d+(?:\.\d{2})?)\s*(?:ea|each|per|unit)?', re.IGNORECASE)),
+    # Pattern for "Price: $XX.XX Item" format
+    ("price_first", 0.4, re.compile(r'(?P<dollar>\$)?(?P<price>\d+(?:\.\d{2})?)\s+(?P<name>[A-Za-z0-9\s\-\.]+)', re.IGNORECASE)),
+]
+
+UNIT_WORDS = r'sq\s?ft|square\s?feet?|linear\s?ft?|lf|each|ea|per|unit|lb|pound|gallon|gal'
+UNIT_PATTERNS = [
+    re.compile(r'(\d+(?:\.\d+)?)\s*(' + UNIT_WORDS + r')', re.IGNORECASE),
+    re.compile(r'(' + UNIT_WORDS + r')\s*(\d+(?:\.\d+)?)', re.IGNORECASE),
+]
+UNIT_ONLY = re.compile(r'(?:' + UNIT_WORDS + r')', re.IGNORECASE)
+HAS_DIGIT = re.compile(r'\d')
+WORD = re.compile(r'[A-Za-z]{3,}')
+# Running headers and footers, which otherwise read as "Page 3 of" at $400
+PAGE_MARKER = re.compile(r'page\s+\d+(?:\s+of\s+\d+)?', re.IGNORECASE)
+
+CATEGORY_KEYWORDS = {
+    "materials": ["lumber", "wood", "steel", "concrete", "brick", "stone", "tile", "roofing", "siding"],
+    "labor": ["install", "labor", "work", "service", "repair", "maintenance"],
+    "electrical": ["wire", "outlet", "switch", "panel", "fixture", "electrical"],
+    "plumbing": ["pipe", "faucet", "toilet", "sink", "plumbing", "water"],
+    "hvac": ["duct", "hvac", "heating", "cooling", "air", "ventilation"],
+    "tools": ["tool", "equipment", "machinery", "rental"]
+}
+
 class PDFParser:
     def __init__(self):
-        self.pricing_patterns = [
-            # Pattern for "Item - $Price" format
-            r'([A-Za-z0-9\s\-\.]+)\s*[-–—]\s*\$?(\d+(?:\.\d{2})?)',
-            # Pattern for "Item: $Price" format
-            r'([A-Za-z0-9\s\-\.]+):\s*\$?(\d+(?:\.\d{2})?)',
-            # Pattern for tabular data
-            r'([A-Za-z0-9\s\-\.]+)\s+\$?(\d+(?:\.\d{2})?)\s*(?:ea|each|per|unit)?',
-            # Pattern for "Price: $XX.XX Item" format
-            r'\$?(\d+(?:\.\d{2})?)\s+([A-Za-z0-9\s\-\.]+)',
-        ]
-        
-        self.unit_patterns = [
-            r'(\d+(?:\.\d+)?)\s*(sq\s?ft|square\s?feet?|linear\s?ft?|lf|each|ea|per|unit|lb|pound|gallon|gal)',
-            r'(sq\s?ft|square\s?feet?|linear\s?ft?|lf|each|ea|per|unit|lb|pound|gallon|gal)\s*(\d+(?:\.\d+)?)',
-        ]
+        self.pricing_patterns = PRICING_PATTERNS
+        self.unit_patterns = UNIT_PATTERNS
 
-    async def extract_data_from_pdf(self, pdf_content: bytes) -> Dict[str, Any]:
+    async def extract_data_from_pdf(self, pdf_content: PDFSource) -> Dict[str, Any]:
         """Extract all data from PDF"""
         try:
-            text = self._extract_text_from_pdf(pdf_content)
+            text = await self._extract_text_from_pdf(pdf_content)
             
             return {
                 "text": text,
@@ -39,86 +202,198 @@ class PDFParser:
             logger.error(f"Error extracting data from PDF: {e}")
             return {"error": str(e)}
 
-    async def extract_pricing_from_pdf(self, pdf_content: bytes) -> List[Dict[str, Any]]:
+    async def extract_pricing_from_pdf(self, pdf_content: PDFSource) -> List[Dict[str, Any]]:
         """Extract pricing information from PDF"""
         try:
-            text = self._extract_text_from_pdf(pdf_content)
+            text = await self._extract_text_from_pdf(pdf_content)
             return await self.extract_pricing_from_text(text)
         except Exception as e:
             logger.error(f"Error extracting pricing from PDF: {e}")
             return []
 
-    def _extract_text_from_pdf(self, pdf_content: bytes) -> str:
-        """Extract text from PDF bytes"""
+    async def extract_pricing_table(
+        self,
+        pdf_content: PDFSource,
+        layout: Optional[PriceTableLayout] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[PriceTableLayout]]:
+        """Extract pricing from a tabular price sheet using text positions
+
+        Pass the vendor's cached layout to skip header detection; the layout actually
+        used is returned so it can be cached for the next upload.
+        """
         try:
-            pdf_file = BytesIO(pdf_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            
-            return text
+            pages = [page async for page in self._iter_page_results(pdf_content, _page_fragments, [])]
+            loop = asyncio.get_running_loop()
+            rows, layout = await loop.run_in_executor(None, extract_table, pages, layout)
+            return [row.to_pricing_info().dict() for row in rows], layout
+        except Exception as e:
+            logger.error(f"Error extracting pricing table from PDF: {e}")
+            return [], None
+
+    async def iter_page_text(self, pdf_content: PDFSource) -> AsyncIterator[str]:
+        """Yield the text of each page in order as soon as its shard is extracted"""
+        async for page_text in self._iter_page_results(pdf_content, _page_text, ""):
+            yield page_text
+
+    async def _iter_page_results(
+        self,
+        pdf_content: PDFSource,
+        extract_page: Callable[[PyPDF2.PdfReader, int], Any],
+        empty_page: Any
+    ) -> AsyncIterator[Any]:
+        """Run extract_page over the pages of a PDF and yield the results in order
+
+        Documents of up to PDF_SERIAL_PAGE_LIMIT pages, or any document on a
+        single CPU, are extracted in one thread. Larger ones are split into
+        shards of PAGES_PER_SHARD pages spread over the shared process pool. A
+        shard a worker has spent more than PAGE_TIMEOUT_SECONDS per page on is
+        skipped (yielding empty_page); the pool itself is left alone, as other
+        uploads are using it.
+        """
+        loop = asyncio.get_running_loop()
+        page_count, pages = await loop.run_in_executor(None, _count_or_extract, pdf_content, extract_page, empty_page)
+        if pages is not None:
+            for page in pages:
+                yield page
+            return
+
+        shards = [
+            (start, min(start + PAGES_PER_SHARD, page_count))
+            for start in range(0, page_count, PAGES_PER_SHARD)
+        ]
+        with _as_path(pdf_content) as path:
+            futures: Dict[Tuple[int, int], concurrent.futures.Future] = {}
+
+            def submit(pending: List[Tuple[int, int]]) -> ProcessPoolExecutor:
+                pool = _get_process_pool()
+                for shard in pending:
+                    if shard in futures:
+                        futures[shard].cancel()
+                    futures[shard] = pool.submit(_extract_pages, path, *shard, extract_page)
+                return pool
+
+            pool = submit(shards)
+            retried = set()
+            index = 0
+            try:
+                while index < len(shards):
+                    shard = start, end = shards[index]
+                    try:
+                        pages = await _await_shard(futures[shard], PAGE_TIMEOUT_SECONDS * (end - start))
+                    except asyncio.TimeoutError:
+                        logger.warning(f"Timed out extracting PDF pages {start + 1}-{end}; skipping")
+                        pages = [empty_page] * (end - start)
+                    except BrokenProcessPool:
+                        if shard not in retried:
+                            # A worker died (e.g. killed for memory); start a fresh pool once
+                            retried.add(shard)
+                            _drop_broken_pool(pool)
+                            pool = submit(shards[index:])
+                            continue
+                        logger.error(f"Error extracting PDF pages {start + 1}-{end}: worker pool broke twice")
+                        pages = [empty_page] * (end - start)
+                    except Exception as e:
+                        logger.error(f"Error extracting PDF pages {start + 1}-{end}: {e}")
+                        pages = [empty_page] * (end - start)
+
+                    for page in pages:
+                        yield page
+                    index += 1
+            finally:
+                # Shards still queued are dropped; one already running finishes in its worker
+                for future in futures.values():
+                    future.cancel()
+
+    async def _extract_text_from_pdf(self, pdf_content: PDFSource) -> str:
+        """Extract text from PDF bytes, a file path or a seekable file-like object"""
+        try:
+            pages = [page_text async for page_text in self.iter_page_text(pdf_content)]
+            return "".join(f"{page_text}\n" for page_text in pages)
         except Exception as e:
             logger.error(f"Error reading PDF: {e}")
             raise
 
     async def extract_pricing_from_text(self, text: str) -> List[Dict[str, Any]]:
-        """Extract pricing information from text"""
-        pricing_items = []
-        lines = text.split('\n')
+        """Extract pricing information from text (off the event loop)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._extract_pricing_items, text)
+
+    def _extract_pricing_items(self, text: str) -> List[Dict[str, Any]]:
+        """Single pass over the lines of text: at most one item per line
+
+        Patterns are tried in order of base confidence and the first one with a
+        plausible match decides the line, so a "price first" reading never adds a
+        second item for a line another pattern already explained. Every item
+        carries a confidence score in [0, 1]: the base score of the pattern that
+        matched, plus 0.1 for an explicit "$" and 0.1 for an explicit unit. When
+        several lines give the same item name, the most confident one is kept.
+        """
+        pricing_items: Dict[str, Dict[str, Any]] = {}
         
-        for line in lines:
+        for line in text.split('\n'):
             line = line.strip()
-            if not line:
+            # Every pattern needs a price, so lines without digits can be skipped outright
+            if not line or not HAS_DIGIT.search(line) or PAGE_MARKER.fullmatch(line):
                 continue
             
-            # Try each pricing pattern
-            for pattern in self.pricing_patterns:
-                matches = re.finditer(pattern, line, re.IGNORECASE)
-                for match in matches:
-                    if len(match.groups()) >= 2:
-                        item_name = match.group(1).strip()
-                        price_str = match.group(2).strip()
-                        
-                        # Skip if item name is too short or looks like a number
-                        if len(item_name) < 3 or item_name.isdigit():
-                            continue
-                        
-                        try:
-                            price = float(price_str)
-                            
-                            # Extract unit information
-                            unit = self._extract_unit(line)
-                            
-                            pricing_item = {
-                                "item_name": item_name,
-                                "price": price,
-                                "unit": unit,
-                                "description": line,
-                                "category": self._guess_category(item_name)
-                            }
-                            
-                            # Avoid duplicates
-                            if not any(item["item_name"].lower() == item_name.lower() for item in pricing_items):
-                                pricing_items.append(pricing_item)
-                        
-                        except ValueError:
-                            continue
+            best = None
+            for pattern_name, base_confidence, pattern in self.pricing_patterns:
+                for match in pattern.finditer(line):
+                    item_name = match.group("name").strip().rstrip("-–—").rstrip()
+                    if not self._is_item_name(item_name):
+                        continue
+                    try:
+                        price = float(match.group("price"))
+                    except ValueError:
+                        continue
+                    confidence = base_confidence + (0.1 if match.group("dollar") else 0.0)
+                    if best is None or confidence > best[0]:
+                        best = (confidence, item_name, price, pattern_name)
+                if best is not None:
+                    break
+            if best is None:
+                continue
+            
+            confidence, item_name, price, pattern_name = best
+            unit = self._find_unit(line)
+            if unit:
+                confidence += 0.1
+            confidence = round(min(confidence, 1.0), 2)
+            
+            key = item_name.lower()
+            existing = pricing_items.get(key)
+            if existing is not None and existing["confidence"] >= confidence:
+                continue
+            
+            pricing_items[key] = {
+                "item_name": item_name,
+                "price": price,
+                "unit": unit or "each",
+                "description": line,
+                "category": self._guess_category(item_name),
+                "confidence": confidence,
+                "match_type": pattern_name
+            }
         
-        return pricing_items
+        return list(pricing_items.values())
+
+    def _is_item_name(self, name: str) -> bool:
+        """A name needs a real word (three or more letters) that is not just a unit"""
+        if len(name) < 3:
+            return False
+        return any(not UNIT_ONLY.fullmatch(word) for word in WORD.findall(name))
 
-    def _extract_unit(self, text: str) -> str:
-        """Extract unit from text"""
+    def _find_unit(self, text: str) -> Optional[str]:
+        """Return the unit explicitly mentioned in text, if any"""
         for pattern in self.unit_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+            match = pattern.search(text)
             if match:
                 # Return the unit part of the match
                 groups = match.groups()
                 for group in groups:
                     if not group.replace('.', '').isdigit():
                         return group.strip()
-        return "each"
+        return None
 
     def _extract_contact_info(self, text: str) -> Dict[str, str]:
         """Extract contact information from text"""
@@ -167,17 +442,8 @@ class PDFParser:
 
     def _guess_category(self, item_name: str) -> str:
         """Guess category based on item name"""
-        categories = {
-            "materials": ["lumber", "wood", "steel", "concrete", "brick", "stone", "tile", "roofing", "siding"],
-            "labor": ["install", "labor", "work", "service", "repair", "maintenance"],
-            "electrical": ["wire", "outlet", "switch", "panel", "fixture", "electrical"],
-            "plumbing": ["pipe", "faucet", "toilet", "sink", "plumbing", "water"],
-            "hvac": ["duct", "hvac", "heating", "cooling", "air", "ventilation"],
-            "tools": ["tool", "equipment", "machinery", "rental"]
-        }
-        
         item_lower = item_name.lower()
-        for category, keywords in categories.items():
+        for category, keywords in CATEGORY_KEYWORDS.items():
             if any(keyword in item_lower for keyword in keywords):
                 return category
         
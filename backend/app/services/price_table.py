@@ -0,0 +1,125 @@
+import re
+from typing import List, Optional, Tuple
+import logging
+
+from ..models.vendor import PriceTableColumn, PriceTableLayout, PriceTableRow
+
+logger = logging.getLogger(__name__)
+
+# A text fragment as positioned on the page: (x, y, text)
+Fragment = Tuple[float, float, str]
+
+ROW_TOLERANCE = 2.0  # points between baselines still considered the same row
+COLUMN_TOLERANCE = 4.0  # points a cell may start left of its column header
+
+# Checked in order, so "Vendor Name" is matched before the generic "name"
+HEADER_KEYWORDS = [
+    ("vendor_name", re.compile(r'vendor|supplier|brand', re.IGNORECASE)),
+    ("thickness", re.compile(r'thick|\bcm\b', re.IGNORECASE)),
+    ("material", re.compile(r'material|type', re.IGNORECASE)),
+    ("size", re.compile(r'size|dimension|slab', re.IGNORECASE)),
+    ("cost", re.compile(r'cost', re.IGNORECASE)),
+    ("price", re.compile(r'price|total|sq\s?ft|rate', re.IGNORECASE)),
+    ("color", re.compile(r'colou?r|name|description', re.IGNORECASE)),
+]
+MIN_HEADER_COLUMNS = 3
+NUMBER_PATTERN = re.compile(r'-?\d+(?:,\d{3})*(?:\.\d+)?')
+
+def group_rows(fragments: List[Fragment]) -> List[List[Fragment]]:
+    """Group fragments sharing a baseline into rows, top of the page first"""
+    rows: List[List[Fragment]] = []
+    for fragment in sorted(fragments, key=lambda f: (-f[1], f[0])):
+        if rows and abs(rows[-1][0][1] - fragment[1]) <= ROW_TOLERANCE:
+            rows[-1].append(fragment)
+        else:
+            rows.append([fragment])
+    for row in rows:
+        row.sort(key=lambda f: f[0])
+    return rows
+
+def _match_header(row: List[Fragment]) -> Optional[List[PriceTableColumn]]:
+    columns = []
+    used = set()
+    for x, _, text in row:
+        for key, pattern in HEADER_KEYWORDS:
+            if key not in used and pattern.search(text):
+                columns.append(PriceTableColumn(key=key, header=text.strip(), x=x))
+                used.add(key)
+                break
+    if len(columns) >= MIN_HEADER_COLUMNS and "price" in used and "color" in used:
+        return columns
+    return None
+
+def detect_layout(pages: List[List[Fragment]]) -> Optional[PriceTableLayout]:
+    """Find the first row that looks like a price-sheet header and derive the column layout from it"""
+    for fragments in pages:
+        for row in group_rows(fragments):
+            columns = _match_header(row)
+            if columns:
+                return PriceTableLayout(columns=sorted(columns, key=lambda c: c.x))
+    return None
+
+def _parse_number(text: Optional[str]) -> Optional[float]:
+    if not text:
+        return None
+    match = NUMBER_PATTERN.search(text)
+    return float(match.group().replace(",", "")) if match else None
+
+def parse_rows(pages: List[List[Fragment]], layout: PriceTableLayout) -> List[PriceTableRow]:
+    """Assign every fragment to a column of the layout and keep rows that carry a color and a price"""
+    column_starts = [column.x - COLUMN_TOLERANCE for column in layout.columns]
+    headers = {column.header.lower() for column in layout.columns}
+    typed_rows = []
+
+    for fragments in pages:
+        for row in group_rows(fragments):
+            cells = {}
+            for x, _, text in row:
+                text = text.strip()
+                if not text:
+                    continue
+                # Last column whose left edge is at or before the fragment
+                index = 0
+                for i, start in enumerate(column_starts):
+                    if start <= x:
+                        index = i
+                    else:
+                        break
+                key = layout.columns[index].key
+                cells[key] = f"{cells[key]} {text}" if key in cells else text
+
+            # Repeated header rows on later pages
+            if cells and {value.lower() for value in cells.values()} <= headers:
+                continue
+
+            price = _parse_number(cells.get("price"))
+            if price is None or not cells.get("color"):
+                continue
+
+            typed_rows.append(PriceTableRow(
+                color=cells["color"],
+                vendor_name=cells.get("vendor_name"),
+                thickness=cells.get("thickness"),
+                material=cells.get("material"),
+                size=cells.get("size"),
+                price=price,
+                cost=_parse_number(cells.get("cost"))
+            ))
+
+    return typed_rows
+
+def extract_table(
+    pages: List[List[Fragment]],
+    layout: Optional[PriceTableLayout] = None
+) -> Tuple[List[PriceTableRow], Optional[PriceTableLayout]]:
+    """Parse pages with a cached layout, re-detecting the layout only when it no longer yields rows"""
+    if layout is not None:
+        rows = parse_rows(pages, layout)
+        if rows:
+            return rows, layout
+        logger.info("Cached price table layout matched no rows; re-detecting")
+
+    layout = detect_layout(pages)
+    if layout is None:
+        return [], None
+    return parse_rows(pages, layout), layout
@@ -0,0 +1,206 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+from bson import ObjectId
+from decouple import config
+import logging
+
+from .email_service import EmailService
+from .sms_service import SMSService
+
+logger = logging.getLogger(__name__)
+
+# label -> how long before start_time the reminder goes out
+REMINDER_OFFSETS = {"24h": timedelta(hours=24), "1h": timedelta(hours=1)}
+REMINDER_HORIZON_HOURS = int(config("REMINDER_HORIZON_HOURS", default=48))
+REMINDER_RELOAD_MINUTES = int(config("REMINDER_RELOAD_MINUTES", default=15))
+# A reminder whose time passed while the app was down is still sent if it is at most this late
+REMINDER_GRACE_MINUTES = int(config("REMINDER_GRACE_MINUTES", default=15))
+REMINDER_PROJECTION = {"client_id": 1, "start_time": 1, "status": 1, "title": 1, "reminders_sent": 1}
+
+def _minute(moment: datetime) -> int:
+    return int(moment.timestamp() // 60)
+
+class TimingWheel:
+    """Two-level hierarchical timing wheel with one-minute resolution
+
+    Level 0 has 60 one-minute slots covering the next hour; level 1 has one
+    slot per hour out to `hours`. advance() walks the elapsed minutes, and at
+    each hour boundary the matching level-1 slot is cascaded down into level 0,
+    so adding, removing and firing an entry are all O(1). Entries beyond the
+    horizon are ignored; the scheduler's periodic reload picks them up later.
+    """
+
+    def __init__(self, now: datetime, hours: int = REMINDER_HORIZON_HOURS):
+        self.hours = hours
+        self.current = _minute(now)
+        self.minutes: List[Set[Hashable]] = [set() for _ in range(60)]
+        self.hour_slots: List[Set[Hashable]] = [set() for _ in range(hours)]
+        self.entries: Dict[Hashable, Tuple[int, Any, Set[Hashable]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def add(self, key: Hashable, fire_at: datetime, payload: Any = None) -> bool:
+        """Schedule (or reschedule) key; returns False if fire_at is past the horizon"""
+        self.remove(key)
+        minute = max(_minute(fire_at), self.current + 1)
+        if minute - self.current < 60:
+            slot = self.minutes[minute % 60]
+        elif minute // 60 - self.current // 60 < self.hours:
+            slot = self.hour_slots[(minute // 60) % self.hours]
+        else:
+            return False
+        slot.add(key)
+        self.entries[key] = (minute, payload, slot)
+        return True
+
+    def remove(self, key: Hashable):
+        entry = self.entries.pop(key, None)
+        if entry:
+            entry[2].discard(key)
+
+    def advance(self, now: datetime) -> List[Tuple[Hashable, Any]]:
+        """Move the wheel to now and return the (key, payload) pairs that came due"""
+        due = []
+        target = _minute(now)
+        while self.current < target:
+            self.current += 1
+            if self.current % 60 == 0:
+                cascading = self.hour_slots[(self.current // 60) % self.hours]
+                for key in list(cascading):
+                    minute, payload, _ = self.entries[key]
+                    cascading.discard(key)
+                    slot = self.minutes[minute % 60]
+                    slot.add(key)
+                    self.entries[key] = (minute, payload, slot)
+            slot = self.minutes[self.current % 60]
+            for key in [key for key in slot if self.entries[key][0] <= self.current]:
+                due.append((key, self.entries.pop(key)[1]))
+                slot.discard(key)
+        return due
+
+class ReminderScheduler:
+    """Sends 24h and 1h appointment reminders by SMS and email
+
+    Upcoming appointments are loaded into a TimingWheel with one indexed
+    start_time range query (repeated every REMINDER_RELOAD_MINUTES to pick up
+    writes from other workers and appointments entering the horizon), and the
+    appointment endpoints keep it current through schedule()/cancel(). Before
+    sending, a reminder is claimed by atomically adding its label to the
+    appointment's reminders_sent array; only the worker whose update matched
+    sends, and a crash after the claim skips the reminder rather than repeating
+    it, so delivery is at most once across workers and restarts.
+    """
+
+    def __init__(self):
+        self.wheel = TimingWheel(datetime.utcnow())
+        self.db = None
+        self._sending: Set[asyncio.Task] = set()
+
+    def schedule(self, appointment: Dict[str, Any], now: Optional[datetime] = None):
+        """(Re)schedule an appointment's pending reminders"""
+        now = now or datetime.utcnow()
+        appointment_id = str(appointment["_id"])
+        self.cancel(appointment_id)
+        start_time = appointment.get("start_time")
+        if appointment.get("status", "scheduled") != "scheduled" or not start_time or start_time <= now:
+            return
+        sent = set(appointment.get("reminders_sent") or [])
+        late_cutoff = now - timedelta(minutes=REMINDER_GRACE_MINUTES)
+        for label, offset in REMINDER_OFFSETS.items():
+            fire_at = start_time - offset
+            if label not in sent and fire_at >= late_cutoff:
+                self.wheel.add((appointment_id, label), fire_at, start_time)
+
+    def cancel(self, appointment_id: str):
+        for label in REMINDER_OFFSETS:
+            self.wheel.remove((str(appointment_id), label))
+
+    async def reload(self):
+        now = datetime.utcnow()
+        cursor = self.db.appointments.find(
+            {
+                "start_time": {"$gt": now, "$lte": now + timedelta(hours=REMINDER_HORIZON_HOURS)},
+                "status": "scheduled"
+            },
+            REMINDER_PROJECTION
+        )
+        count = 0
+        async for appointment in cursor:
+            self.schedule(appointment, now)
+            count += 1
+        logger.info(f"Reminder wheel loaded {count} upcoming appointments ({len(self.wheel)} reminders pending)")
+
+    async def _claim(self, appointment_id: str, label: str, start_time: datetime) -> Optional[Dict[str, Any]]:
+        # Matching start_time and status means a reschedule or cancellation in the
+        # meantime makes the claim fail instead of sending a stale reminder
+        return await self.db.appointments.find_one_and_update(
+            {
+                "_id": ObjectId(appointment_id),
+                "start_time": start_time,
+                "status": "scheduled",
+                "reminders_sent": {"$ne": label}
+            },
+            {"$addToSet": {"reminders_sent": label}},
+            projection=REMINDER_PROJECTION
+        )
+
+    async def fire(self, appointment_id: str, label: str, start_time: datetime):
+        try:
+            appointment = await self._claim(appointment_id, label, start_time)
+            if not appointment:
+                return
+            client = None
+            if appointment.get("client_id") and ObjectId.is_valid(appointment["client_id"]):
+                client = await self.db.clients.find_one(
+                    {"_id": ObjectId(appointment["client_id"])},
+                    {"first_name": 1, "email": 1, "phone": 1}
+                )
+            if not client:
+                logger.info(f"Appointment {appointment_id} has no client to remind")
+                return
+
+            when = "tomorrow" if label == "24h" else "today"
+            appointment_time = start_time.strftime("%I:%M %p").lstrip("0")
+            sends = []
+            if client.get("phone"):
+                sends.append(SMSService().send_appointment_reminder(
+                    client["phone"], client["first_name"], appointment_time, when=when
+                ))
+            if client.get("email"):
+                sends.append(EmailService().send_notification_email(
+                    client["email"],
+                    f"Reminder: {appointment.get('title', 'your appointment')} {when} at {appointment_time}",
+                    f"<p>Hi {client['first_name']},</p><p>This is a reminder about your appointment "
+                    f"{when} at {appointment_time}. Call us at (555) 123-4567 if you need to reschedule.</p>",
+                    is_html=True
+                ))
+            for result in await asyncio.gather(*sends, return_exceptions=True):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to send {label} reminder for appointment {appointment_id}: {result}")
+        except Exception as e:
+            logger.error(f"Reminder {label} for appointment {appointment_id} failed: {e}")
+
+    async def run(self, get_db):
+        """Background loop: tick the wheel every minute and reload it periodically"""
+        self.db = await get_db()
+        next_reload = datetime.utcnow()
+        while True:
+            now = datetime.utcnow()
+            if now >= next_reload:
+                try:
+                    await self.reload()
+                except Exception as e:
+                    logger.error(f"Failed to load appointment reminders: {e}")
+                next_reload = now + timedelta(minutes=REMINDER_RELOAD_MINUTES)
+            for (appointment_id, label), start_time in self.wheel.advance(now):
+                task = asyncio.create_task(self.fire(appointment_id, label, start_time))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+            await asyncio.sleep(60 - now.second - now.microsecond / 1_000_000)
+
+reminder_scheduler = ReminderScheduler()
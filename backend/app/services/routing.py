@@ -0,0 +1,115 @@
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from decouple import config
+
+Point = Tuple[float, float]
+
+# Straight-line distance times a detour factor at an average urban speed; a
+# routing engine could replace travel_minutes without touching the solver
+ROUTING_AVG_SPEED_KMH = float(config("ROUTING_AVG_SPEED_KMH", default=45))
+ROUTING_DETOUR_FACTOR = float(config("ROUTING_DETOUR_FACTOR", default=1.3))
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(a: Point, b: Point) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+def travel_minutes(a: Point, b: Point) -> float:
+    return haversine_km(a, b) * ROUTING_DETOUR_FACTOR / ROUTING_AVG_SPEED_KMH * 60
+
+def travel_matrix(points: Sequence[Point]) -> List[List[float]]:
+    """Symmetric matrix of estimated drive minutes between every pair of points"""
+    size = len(points)
+    matrix = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(i + 1, size):
+            matrix[i][j] = matrix[j][i] = travel_minutes(points[i], points[j])
+    return matrix
+
+def route_minutes(order: Sequence[int], matrix: List[List[float]]) -> float:
+    return sum(matrix[order[i]][order[i + 1]] for i in range(len(order) - 1))
+
+def nearest_neighbor(matrix: List[List[float]], start: int = 0) -> List[int]:
+    order = [start]
+    remaining = set(range(len(matrix))) - {start}
+    while remaining:
+        last = order[-1]
+        following = min(remaining, key=lambda j: matrix[last][j])
+        order.append(following)
+        remaining.remove(following)
+    return order
+
+def two_opt(order: List[int], matrix: List[List[float]]) -> List[int]:
+    """Reverse segments while that shortens the open path; order[0] stays first"""
+    order = list(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(order) - 1):
+            for k in range(i + 1, len(order)):
+                a, b, c = order[i - 1], order[i], order[k]
+                before = matrix[a][b]
+                after = matrix[a][c]
+                if k + 1 < len(order):
+                    d = order[k + 1]
+                    before += matrix[c][d]
+                    after += matrix[b][d]
+                if after < before - 1e-9:
+                    order[i:k + 1] = reversed(order[i:k + 1])
+                    improved = True
+    return order
+
+def solve_route(matrix: List[List[float]], has_depot: bool) -> List[int]:
+    """Visiting order over the matrix; index 0 is the depot when has_depot is set
+
+    Without a depot the crew can start anywhere, so every stop is tried as the
+    starting point (day plans are a handful of stops) and the shortest kept.
+    """
+    if len(matrix) <= 2:
+        return list(range(len(matrix)))
+    starts = [0] if has_depot else range(len(matrix))
+    candidates = [two_opt(nearest_neighbor(matrix, start), matrix) for start in starts]
+    return min(candidates, key=lambda order: route_minutes(order, matrix))
+
+def plan_day(stops: List[Dict[str, Any]], points: List[Point], depot: Optional[Point],
+             day_start: datetime) -> Dict[str, Any]:
+    """Order one contractor's stops and lay them out back to back
+
+    stops are appointment documents in their current (start_time) order, with
+    points their coordinates. The first stop begins at day_start (the drive
+    from the depot happens before it) and each stop keeps its booked duration.
+    """
+    all_points = ([depot] if depot else []) + points
+    offset = 1 if depot else 0
+    matrix = travel_matrix(all_points)
+    current = list(range(len(all_points)))
+    order = solve_route(matrix, has_depot=depot is not None)
+
+    plan = []
+    clock = day_start
+    previous = None
+    for index in order:
+        if index < offset:
+            previous = index
+            continue
+        stop = stops[index - offset]
+        drive = matrix[previous][index] if previous is not None else 0.0
+        if plan:
+            clock += timedelta(minutes=drive)
+        duration = stop["end_time"] - stop["start_time"]
+        plan.append({
+            "appointment": stop,
+            "drive_minutes": round(drive, 1),
+            "proposed_start": clock,
+            "proposed_end": clock + duration
+        })
+        clock += duration
+        previous = index
+
+    return {
+        "stops": plan,
+        "current_drive_minutes": round(route_minutes(current, matrix), 1),
+        "optimized_drive_minutes": round(route_minutes(order, matrix), 1)
+    }
@@ -0,0 +1,192 @@
+import asyncio
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from decouple import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How long a contractor's loaded schedule is trusted before it is re-read, which
+# bounds how stale another worker's bookings can be in availability results
+SCHEDULE_CACHE_SECONDS = float(config("SCHEDULE_CACHE_SECONDS", default=60))
+# Days of bookings loaded either side of a requested range, so nearby queries
+# reuse the index without reading the contractor's whole history
+SCHEDULE_WINDOW_DAYS = int(config("SCHEDULE_WINDOW_DAYS", default=31))
+# Longest booking accepted; overlap queries only scan bookings starting this
+# far before the requested range instead of the contractor's whole history
+MAX_APPOINTMENT_DAYS = int(config("MAX_APPOINTMENT_DAYS", default=14))
+MAX_APPOINTMENT_LENGTH = timedelta(days=MAX_APPOINTMENT_DAYS)
+# Appointments in these states do not occupy the contractor
+NON_BLOCKING_STATUSES = ("cancelled", "rescheduled")
+# Updates touching these fields can create or move a booking
+SCHEDULING_FIELDS = frozenset({"contractor_id", "start_time", "end_time", "status"})
+
+class IntervalIndex:
+    """One contractor's booked intervals, sorted by start time
+
+    Alongside the sorted list it tracks the longest booking, so an overlap query
+    only has to look at intervals starting in (start - longest, end): two
+    bisections plus the handful of candidates in that window, instead of the
+    contractor's whole history. It stays exact when legacy data already overlaps.
+    """
+
+    def __init__(self):
+        self.intervals: List[Tuple[datetime, datetime, str]] = []
+        self.by_id: Dict[str, Tuple[datetime, datetime, str]] = {}
+        self.longest = timedelta(0)
+
+    def __len__(self) -> int:
+        return len(self.intervals)
+
+    def add(self, appointment_id: str, start: datetime, end: datetime):
+        self.remove(appointment_id)
+        entry = (start, end, appointment_id)
+        insort(self.intervals, entry)
+        self.by_id[appointment_id] = entry
+        self.longest = max(self.longest, end - start)
+
+    def remove(self, appointment_id: str):
+        entry = self.by_id.pop(appointment_id, None)
+        if entry:
+            position = bisect_left(self.intervals, entry)
+            del self.intervals[position]
+
+    def overlapping(self, start: datetime, end: datetime, exclude: Optional[str] = None) -> List[Tuple[datetime, datetime, str]]:
+        """Intervals that overlap [start, end), ordered by start"""
+        lo = bisect_left(self.intervals, (start - self.longest,))
+        hi = bisect_left(self.intervals, (end,))
+        return [
+            entry for entry in self.intervals[lo:hi]
+            if entry[1] > start and entry[2] != exclude
+        ]
+
+def _blocks(appointment: Dict[str, Any]) -> bool:
+    return (
+        bool(appointment.get("contractor_id"))
+        and appointment.get("status", "scheduled") not in NON_BLOCKING_STATUSES
+        and isinstance(appointment.get("start_time"), datetime)
+        and isinstance(appointment.get("end_time"), datetime)
+    )
+
+class SchedulingEngine:
+    """Conflict checks against the database and free-slot search over cached indexes
+
+    conflicts() is the authority for writes: it asks MongoDB directly through the
+    (contractor_id, start_time, end_time) index, so bookings made by other
+    workers or instances are always seen. Callers hold lock(contractor_id)
+    across check-then-write to serialize requests in this process, stamp the
+    written booking with booked_at, and settle races with other processes
+    through later_overlaps() once written.
+
+    availability() reads a per-contractor IntervalIndex loaded for a window of
+    SCHEDULE_WINDOW_DAYS around the requested range, reloaded after
+    SCHEDULE_CACHE_SECONDS and kept current by booked()/removed().
+    """
+
+    def __init__(self):
+        self._indexes: Dict[str, Tuple[float, datetime, datetime, IntervalIndex]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def lock(self, contractor_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(contractor_id, asyncio.Lock())
+
+    async def index_for(self, db, contractor_id: str, start: datetime, end: datetime) -> IntervalIndex:
+        """The contractor's bookings overlapping at least [start, end)"""
+        cached = self._indexes.get(contractor_id)
+        if (cached and time.monotonic() - cached[0] < SCHEDULE_CACHE_SECONDS
+                and cached[1] <= start and end <= cached[2]):
+            return cached[3]
+        window_start = start - timedelta(days=SCHEDULE_WINDOW_DAYS)
+        window_end = end + timedelta(days=SCHEDULE_WINDOW_DAYS)
+        index = IntervalIndex()
+        async for appointment in self._overlapping(db, contractor_id, window_start, window_end):
+            index.add(str(appointment["_id"]), appointment["start_time"], appointment["end_time"])
+        self._indexes[contractor_id] = (time.monotonic(), window_start, window_end, index)
+        return index
+
+    def _overlapping(self, db, contractor_id: str, start: datetime, end: datetime,
+                     exclude_id: Optional[str] = None):
+        query = {
+            "contractor_id": contractor_id,
+            "status": {"$nin": list(NON_BLOCKING_STATUSES)},
+            "start_time": {"$lt": end, "$gte": start - MAX_APPOINTMENT_LENGTH},
+            "end_time": {"$gt": start}
+        }
+        if exclude_id:
+            query["_id"] = {"$ne": ObjectId(exclude_id)}
+        return db.appointments.find(query, {"start_time": 1, "end_time": 1, "booked_at": 1}).sort("start_time", 1)
+
+    async def conflicts(self, db, contractor_id: str, start: datetime, end: datetime,
+                        exclude_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Bookings in the database that overlap [start, end), ordered by start"""
+        return [
+            {"id": str(appointment["_id"]), "start_time": appointment["start_time"], "end_time": appointment["end_time"]}
+            async for appointment in self._overlapping(db, contractor_id, start, end, exclude_id)
+        ]
+
+    async def later_overlaps(self, db, appointment: Dict[str, Any], checked_at: datetime) -> bool:
+        """Whether a just-written booking lost a race to an overlapping one
+
+        Two workers can both pass conflicts() before either writes. Only
+        bookings written after this request's check at `checked_at` can have
+        slipped past it; overlaps that were already there (allowed with
+        allow_conflicts, or legacy) are not a race. Among the racers, ordering
+        by (booked_at, _id) makes the later write, and only that one, back out.
+        """
+        # Stored datetimes are truncated to milliseconds
+        checked_at = checked_at.replace(microsecond=checked_at.microsecond // 1000 * 1000)
+        mine = (appointment.get("booked_at") or datetime.min, appointment["_id"])
+        async for other in self._overlapping(
+            db, appointment["contractor_id"], appointment["start_time"], appointment["end_time"],
+            str(appointment["_id"])
+        ):
+            booked_at = other.get("booked_at")
+            if booked_at and booked_at >= checked_at and (booked_at, other["_id"]) < mine:
+                return True
+        return False
+
+    def booked(self, appointment: Dict[str, Any], previous_contractor_id: Optional[str] = None):
+        """Reflect a created or updated appointment in any loaded index"""
+        appointment_id = str(appointment["_id"])
+        if previous_contractor_id and previous_contractor_id != appointment.get("contractor_id"):
+            self.removed(previous_contractor_id, appointment_id)
+        cached = self._indexes.get(appointment.get("contractor_id"))
+        if not cached:
+            return
+        index = cached[3]
+        if _blocks(appointment) and appointment["start_time"] < cached[2] and appointment["end_time"] > cached[1]:
+            index.add(appointment_id, appointment["start_time"], appointment["end_time"])
+        else:
+            index.remove(appointment_id)
+
+    def removed(self, contractor_id: Optional[str], appointment_id: str):
+        cached = self._indexes.get(contractor_id)
+        if cached:
+            cached[3].remove(str(appointment_id))
+
+    async def availability(self, db, contractor_id: str, start: datetime, end: datetime,
+                           day_start_hour: int, day_end_hour: int,
+                           min_minutes: int) -> List[Dict[str, datetime]]:
+        """Free windows inside working hours between start and end"""
+        index = await self.index_for(db, contractor_id, start, end)
+        min_length = timedelta(minutes=min_minutes)
+        free = []
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day < end:
+            window_start = max(start, day.replace(hour=day_start_hour))
+            window_end = min(end, day.replace(hour=day_end_hour) if day_end_hour < 24 else day + timedelta(days=1))
+            cursor = window_start
+            if window_start < window_end:
+                for busy_start, busy_end, _ in index.overlapping(window_start, window_end):
+                    if busy_start - cursor >= min_length:
+                        free.append({"start": cursor, "end": busy_start})
+                    cursor = max(cursor, busy_end)
+                if window_end - cursor >= min_length:
+                    free.append({"start": cursor, "end": window_end})
+            day += timedelta(days=1)
+        return free
+
+scheduling_engine = SchedulingEngine()
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from pymongo import ReturnDocument
+from decouple import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Numbers reserved per counter round trip; unused ones are skipped when the
+# process restarts or the day rolls over (1 gives gap-free numbering at one
+# round trip per document)
+SEQUENCE_BLOCK_SIZE = int(config("SEQUENCE_BLOCK_SIZE", default=20))
+SEQUENCE_WIDTH = int(config("SEQUENCE_WIDTH", default=5))
+
+class SequenceAllocator:
+    """Daily document numbers (EST-20240115-00042) from atomic counters
+
+    Each prefix and day has a document in the counters collection. A process
+    reserves a block of SEQUENCE_BLOCK_SIZE values with one $inc upsert and
+    hands them out from memory, so most numbers cost no database round trip.
+    Blocks never overlap, which makes numbers unique across processes, and
+    they increase within a process. Numbers from different processes can
+    interleave, and a block left unused leaves a gap. The unique indexes on
+    estimate_number and contract_number back this up.
+    """
+
+    def __init__(self, block_size: int = SEQUENCE_BLOCK_SIZE):
+        self.block_size = block_size
+        # counter id -> (next value, last reserved value)
+        self._blocks: Dict[str, Tuple[int, int]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def _reserve(self, db, counter_id: str) -> Tuple[int, int]:
+        counter = await db.counters.find_one_and_update(
+            {"_id": counter_id},
+            {"$inc": {"value": self.block_size}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        last = counter["value"]
+        return last - self.block_size + 1, last
+
+    def _forget_other_days(self, prefix: str, counter_id: str):
+        for stale in [key for key in self._blocks if key.startswith(f"{prefix}-") and key != counter_id]:
+            del self._blocks[stale]
+            self._locks.pop(stale, None)
+
+    async def next_value(self, db, prefix: str, day: str) -> int:
+        counter_id = f"{prefix}-{day}"
+        lock = self._locks.setdefault(counter_id, asyncio.Lock())
+        async with lock:
+            block = self._blocks.get(counter_id)
+            if block is None or block[0] > block[1]:
+                self._forget_other_days(prefix, counter_id)
+                block = await self._reserve(db, counter_id)
+            self._blocks[counter_id] = (block[0] + 1, block[1])
+            return block[0]
+
+    async def next_number(self, db, prefix: str, now: Optional[datetime] = None) -> str:
+        day = (now or datetime.now()).strftime("%Y%m%d")
+        value = await self.next_value(db, prefix, day)
+        return f"{prefix}-{day}-{value:0{SEQUENCE_WIDTH}d}"
+
+sequence_allocator = SequenceAllocator()
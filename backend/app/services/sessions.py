@@ -0,0 +1,128 @@
+import calendar
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from bson import ObjectId
+from pymongo import ReturnDocument
+from decouple import config
+import logging
+
+from ..models.user import User
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(config("REFRESH_TOKEN_EXPIRE_DAYS", default=30))
+
+def access_token_claims(user: User) -> Dict[str, Any]:
+    """Claims that let an access token be validated without a user lookup"""
+    roles = list(user.roles)
+    if user.is_admin and "admin" not in roles:
+        roles.append("admin")
+    return {
+        "typ": "access",
+        "sub": user.username,
+        "uid": str(user.id),
+        "ver": user.token_version,
+        "email": user.email,
+        "name": user.full_name,
+        "is_admin": user.is_admin,
+        "is_active": user.is_active,
+        "created_at": calendar.timegm(user.created_at.utctimetuple()),
+        "roles": roles,
+        "perms": list(user.permissions),
+    }
+
+def user_from_claims(payload: Dict[str, Any]) -> User:
+    """Rebuild the authenticated user from access token claims"""
+    return User(
+        _id=ObjectId(payload["uid"]),
+        username=payload["sub"],
+        email=payload["email"],
+        full_name=payload.get("name"),
+        is_active=payload.get("is_active", True),
+        is_admin=payload.get("is_admin", False),
+        token_version=payload.get("ver", 0),
+        roles=payload.get("roles", []),
+        permissions=payload.get("perms", []),
+        created_at=datetime.utcfromtimestamp(payload["created_at"]),
+        hashed_password="",
+    )
+
+def hash_refresh_token(token: str) -> str:
+    """Refresh tokens are high-entropy random strings, so a plain SHA-256 is enough"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class SessionService:
+    """Rotating refresh tokens stored hashed in refresh_sessions
+
+    Each login starts a token family. Refreshing marks the presented token as
+    rotated and issues its successor in the same family; presenting a rotated
+    or revoked token again is treated as theft and revokes the whole family.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def issue(self, user: User, family_id: Optional[str] = None) -> str:
+        token = secrets.token_urlsafe(48)
+        now = datetime.utcnow()
+        await self.db.refresh_sessions.insert_one({
+            "token_hash": hash_refresh_token(token),
+            "family_id": family_id or secrets.token_hex(16),
+            "user_id": user.id,
+            "token_version": user.token_version,
+            "created_at": now,
+            "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+            "rotated_at": None,
+            "revoked_at": None,
+        })
+        return token
+
+    async def rotate(self, token: str) -> Optional[Tuple[User, str]]:
+        """Exchange a refresh token for (user, new refresh token), or None if it is not valid"""
+        token_hash = hash_refresh_token(token)
+        now = datetime.utcnow()
+        session = await self.db.refresh_sessions.find_one_and_update(
+            {"token_hash": token_hash, "rotated_at": None, "revoked_at": None, "expires_at": {"$gt": now}},
+            {"$set": {"rotated_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if session is None:
+            stale = await self.db.refresh_sessions.find_one({"token_hash": token_hash})
+            if stale is not None and (stale.get("rotated_at") or stale.get("revoked_at")):
+                logger.warning(f"Refresh token reuse detected for user {stale['user_id']}, revoking session family")
+                await self.revoke_family(stale["family_id"])
+            return None
+
+        user_doc = await self.db.users.find_one({"_id": session["user_id"]})
+        if not user_doc:
+            return None
+        user = User(**user_doc)
+        if not user.is_active or user.token_version != session["token_version"]:
+            await self.revoke_family(session["family_id"])
+            return None
+
+        return user, await self.issue(user, session["family_id"])
+
+    async def revoke(self, token: str) -> bool:
+        """Revoke the session family the refresh token belongs to (logout)"""
+        session = await self.db.refresh_sessions.find_one({"token_hash": hash_refresh_token(token)})
+        if session is None:
+            return False
+        await self.revoke_family(session["family_id"])
+        return True
+
+    async def revoke_family(self, family_id: str):
+        await self.db.refresh_sessions.update_many(
+            {"family_id": family_id, "revoked_at": None},
+            {"$set": {"revoked_at": datetime.utcnow()}}
+        )
+
+    async def revoke_user(self, user_id: ObjectId) -> int:
+        """Revoke every live session of a user"""
+        result = await self.db.refresh_sessions.update_many(
+            {"user_id": user_id, "revoked_at": None},
+            {"$set": {"revoked_at": datetime.utcnow()}}
+        )
+        return result.modified_count
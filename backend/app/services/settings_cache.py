@@ -0,0 +1,83 @@
+import asyncio
+import time
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+from decouple import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_POLL_SECONDS = float(config("SETTINGS_POLL_SECONDS", default=5))
+
+def _freeze(value: Any) -> Any:
+    """Read-only deep copy: dicts become mapping proxies and lists become tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+class SettingsSnapshot:
+    """Immutable view of the settings document at one settings_version"""
+
+    __slots__ = ("data", "version", "etag")
+
+    def __init__(self, document: Optional[dict]):
+        self.data: Optional[Mapping[str, Any]] = _freeze(document) if document else None
+        self.version = document.get("settings_version", 0) if document else 0
+        doc_id = document.get("_id") if document else "default"
+        self.etag = f'W/"settings-{doc_id}-{self.version}"'
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default) if self.data is not None else default
+
+    def __bool__(self):
+        return self.data is not None
+
+class SettingsCache:
+    """Process-wide cache of the single settings document
+
+    Readers get an immutable snapshot. Writers bump settings_version and store
+    the new document here; other instances notice the new version stamp with a
+    cheap projected read at most once every SETTINGS_POLL_SECONDS.
+    """
+
+    def __init__(self, poll_seconds: float = SETTINGS_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._snapshot: Optional[SettingsSnapshot] = None
+        self._checked_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get(self, db) -> SettingsSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.poll_seconds:
+            return snapshot
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Another request may have refreshed while we waited
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.poll_seconds:
+                return self._snapshot
+
+            if self._snapshot is not None:
+                stamp = await db.settings.find_one({}, {"settings_version": 1})
+                if self._snapshot.etag == SettingsSnapshot(stamp).etag:
+                    self._checked_at = time.monotonic()
+                    return self._snapshot
+
+            return self.store(await db.settings.find_one({}))
+
+    def store(self, document: Optional[dict]) -> SettingsSnapshot:
+        """Replace the cached snapshot (called by writers with the document they just saved)"""
+        snapshot = SettingsSnapshot(document)
+        if self._snapshot is None or snapshot.etag != self._snapshot.etag:
+            logger.info(f"Settings snapshot loaded at version {snapshot.version}")
+        self._snapshot = snapshot
+        self._checked_at = time.monotonic()
+        return snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+settings_cache = SettingsCache()
@@ -1,206 +1,251 @@
-from twilio.rest import Client
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import httpx
 from decouple import config
-from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+SMS_PROVIDER = config("SMS_PROVIDER", default="twilio")  # "twilio" or "fake"
+SMS_MAX_CONCURRENCY = int(config("SMS_MAX_CONCURRENCY", default=10))
+# Twilio queues anything above a sender's throughput (1 msg/s for a long code);
+# pacing here keeps campaigns from piling up in that queue or getting 429s
+SMS_MESSAGES_PER_SECOND = float(config("SMS_MESSAGES_PER_SECOND", default=1.0))
+SMS_TIMEOUT_SECONDS = float(config("SMS_TIMEOUT_SECONDS", default=10.0))
+SMS_MAX_RETRIES = int(config("SMS_MAX_RETRIES", default=2))
+
+TWILIO_API_URL = "https://api.twilio.com/2010-04-01"
+
+class SMSError(Exception):
+    """A message the provider refused or could not accept"""
+
+class SenderPacer:
+    """Spaces sends from one phone number to at most `rate` per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class TwilioTransport:
+    """Twilio REST API over one shared keep-alive connection pool"""
+
+    def __init__(self, account_sid: str, auth_token: str):
+        self.account_sid = account_sid
+        self.client = httpx.AsyncClient(
+            base_url=f"{TWILIO_API_URL}/Accounts/{account_sid}",
+            auth=(account_sid, auth_token),
+            timeout=SMS_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=SMS_MAX_CONCURRENCY,
+                max_keepalive_connections=SMS_MAX_CONCURRENCY
+            ),
+        )
+
+    async def send(self, from_: str, to: str, body: str) -> str:
+        # Only retried when Twilio certainly did not create the message: the
+        # connection failed before the request went out, or it answered 429.
+        # A 5xx or a timeout after sending may still have queued it, and a
+        # retry would text the customer twice.
+        for attempt in range(SMS_MAX_RETRIES + 1):
+            try:
+                response = await self.client.post("/Messages.json", data={"From": from_, "To": to, "Body": body})
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                if attempt < SMS_MAX_RETRIES:
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                raise SMSError(f"Could not reach Twilio: {e!r}") from e
+            except httpx.HTTPError as e:
+                raise SMSError(f"Twilio request failed after it was sent, not retried: {e!r}") from e
+            if response.status_code == 429 and attempt < SMS_MAX_RETRIES:
+                retry_after = response.headers.get("Retry-After")
+                await asyncio.sleep(float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt)
+                continue
+            if response.status_code >= 400:
+                try:
+                    detail = response.json().get("message", response.text)
+                except ValueError:
+                    detail = response.text
+                raise SMSError(f"Twilio returned {response.status_code}: {detail}")
+            return response.json()["sid"]
+
+    async def list_messages(self, to: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        params = {"PageSize": limit}
+        if to:
+            params["To"] = to
+        response = await self.client.get("/Messages.json", params=params)
+        if response.status_code >= 400:
+            raise SMSError(f"Twilio returned {response.status_code}: {response.text}")
+        return [
+            {
+                "sid": msg["sid"],
+                "from": msg["from"],
+                "to": msg["to"],
+                "body": msg["body"],
+                "status": msg["status"],
+                "date_sent": msg.get("date_sent"),
+                "date_created": msg.get("date_created")
+            }
+            for msg in response.json().get("messages", [])
+        ]
+
+    async def close(self):
+        await self.client.aclose()
+
+@dataclass
+class FakeSMSTransport:
+    """In-memory provider for local development and tests; nothing leaves the process"""
+
+    sent: List[Dict[str, Any]] = field(default_factory=list)
+    fail_numbers: set = field(default_factory=set)
+
+    async def send(self, from_: str, to: str, body: str) -> str:
+        if to in self.fail_numbers:
+            raise SMSError(f"Fake provider rejected {to}")
+        sid = f"SMfake{len(self.sent) + 1:08d}"
+        self.sent.append({
+            "sid": sid, "from": from_, "to": to, "body": body, "status": "sent",
+            "date_sent": None, "date_created": None
+        })
+        return sid
+
+    async def list_messages(self, to: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        messages = [msg for msg in reversed(self.sent) if not to or msg["to"] == to]
+        return messages[:limit]
+
+    async def close(self):
+        pass
+
+# Shared across SMSService instances so every request reuses the same pool,
+# concurrency limit and per-number pacing
+_transport = None
+_send_slots: Optional[asyncio.Semaphore] = None
+_pacers: Dict[str, SenderPacer] = {}
+
+def get_sms_transport():
+    """The process-wide transport, or None when Twilio is not configured"""
+    global _transport
+    if _transport is None:
+        if SMS_PROVIDER == "fake":
+            _transport = FakeSMSTransport()
+        else:
+            account_sid = config("TWILIO_ACCOUNT_SID", default="")
+            auth_token = config("TWILIO_AUTH_TOKEN", default="")
+            if account_sid and auth_token:
+                _transport = TwilioTransport(account_sid, auth_token)
+    return _transport
+
+def _get_send_slots() -> asyncio.Semaphore:
+    global _send_slots
+    if _send_slots is None:
+        _send_slots = asyncio.Semaphore(SMS_MAX_CONCURRENCY)
+    return _send_slots
+
+async def close_sms_transport():
+    """Close the shared HTTP pool (called on application shutdown)"""
+    global _transport, _send_slots
+    if _transport is not None:
+        await _transport.close()
+        _transport = None
+    _send_slots = None
+    _pacers.clear()
+
 class SMSService:
     def __init__(self):
-        self.account_sid = config("TWILIO_ACCOUNT_SID", default="")
-        self.auth_token = config("TWILIO_AUTH_TOKEN", default="")
         self.phone_number = config("TWILIO_PHONE_NUMBER", default="")
-        
-        if self.account_sid and self.auth_token:
-            self.client = Client(self.account_sid, self.auth_token)
-        else:
-            self.client = None
+        self.transport = get_sms_transport()
+
+        if not self.transport:
             logger.warning("Twilio credentials not configured - SMS service disabled")
 
-    async def send_welcome_sms(self, to_phone: str, client_name: str):
-        """Send welcome SMS to new leads"""
-        if not self.client:
+    async def _send(self, to_phone: str, message: str, kind: str) -> bool:
+        if not self.transport:
             logger.warning("SMS service not configured")
             return False
-        
+
+        pacer = _pacers.setdefault(self.phone_number, SenderPacer(SMS_MESSAGES_PER_SECOND))
         try:
-            message = f"Hi {client_name}! Thanks for your interest in our services. We'll contact you within 24 hours to discuss your project. - StoneCraft Team"
-            
-            self.client.messages.create(
-                body=message,
-                from_=self.phone_number,
-                to=to_phone
-            )
-            
-            logger.info(f"Welcome SMS sent to {to_phone}")
+            async with _get_send_slots():
+                await pacer.wait()
+                await self.transport.send(self.phone_number, to_phone, message)
+
+            logger.info(f"{kind} SMS sent to {to_phone}")
             return True
-            
+
         except Exception as e:
-            logger.error(f"Failed to send welcome SMS to {to_phone}: {e}")
+            logger.error(f"Failed to send {kind.lower()} SMS to {to_phone}: {e}")
             return False
 
-    async def send_appointment_reminder(self, to_phone: str, client_name: str, appointment_time: str):
+    async def send_many(self, messages: Iterable[Tuple[str, str]]) -> List[bool]:
+        """Send (to_phone, message) pairs concurrently, within the shared limits
+
+        Results are in input order; one failed number does not stop the rest.
+        """
+        return await asyncio.gather(*(self._send(to_phone, message, "Batch") for to_phone, message in messages))
+
+    async def send_welcome_sms(self, to_phone: str, client_name: str):
+        """Send welcome SMS to new leads"""
+        message = f"Hi {client_name}! Thanks for your interest in our services. We'll contact you within 24 hours to discuss your project. - StoneCraft Team"
+        return await self._send(to_phone, message, "Welcome")
+
+    async def send_appointment_reminder(self, to_phone: str, client_name: str, appointment_time: str, when: str = "tomorrow"):
         """Send appointment reminder SMS"""
-        if not self.client:
-            logger.warning("SMS service not configured")
-            return False
-        
-        try:
-            message = f"Hi {client_name}, this is a reminder about your consultation appointment tomorrow at {appointment_time}. Reply CONFIRM to confirm or call us to reschedule. - StoneCraft"
-            
-            self.client.messages.create(
-                body=message,
-                from_=self.phone_number,
-                to=to_phone
-            )
-            
-            logger.info(f"Appointment reminder SMS sent to {to_phone}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to send appointment reminder to {to_phone}: {e}")
-            return False
+        message = f"Hi {client_name}, this is a reminder about your consultation appointment {when} at {appointment_time}. Reply CONFIRM to confirm or call us to reschedule. - StoneCraft"
+        return await self._send(to_phone, message, "Appointment reminder")
 
     async def send_estimate_notification(self, to_phone: str, client_name: str, estimate_number: str):
         """Send estimate ready notification SMS"""
-        if not self.client:
-            logger.warning("SMS service not configured")
-            return False
-        
-        try:
-            message = f"Hi {client_name}, your estimate #{estimate_number} is ready! Check your email for details or call us at (555) 123-4567. - StoneCraft"
-            
-            self.client.messages.create(
-                body=message,
-                from_=self.phone_number,
-                to=to_phone
-            )
-            
-            logger.info(f"Estimate notification SMS sent to {to_phone}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to send estimate notification to {to_phone}: {e}")
-            return False
+        message = f"Hi {client_name}, your estimate #{estimate_number} is ready! Check your email for details or call us at (555) 123-4567. - StoneCraft"
+        return await self._send(to_phone, message, "Estimate notification")
 
     async def send_contract_reminder(self, to_phone: str, client_name: str, contract_number: str):
         """Send contract signing reminder SMS"""
-        if not self.client:
-            logger.warning("SMS service not configured")
-            return False
-        
-        try:
-            message = f"Hi {client_name}, your contract #{contract_number} is ready for signature. Please check your email or call us to schedule signing. - StoneCraft"
-            
-            self.client.messages.create(
-                body=message,
-                from_=self.phone_number,
-                to=to_phone
-            )
-            
-            logger.info(f"Contract reminder SMS sent to {to_phone}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to send contract reminder to {to_phone}: {e}")
-            return False
+        message = f"Hi {client_name}, your contract #{contract_number} is ready for signature. Please check your email or call us to schedule signing. - StoneCraft"
+        return await self._send(to_phone, message, "Contract reminder")
 
     async def send_payment_reminder(self, to_phone: str, client_name: str, amount: float, due_date: str):
         """Send payment reminder SMS"""
-        if not self.client:
-            logger.warning("SMS service not configured")
-            return False
-        
-        try:
-            message = f"Hi {client_name}, friendly reminder: Payment of ${amount:.2f} is due on {due_date}. Pay online or call (555) 123-4567. Thanks! - StoneCraft"
-            
-            self.client.messages.create(
-                body=message,
-                from_=self.phone_number,
-                to=to_phone
-            )
-            
-            logger.info(f"Payment reminder SMS sent to {to_phone}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to send payment reminder to {to_phone}: {e}")
-            return False
+        message = f"Hi {client_name}, friendly reminder: Payment of ${amount:.2f} is due on {due_date}. Pay online or call (555) 123-4567. Thanks! - StoneCraft"
+        return await self._send(to_phone, message, "Payment reminder")
 
     async def send_project_update(self, to_phone: str, client_name: str, update_message: str):
         """Send project status update SMS"""
-        if not self.client:
-            logger.warning("SMS service not configured")
-            return False
-        
-        try:
-            message = f"Hi {client_name}, project update: {update_message} Have questions? Call (555) 123-4567. - StoneCraft"
-            
-            self.client.messages.create(
-                body=message,
-                from_=self.phone_number,
-                to=to_phone
-            )
-            
-            logger.info(f"Project update SMS sent to {to_phone}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to send project update to {to_phone}: {e}")
-            return False
+        message = f"Hi {client_name}, project update: {update_message} Have questions? Call (555) 123-4567. - StoneCraft"
+        return await self._send(to_phone, message, "Project update")
 
     async def send_custom_sms(self, to_phone: str, message: str):
         """Send custom SMS message"""
-        if not self.client:
-            logger.warning("SMS service not configured")
-            return False
-        
-        try:
-            # Add company signature if not present
-            if "StoneCraft" not in message:
-                message += " - StoneCraft"
-            
-            self.client.messages.create(
-                body=message,
-                from_=self.phone_number,
-                to=to_phone
-            )
-            
-            logger.info(f"Custom SMS sent to {to_phone}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to send custom SMS to {to_phone}: {e}")
-            return False
+        # Add company signature if not present
+        if "StoneCraft" not in message:
+            message += " - StoneCraft"
+        return await self._send(to_phone, message, "Custom")
 
     def is_configured(self) -> bool:
         """Check if SMS service is properly configured"""
-        return self.client is not None and bool(self.phone_number)
+        return self.transport is not None and bool(self.phone_number)
 
     async def get_message_history(self, phone_number: Optional[str] = None):
         """Get SMS message history"""
-        if not self.client:
+        if not self.transport:
             return []
-        
+
         try:
             if phone_number:
-                messages = self.client.messages.list(to=phone_number, limit=50)
-            else:
-                messages = self.client.messages.list(limit=100)
-            
-            return [
-                {
-                    "sid": msg.sid,
-                    "from": msg.from_,
-                    "to": msg.to,
-                    "body": msg.body,
-                    "status": msg.status,
-                    "date_sent": msg.date_sent.isoformat() if msg.date_sent else None,
-                    "date_created": msg.date_created.isoformat() if msg.date_created else None
-                }
-                for msg in messages
-            ]
-            
+                return await self.transport.list_messages(to=phone_number, limit=50)
+            return await self.transport.list_messages(limit=100)
+
         except Exception as e:
             logger.error(f"Failed to get message history: {e}")
             return []
@@ -0,0 +1,261 @@
+import asyncio
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from decouple import config
+import logging
+
+from ..models.contract import PaymentStatus
+from .metrics import MetricsService
+from .payment_ledger import PaymentLedger, handle_charge_event, handle_payment_intent_event
+from .stripe_service import StripeService
+
+logger = logging.getLogger(__name__)
+
+STRIPE_EVENT_WORKERS = int(config("STRIPE_EVENT_WORKERS", default=4))
+STRIPE_EVENT_MAX_ATTEMPTS = int(config("STRIPE_EVENT_MAX_ATTEMPTS", default=5))
+# How often stored-but-unprocessed events (other workers' crashes, retries) are picked up
+STRIPE_EVENT_SWEEP_SECONDS = float(config("STRIPE_EVENT_SWEEP_SECONDS", default=30))
+# A claimed event still "processing" after this long is assumed abandoned
+STRIPE_EVENT_STALE_SECONDS = float(config("STRIPE_EVENT_STALE_SECONDS", default=300))
+STRIPE_BACKFILL_MAX_EVENTS = int(config("STRIPE_BACKFILL_MAX_EVENTS", default=10000))
+
+RETRYABLE_STATUSES = ("pending", "failed")
+
+# Handler signature: (db, event payload, replay) where replay is True when the
+# event had already been processed once (so non-idempotent effects are skipped)
+EventHandler = Callable[[Any, Dict[str, Any], bool], Awaitable[None]]
+
+def event_contract_id(event: Dict[str, Any]) -> Optional[str]:
+    data = (event.get("data") or {}).get("object") or {}
+    return (data.get("metadata") or {}).get("contract_id") or None
+
+def partition_key(document: Dict[str, Any]) -> str:
+    """Events for one contract share a key and are processed serially, oldest first"""
+    if document.get("contract_id"):
+        return f"contract:{document['contract_id']}"
+    return f"event:{document['_id']}"
+
+def partition_query(key: str) -> Dict[str, Any]:
+    kind, _, value = key.partition(":")
+    return {"contract_id": value} if kind == "contract" else {"_id": value}
+
+async def handle_payment_succeeded(db, event: Dict[str, Any], replay: bool):
+    payment_intent = event["data"]["object"]
+    contract_id = (payment_intent.get("metadata") or {}).get("contract_id")
+    await PaymentLedger(db).record_payment_intent(payment_intent)
+
+    if contract_id and ObjectId.is_valid(contract_id):
+        await db.contracts.update_one(
+            {"_id": ObjectId(contract_id)},
+            {
+                "$set": {
+                    "payment_status": PaymentStatus.PARTIAL,
+                    "updated_at": datetime.utcnow()
+                }
+            }
+        )
+        logger.info(f"Payment succeeded for contract {contract_id}")
+
+    if not replay:
+        await MetricsService(db).payment_collected(
+            payment_intent.get("amount_received", 0) / 100,
+            datetime.utcfromtimestamp(event["created"]) if event.get("created") else None
+        )
+
+async def handle_payment_failed(db, event: Dict[str, Any], replay: bool):
+    payment_intent = event["data"]["object"]
+    contract_id = (payment_intent.get("metadata") or {}).get("contract_id")
+    await PaymentLedger(db).record_payment_intent(payment_intent)
+    logger.warning(f"Payment failed for contract {contract_id}")
+
+class StripeEventProcessor:
+    """Durable, ordered processing of Stripe webhook events
+
+    The webhook only verifies the signature and stores the raw event in
+    stripe_events under its Stripe id (the _id index makes retries and
+    duplicate deliveries no-ops), then returns. A pool of workers does the
+    actual work: events are partitioned by contract, each partition always
+    maps to the same worker, and a worker drains a contract's pending events
+    sorted by Stripe's created time, so one contract's events apply in order
+    while different contracts proceed in parallel.
+
+    Each event is claimed atomically (pending/failed -> processing) before it
+    runs, so a multi-process deployment still applies it once. Failures are
+    retried by the sweeper up to STRIPE_EVENT_MAX_ATTEMPTS; a failure stops the
+    rest of that contract's backlog until it succeeds, keeping the order.
+    replay() re-queues stored events for backfills and fixes.
+    """
+
+    def __init__(self, workers: int = STRIPE_EVENT_WORKERS):
+        self.handlers: Dict[str, EventHandler] = {}
+        self.queues: List[asyncio.Queue] = [asyncio.Queue() for _ in range(workers)]
+        self._queued: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self.db = None
+
+    def on(self, event_type: str, handler: EventHandler):
+        self.handlers[event_type] = handler
+
+    def enqueue(self, key: str):
+        if key in self._queued:
+            return
+        self._queued.add(key)
+        self.queues[zlib.crc32(key.encode()) % len(self.queues)].put_nowait(key)
+
+    async def ingest(self, db, event: Dict[str, Any]) -> bool:
+        """Store a verified event and queue it; False when it was already received"""
+        document = {
+            "_id": event["id"],
+            "type": event.get("type"),
+            "created": event.get("created", 0),
+            "contract_id": event_contract_id(event),
+            "livemode": event.get("livemode", False),
+            "payload": event,
+            "status": "pending",
+            "attempts": 0,
+            "received_at": datetime.utcnow(),
+        }
+        try:
+            await db.stripe_events.insert_one(document)
+        except DuplicateKeyError:
+            logger.info(f"Ignoring duplicate Stripe event {event['id']}")
+            return False
+        if self._tasks:
+            self.enqueue(partition_key(document))
+        return True
+
+    async def _claim(self, event_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.stripe_events.find_one_and_update(
+            {"_id": event_id, "status": {"$in": list(RETRYABLE_STATUSES)}},
+            {"$set": {"status": "processing", "claimed_at": datetime.utcnow()}, "$inc": {"attempts": 1}}
+        )
+
+    async def _process(self, document: Dict[str, Any]) -> bool:
+        handler = self.handlers.get(document["type"])
+        try:
+            if handler:
+                await handler(self.db, document["payload"], document.get("processed_at") is not None)
+        except Exception as e:
+            logger.error(f"Stripe event {document['_id']} ({document['type']}) failed: {e}")
+            await self.db.stripe_events.update_one(
+                {"_id": document["_id"]},
+                {"$set": {"status": "failed", "error": str(e), "failed_at": datetime.utcnow()}}
+            )
+            return False
+        await self.db.stripe_events.update_one(
+            {"_id": document["_id"]},
+            {"$set": {"status": "processed" if handler else "ignored", "processed_at": datetime.utcnow(), "error": None}}
+        )
+        return True
+
+    async def drain(self, key: str):
+        """Process a partition's outstanding events in Stripe order"""
+        cursor = self.db.stripe_events.find(
+            {**partition_query(key), "status": {"$in": list(RETRYABLE_STATUSES)}, "attempts": {"$lt": STRIPE_EVENT_MAX_ATTEMPTS}},
+            {"_id": 1}
+        ).sort([("created", 1), ("_id", 1)])
+        for pending in await cursor.to_list(length=None):
+            document = await self._claim(pending["_id"])
+            if document and not await self._process(document):
+                break
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            key = await queue.get()
+            self._queued.discard(key)
+            try:
+                await self.drain(key)
+            except Exception as e:
+                logger.error(f"Stripe event worker failed on {key}: {e}")
+
+    async def sweep(self):
+        """Requeue abandoned claims and anything still waiting to be (re)tried"""
+        await self.db.stripe_events.update_many(
+            {"status": "processing", "claimed_at": {"$lt": datetime.utcnow() - timedelta(seconds=STRIPE_EVENT_STALE_SECONDS)}},
+            {"$set": {"status": "failed", "error": "abandoned while processing"}}
+        )
+        cursor = self.db.stripe_events.find(
+            {"status": {"$in": list(RETRYABLE_STATUSES)}, "attempts": {"$lt": STRIPE_EVENT_MAX_ATTEMPTS}},
+            {"contract_id": 1}
+        )
+        async for document in cursor:
+            self.enqueue(partition_key(document))
+
+    async def _sweep_forever(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Stripe event sweep failed: {e}")
+            await asyncio.sleep(STRIPE_EVENT_SWEEP_SECONDS)
+
+    async def start(self, get_db):
+        self.db = await get_db()
+        self._tasks = [asyncio.create_task(self._work(queue)) for queue in self.queues]
+        self._tasks.append(asyncio.create_task(self._sweep_forever()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def replay(
+        self,
+        db,
+        event_ids: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        event_types: Optional[List[str]] = None,
+        contract_id: Optional[str] = None
+    ) -> int:
+        """Mark stored events pending again (attempts reset) and queue them; returns how many"""
+        query: Dict[str, Any] = {"status": {"$ne": "processing"}}
+        if event_ids:
+            query["_id"] = {"$in": event_ids}
+        if since or until:
+            created = {}
+            if since:
+                created["$gte"] = int(since.timestamp())
+            if until:
+                created["$lte"] = int(until.timestamp())
+            query["created"] = created
+        if event_types:
+            query["type"] = {"$in": event_types}
+        if contract_id:
+            query["contract_id"] = contract_id
+        result = await db.stripe_events.update_many(query, {"$set": {"status": "pending", "attempts": 0}})
+        if self._tasks:
+            async for document in db.stripe_events.find({**query, "status": "pending"}, {"contract_id": 1}):
+                self.enqueue(partition_key(document))
+        logger.info(f"Replaying {result.modified_count} Stripe events")
+        return result.modified_count
+
+    async def backfill(self, db, since: datetime) -> Dict[str, int]:
+        """Fetch events created since `since` from Stripe and ingest any never received
+
+        Covers webhook outages; Stripe keeps events for 30 days.
+        """
+        started = time.perf_counter()
+        fetched = await StripeService().list_all(
+            "Event", max_items=STRIPE_BACKFILL_MAX_EVENTS, created={"gte": int(since.timestamp())}
+        )
+        # Oldest first, so each contract's events queue in order
+        fetched.sort(key=lambda event: event.get("created", 0))
+        added = 0
+        for event in fetched:
+            added += await self.ingest(db, event)
+        logger.info(f"Stripe backfill: {added} new of {len(fetched)} events in {time.perf_counter() - started:.1f}s")
+        return {"fetched": len(fetched), "ingested": added}
+
+stripe_event_processor = StripeEventProcessor()
+stripe_event_processor.on("payment_intent.succeeded", handle_payment_succeeded)
+stripe_event_processor.on("payment_intent.payment_failed", handle_payment_failed)
+for _event_type in ("payment_intent.created", "payment_intent.processing", "payment_intent.canceled"):
+    stripe_event_processor.on(_event_type, handle_payment_intent_event)
+for _event_type in ("charge.succeeded", "charge.failed", "charge.captured", "charge.refunded", "charge.updated"):
+    stripe_event_processor.on(_event_type, handle_charge_event)
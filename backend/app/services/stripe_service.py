@@ -1,174 +1,287 @@
+import asyncio
+import hashlib
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import orjson
 import stripe
 from decouple import config
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
 import logging
 
 logger = logging.getLogger(__name__)
 
+# The stripe SDK is blocking; calls run on this pool so they never stall the event loop
+STRIPE_WORKERS = int(config("STRIPE_WORKERS", default=8))
+STRIPE_MAX_RETRIES = int(config("STRIPE_MAX_RETRIES", default=3))
+STRIPE_RETRY_BASE_SECONDS = float(config("STRIPE_RETRY_BASE_SECONDS", default=0.5))
+STRIPE_SLOW_CALL_MS = float(config("STRIPE_SLOW_CALL_MS", default=2000))
+
+_stripe_pool: Optional[ThreadPoolExecutor] = None
+
+def _get_stripe_pool() -> ThreadPoolExecutor:
+    global _stripe_pool
+    if _stripe_pool is None:
+        _stripe_pool = ThreadPoolExecutor(max_workers=STRIPE_WORKERS, thread_name_prefix="stripe")
+    return _stripe_pool
+
+def shutdown_stripe_pool():
+    """Shut down the Stripe thread pool (called on application shutdown)"""
+    global _stripe_pool
+    if _stripe_pool is not None:
+        _stripe_pool.shutdown(wait=False, cancel_futures=True)
+        _stripe_pool = None
+
+class StripeCallStats:
+    """Per-operation call counts and latency for the Stripe facade"""
+
+    def __init__(self):
+        self.operations: Dict[str, Dict[str, float]] = {}
+
+    def record(self, operation: str, elapsed_ms: float, retries: int, failed: bool):
+        stats = self.operations.setdefault(operation, {
+            "calls": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0
+        })
+        stats["calls"] += 1
+        stats["errors"] += failed
+        stats["retries"] += retries
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            operation: {
+                **stats,
+                "total_ms": round(stats["total_ms"], 1),
+                "max_ms": round(stats["max_ms"], 1),
+                "avg_ms": round(stats["total_ms"] / stats["calls"], 1) if stats["calls"] else 0.0
+            }
+            for operation, stats in self.operations.items()
+        }
+
+stripe_call_stats = StripeCallStats()
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, (stripe.error.RateLimitError, stripe.error.APIConnectionError)):
+        return True
+    if isinstance(error, stripe.error.StripeError):
+        # Stripe marks lock timeouts and similar transient errors with Stripe-Should-Retry
+        if (error.headers or {}).get("Stripe-Should-Retry") == "true":
+            return True
+        return (error.http_status or 0) >= 500
+    return False
+
+def idempotency_key(prefix: str, params: Dict[str, Any]) -> str:
+    """prefix plus a digest of everything sent with the request
+
+    Stripe answers a reused key with a different request body with a
+    non-retryable idempotency_error for 24 hours, so the key only repeats
+    for an identical request (e.g. a double submit), not after an edit.
+    """
+    digest = hashlib.sha256(orjson.dumps(params, option=orjson.OPT_SORT_KEYS)).hexdigest()[:16]
+    return f"{prefix}-{digest}"
+
 class StripeService:
+    """Async facade over the Stripe SDK
+
+    Every call runs on a bounded thread pool, is retried with exponential
+    backoff and jitter on rate limits, connection errors and 5xx responses,
+    and is timed into stripe_call_stats. Creating calls carry an idempotency
+    key (the caller's, or a generated one) that stays the same across retries,
+    so a retried request can never create a second object.
+    """
+
     def __init__(self):
         stripe.api_key = config("STRIPE_SECRET_KEY")
         self.webhook_secret = config("STRIPE_WEBHOOK_SECRET")
 
-    def create_payment_intent(
+    async def _call(self, operation: str, func: Callable, *, idempotency_key: Optional[str] = None,
+                    creates: bool = False, **params) -> Any:
+        if creates:
+            params["idempotency_key"] = idempotency_key or f"{operation}-{uuid.uuid4()}"
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    result = await loop.run_in_executor(_get_stripe_pool(), partial(func, **params))
+                    break
+                except Exception as e:
+                    if attempt >= STRIPE_MAX_RETRIES or not _retryable(e):
+                        raise
+                    delay = STRIPE_RETRY_BASE_SECONDS * (2 ** attempt) * (0.5 + random.random())
+                    attempt += 1
+                    logger.warning(f"Stripe {operation} failed ({e.__class__.__name__}), retry {attempt} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+        except Exception as e:
+            stripe_call_stats.record(operation, (time.perf_counter() - started) * 1000, attempt, True)
+            logger.error(f"Error in Stripe {operation}: {e}")
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stripe_call_stats.record(operation, elapsed_ms, attempt, False)
+        if elapsed_ms > STRIPE_SLOW_CALL_MS:
+            logger.warning(f"Slow Stripe {operation}: {elapsed_ms:.0f}ms")
+        return result
+
+    async def create_payment_intent(
         self,
         amount: int,
         currency: str = "usd",
-        metadata: Optional[Dict[str, str]] = None
+        metadata: Optional[Dict[str, str]] = None,
+        idempotency_key: Optional[str] = None
     ) -> stripe.PaymentIntent:
         """Create a Stripe payment intent"""
-        try:
-            payment_intent = stripe.PaymentIntent.create(
-                amount=amount,
-                currency=currency,
-                metadata=metadata or {},
-                automatic_payment_methods={
-                    'enabled': True,
-                },
-            )
-            logger.info(f"Created payment intent: {payment_intent.id}")
-            return payment_intent
-        
-        except Exception as e:
-            logger.error(f"Error creating payment intent: {e}")
-            raise
+        payment_intent = await self._call(
+            "create_payment_intent", stripe.PaymentIntent.create,
+            creates=True, idempotency_key=idempotency_key,
+            amount=amount,
+            currency=currency,
+            metadata=metadata or {},
+            automatic_payment_methods={
+                'enabled': True,
+            },
+        )
+        logger.info(f"Created payment intent: {payment_intent.id}")
+        return payment_intent
 
-    def create_customer(
+    async def create_customer(
         self,
         email: str,
         name: str,
-        metadata: Optional[Dict[str, str]] = None
+        metadata: Optional[Dict[str, str]] = None,
+        idempotency_key: Optional[str] = None
     ) -> stripe.Customer:
         """Create a Stripe customer"""
-        try:
-            customer = stripe.Customer.create(
-                email=email,
-                name=name,
-                metadata=metadata or {}
-            )
-            logger.info(f"Created customer: {customer.id}")
-            return customer
-        
-        except Exception as e:
-            logger.error(f"Error creating customer: {e}")
-            raise
+        customer = await self._call(
+            "create_customer", stripe.Customer.create,
+            creates=True, idempotency_key=idempotency_key,
+            email=email,
+            name=name,
+            metadata=metadata or {}
+        )
+        logger.info(f"Created customer: {customer.id}")
+        return customer
 
-    def retrieve_payment_intent(self, payment_intent_id: str) -> stripe.PaymentIntent:
+    async def retrieve_payment_intent(self, payment_intent_id: str) -> stripe.PaymentIntent:
         """Retrieve a payment intent"""
-        try:
-            return stripe.PaymentIntent.retrieve(payment_intent_id)
-        except Exception as e:
-            logger.error(f"Error retrieving payment intent: {e}")
-            raise
+        return await self._call("retrieve_payment_intent", stripe.PaymentIntent.retrieve, id=payment_intent_id)
 
-    def create_subscription(
+    async def create_subscription(
         self,
         customer_id: str,
         price_id: str,
-        metadata: Optional[Dict[str, str]] = None
+        metadata: Optional[Dict[str, str]] = None,
+        idempotency_key: Optional[str] = None
     ) -> stripe.Subscription:
         """Create a subscription"""
-        try:
-            subscription = stripe.Subscription.create(
-                customer=customer_id,
-                items=[{'price': price_id}],
-                metadata=metadata or {}
-            )
-            logger.info(f"Created subscription: {subscription.id}")
-            return subscription
-        
-        except Exception as e:
-            logger.error(f"Error creating subscription: {e}")
-            raise
+        subscription = await self._call(
+            "create_subscription", stripe.Subscription.create,
+            creates=True, idempotency_key=idempotency_key,
+            customer=customer_id,
+            items=[{'price': price_id}],
+            metadata=metadata or {}
+        )
+        logger.info(f"Created subscription: {subscription.id}")
+        return subscription
 
-    def create_invoice(
+    async def create_invoice(
         self,
         customer_id: str,
         amount: int,
         description: str,
-        metadata: Optional[Dict[str, str]] = None
+        metadata: Optional[Dict[str, str]] = None,
+        idempotency_key: Optional[str] = None,
+        days_until_due: int = 30
     ) -> stripe.Invoice:
-        """Create an invoice"""
-        try:
-            # Create invoice item
-            stripe.InvoiceItem.create(
-                customer=customer_id,
-                amount=amount,
-                currency="usd",
-                description=description,
-                metadata=metadata or {}
-            )
-            
-            # Create and send invoice
-            invoice = stripe.Invoice.create(
-                customer=customer_id,
-                auto_advance=True,
-                metadata=metadata or {}
-            )
-            
-            invoice = stripe.Invoice.send_invoice(invoice.id)
-            logger.info(f"Created and sent invoice: {invoice.id}")
-            return invoice
-        
-        except Exception as e:
-            logger.error(f"Error creating invoice: {e}")
-            raise
+        """Create an invoice with the amount as its one line item and email it to the customer"""
+        # One key per step, derived from the caller's, so a retried invoice run
+        # neither adds a second line item nor creates a second invoice
+        key = idempotency_key or f"invoice-{uuid.uuid4()}"
+
+        # Create invoice item
+        await self._call(
+            "create_invoice_item", stripe.InvoiceItem.create,
+            creates=True, idempotency_key=f"{key}:item",
+            customer=customer_id,
+            amount=amount,
+            currency="usd",
+            description=description,
+            metadata=metadata or {}
+        )
+
+        # Create and send invoice
+        invoice = await self._call(
+            "create_invoice", stripe.Invoice.create,
+            creates=True, idempotency_key=f"{key}:invoice",
+            customer=customer_id,
+            auto_advance=True,
+            # Emailed with a due date rather than charged to a saved card, and
+            # picks up the item above even though it was created separately
+            collection_method="send_invoice",
+            days_until_due=days_until_due,
+            pending_invoice_items_behavior="include",
+            metadata=metadata or {}
+        )
 
-    def refund_payment(
+        invoice = await self._call(
+            "send_invoice", partial(stripe.Invoice.send_invoice, invoice.id),
+            creates=True, idempotency_key=f"{key}:send"
+        )
+        logger.info(f"Created and sent invoice: {invoice.id}")
+        return invoice
+
+    async def refund_payment(
         self,
         payment_intent_id: str,
         amount: Optional[int] = None,
-        reason: str = "requested_by_customer"
+        reason: str = "requested_by_customer",
+        idempotency_key: Optional[str] = None
     ) -> stripe.Refund:
         """Refund a payment"""
-        try:
-            refund_data = {
-                "payment_intent": payment_intent_id,
-                "reason": reason
-            }
-            
-            if amount:
-                refund_data["amount"] = amount
-            
-            refund = stripe.Refund.create(**refund_data)
-            logger.info(f"Created refund: {refund.id}")
-            return refund
-        
-        except Exception as e:
-            logger.error(f"Error creating refund: {e}")
-            raise
+        refund_data = {
+            "payment_intent": payment_intent_id,
+            "reason": reason
+        }
+
+        if amount:
+            refund_data["amount"] = amount
 
-    def list_payment_methods(self, customer_id: str) -> List[stripe.PaymentMethod]:
+        refund = await self._call(
+            "refund_payment", stripe.Refund.create,
+            creates=True, idempotency_key=idempotency_key,
+            **refund_data
+        )
+        logger.info(f"Created refund: {refund.id}")
+        return refund
+
+    async def list_payment_methods(self, customer_id: str) -> List[stripe.PaymentMethod]:
         """List customer's payment methods"""
-        try:
-            payment_methods = stripe.PaymentMethod.list(
-                customer=customer_id,
-                type="card"
-            )
-            return payment_methods.data
-        
-        except Exception as e:
-            logger.error(f"Error listing payment methods: {e}")
-            raise
+        payment_methods = await self._call(
+            "list_payment_methods", stripe.PaymentMethod.list,
+            customer=customer_id,
+            type="card"
+        )
+        return payment_methods.data
 
-    def create_setup_intent(
+    async def create_setup_intent(
         self,
         customer_id: str,
-        metadata: Optional[Dict[str, str]] = None
+        metadata: Optional[Dict[str, str]] = None,
+        idempotency_key: Optional[str] = None
     ) -> stripe.SetupIntent:
         """Create setup intent for saving payment methods"""
-        try:
-            setup_intent = stripe.SetupIntent.create(
-                customer=customer_id,
-                payment_method_types=["card"],
-                metadata=metadata or {}
-            )
-            logger.info(f"Created setup intent: {setup_intent.id}")
-            return setup_intent
-        
-        except Exception as e:
-            logger.error(f"Error creating setup intent: {e}")
-            raise
+        setup_intent = await self._call(
+            "create_setup_intent", stripe.SetupIntent.create,
+            creates=True, idempotency_key=idempotency_key,
+            customer=customer_id,
+            payment_method_types=["card"],
+            metadata=metadata or {}
+        )
+        logger.info(f"Created setup intent: {setup_intent.id}")
+        return setup_intent
 
     def verify_webhook_signature(self, payload: bytes, sig_header: str) -> Dict[str, Any]:
         """Verify webhook signature and return event"""
@@ -184,24 +297,27 @@ class StripeService:
             logger.error(f"Invalid signature: {e}")
             raise
 
-    def get_balance(self) -> stripe.Balance:
+    async def get_balance(self) -> stripe.Balance:
         """Get account balance"""
-        try:
-            return stripe.Balance.retrieve()
-        except Exception as e:
-            logger.error(f"Error retrieving balance: {e}")
-            raise
+        return await self._call("get_balance", stripe.Balance.retrieve)
 
-    def list_charges(self, limit: int = 10, customer: Optional[str] = None) -> List[stripe.Charge]:
+    async def list_charges(self, limit: int = 10, customer: Optional[str] = None) -> List[stripe.Charge]:
         """List charges"""
-        try:
-            params = {"limit": limit}
-            if customer:
-                params["customer"] = customer
-            
-            charges = stripe.Charge.list(**params)
-            return charges.data
-        
-        except Exception as e:
-            logger.error(f"Error listing charges: {e}")
-            raise
+        params = {"limit": limit}
+        if customer:
+            params["customer"] = customer
+
+        charges = await self._call("list_charges", stripe.Charge.list, **params)
+        return charges.data
+
+    async def list_all(self, resource: str, max_items: Optional[int] = None, **params) -> List[Dict[str, Any]]:
+        """Every object of a listable resource ("Charge", "Event", ...) as plain dicts, following pagination"""
+        def fetch(**params):
+            items = []
+            for item in getattr(stripe, resource).list(limit=100, **params).auto_paging_iter():
+                items.append(item.to_dict_recursive())
+                if max_items and len(items) >= max_items:
+                    break
+            return items
+
+        return await self._call(f"list_all_{resource.lower()}", fetch, **params)
@@ -0,0 +1,86 @@
+import mmap
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from fastapi import HTTPException, UploadFile, status
+from decouple import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB read size for the incoming multipart stream
+MAX_UPLOAD_SIZE = int(config("MAX_FILE_SIZE", default=10485760))
+
+class SpooledUpload:
+    """Upload spooled to a temporary file on disk and exposed through a memory map
+
+    Both the PDF parser and the Cloudinary uploader read from the same on-disk
+    copy, so memory per upload stays bounded regardless of file size.
+    """
+
+    def __init__(self, filename: str, content_type: Optional[str] = None):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self._file = tempfile.NamedTemporaryFile(prefix="upload_", suffix=".spool")
+        self._map: Optional[mmap.mmap] = None
+
+    @property
+    def path(self) -> str:
+        """Filesystem path of the spooled copy"""
+        return self._file.name
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def finalize(self):
+        """Flush the spool and map it read-only"""
+        self._file.flush()
+        if self.size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def buffer(self) -> mmap.mmap:
+        """Seekable, file-like view of the upload (rewound on every access)"""
+        if self._map is None:
+            raise ValueError("Upload is empty or not finalized")
+        self._map.seek(0)
+        return self._map
+
+    @property
+    def view(self) -> memoryview:
+        """Zero-copy view of the upload bytes"""
+        return memoryview(self.buffer)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+@asynccontextmanager
+async def spool_upload(file: UploadFile, max_size: int = MAX_UPLOAD_SIZE) -> AsyncIterator[SpooledUpload]:
+    """Stream an UploadFile to disk in chunks, rejecting it as soon as it exceeds max_size"""
+    spool = SpooledUpload(file.filename, file.content_type)
+    try:
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if spool.size + len(chunk) > max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File exceeds maximum size of {max_size // (1024 * 1024)} MB"
+                )
+            spool.write(chunk)
+
+        if not spool.size:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Uploaded file is empty")
+
+        spool.finalize()
+        logger.debug(f"Spooled upload {file.filename} ({spool.size} bytes) to {spool.path}")
+        yield spool
+    finally:
+        spool.close()
+        await file.close()
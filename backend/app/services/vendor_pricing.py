@@ -0,0 +1,121 @@
+import re
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne, DeleteMany
+import logging
+
+from ..models.vendor import PricingInfo
+
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = ["item_name", "category", "unit", "price", "min_quantity", "max_quantity", "description", "confidence"]
+WHITESPACE = re.compile(r'\s+')
+
+def make_item_key(item_name: str) -> str:
+    """Normalized identity of a price item within a vendor"""
+    return WHITESPACE.sub(" ", item_name.strip().lower())
+
+class VendorPricingService:
+    """Vendor prices stored one document per (vendor_id, item_key) in vendor_prices"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def merge_pricing(self, vendor_id: ObjectId, items: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Upsert only new or changed items; unchanged items cost no writes"""
+        incoming: Dict[str, Dict[str, Any]] = {}
+        for item in items:
+            if not item.get("item_name"):
+                continue
+            try:
+                price = PricingInfo(**item).dict()
+            except ValueError as e:
+                logger.warning(f"Skipping invalid pricing item {item.get('item_name')}: {e}")
+                continue
+            incoming[make_item_key(price["item_name"])] = {field: price.get(field) for field in PRICE_FIELDS}
+
+        if not incoming:
+            return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+        existing = {}
+        cursor = self.db.vendor_prices.find(
+            {"vendor_id": vendor_id, "item_key": {"$in": list(incoming)}},
+            {"_id": 0, "item_key": 1, **{field: 1 for field in PRICE_FIELDS}}
+        )
+        async for doc in cursor:
+            existing[doc["item_key"]] = doc
+
+        now = datetime.utcnow()
+        operations = []
+        inserted = updated = 0
+        for item_key, price in incoming.items():
+            current = existing.get(item_key)
+            if current is not None and all(current.get(field) == price[field] for field in PRICE_FIELDS):
+                continue
+
+            if current is None:
+                inserted += 1
+            else:
+                updated += 1
+            operations.append(UpdateOne(
+                {"vendor_id": vendor_id, "item_key": item_key},
+                {"$set": {**price, "updated_at": now}, "$setOnInsert": {"created_at": now}},
+                upsert=True
+            ))
+
+        if operations:
+            await self.db.vendor_prices.bulk_write(operations, ordered=False)
+
+        return {"inserted": inserted, "updated": updated, "unchanged": len(incoming) - inserted - updated}
+
+    async def replace_pricing(self, vendor_id: ObjectId, items: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Make the vendor's price list exactly items (used when a vendor is edited with a full list)"""
+        keys = [make_item_key(item["item_name"]) for item in items if item.get("item_name")]
+        result = await self.db.vendor_prices.bulk_write(
+            [DeleteMany({"vendor_id": vendor_id, "item_key": {"$nin": keys}})],
+            ordered=False
+        )
+        counts = await self.merge_pricing(vendor_id, items)
+        counts["deleted"] = result.deleted_count
+        return counts
+
+    async def get_pricing(self, vendor_id: ObjectId, skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        cursor = self.db.vendor_prices.find(
+            {"vendor_id": vendor_id},
+            {"_id": 0, **{field: 1 for field in PRICE_FIELDS}}
+        ).sort("item_key", 1).skip(skip).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def get_pricing_pages(self, vendor_ids: List[ObjectId], limit: int) -> Dict[ObjectId, Tuple[List[Dict[str, Any]], int]]:
+        """First page of prices and the total count for several vendors in one aggregation"""
+        if not vendor_ids:
+            return {}
+        pipeline = [
+            {"$match": {"vendor_id": {"$in": vendor_ids}}},
+            {"$sort": {"vendor_id": 1, "item_key": 1}},
+            {"$group": {
+                "_id": "$vendor_id",
+                "count": {"$sum": 1},
+                "items": {"$push": "$$ROOT"}
+            }},
+            {"$project": {"count": 1, "items": {"$slice": ["$items", limit]}}}
+        ]
+        pages = {vendor_id: ([], 0) for vendor_id in vendor_ids}
+        async for group in self.db.vendor_prices.aggregate(pipeline, allowDiskUse=True):
+            items = [{field: item[field] for field in PRICE_FIELDS if field in item} for item in group["items"]]
+            pages[group["_id"]] = (items, group["count"])
+        return pages
+
+    async def count_pricing(self, vendor_id: ObjectId) -> int:
+        return await self.db.vendor_prices.count_documents({"vendor_id": vendor_id})
+
+    async def migrate_embedded_pricing(self, vendor: Dict[str, Any]):
+        """Move a legacy embedded pricing array into vendor_prices and drop it from the vendor document"""
+        embedded = vendor.get("pricing")
+        if not embedded:
+            return
+        await self.merge_pricing(vendor["_id"], embedded)
+        await self.db.vendors.update_one({"_id": vendor["_id"]}, {"$unset": {"pricing": ""}})
+        vendor.pop("pricing", None)
+        logger.info(f"Migrated {len(embedded)} embedded pricing items for vendor {vendor['_id']}")
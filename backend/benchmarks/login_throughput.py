@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark login throughput and event-loop stall for inline vs. pooled bcrypt
+
+Usage:
+    python benchmarks/login_throughput.py [concurrent_logins]
+
+A heartbeat task ticks every 10 ms while the logins run; the worst gap between
+ticks is how long any other request would have waited for the event loop.
+"""
+import asyncio
+import os
+import sys
+import time
+
+# Add the backend directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.password_hashing import (
+    BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, pwd_context, verify_password, shutdown_hash_pool
+)
+
+PASSWORD = "correct horse battery staple"
+
+async def heartbeat(stop: asyncio.Event, gaps: list):
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.01)
+        now = time.perf_counter()
+        gaps.append(now - last - 0.01)
+        last = now
+
+async def inline_login(hashed: str):
+    return pwd_context.verify(PASSWORD, hashed)
+
+async def pooled_login(hashed: str):
+    valid, _ = await verify_password(PASSWORD, hashed)
+    return valid
+
+async def run(label: str, login, hashed: str, logins: int):
+    stop = asyncio.Event()
+    gaps = [0.0]
+    ticker = asyncio.create_task(heartbeat(stop, gaps))
+    await asyncio.sleep(0.02)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login(hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await ticker
+    assert all(results)
+    print(f"{label:>8}: {logins} logins in {elapsed:.2f}s "
+          f"({logins / elapsed:.1f} logins/sec), worst loop stall {max(gaps) * 1000:.0f} ms")
+
+async def main(logins: int):
+    hashed = pwd_context.hash(PASSWORD)
+    print(f"bcrypt rounds={BCRYPT_ROUNDS}, hash workers={PASSWORD_HASH_WORKERS}")
+    await run("inline", inline_login, hashed, logins)
+    await run("pooled", pooled_login, hashed, logins)
+    shutdown_hash_pool()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark requests/sec through the middleware stack, before and after the pure-ASGI rewrite
+
+Usage:
+    python benchmarks/middleware_stack.py [requests_per_endpoint]
+
+"before" rebuilds the old stack (CORSMiddleware plus the BaseHTTPMiddleware
+redirect shim); "after" is the stack configured in app.main. Requests go
+through httpx's in-process ASGI transport, so no sockets are involved.
+"""
+import asyncio
+import os
+import sys
+import time
+
+# Add the backend directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import RedirectResponse
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.main import app
+
+ENDPOINTS = ["/health", "/api/clients/"]
+HEADERS = {"Authorization": "Bearer demo-token", "Accept-Encoding": "gzip, br", "Origin": "http://localhost:3000"}
+
+class LegacyCORSRedirectMiddleware(BaseHTTPMiddleware):
+    """The shim that used to live in app.main"""
+
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        if isinstance(response, RedirectResponse):
+            response.headers["Access-Control-Allow-Origin"] = "*"
+        return response
+
+def use_stack(middleware):
+    app.user_middleware = middleware
+    app.middleware_stack = app.build_middleware_stack()
+
+async def measure(path: str, count: int, concurrency: int = 20) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get(path, headers=HEADERS)  # warm up
+        queue = iter(range(count))
+
+        async def worker():
+            for _ in queue:
+                response = await client.get(path, headers=HEADERS)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return count / (time.perf_counter() - start)
+
+async def main(count: int):
+    current = list(app.user_middleware)
+    cors = next(m for m in current if m.cls is CORSMiddleware)
+    stacks = {
+        "before": [Middleware(LegacyCORSRedirectMiddleware), cors],
+        "after": current,
+    }
+
+    results = {}
+    for label, middleware in stacks.items():
+        use_stack(middleware)
+        for path in ENDPOINTS:
+            results[label, path] = await measure(path, count)
+
+    for path in ENDPOINTS:
+        before, after = results["before", path], results["after", path]
+        print(f"{path:<14} before {before:8.0f} req/s   after {after:8.0f} req/s   ({after / before:.2f}x)")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark serial vs. page-sharded PDF text extraction
+
+Usage:
+    python benchmarks/pdf_extraction.py [catalog.pdf ...]
+
+Without arguments a synthetic 200-page vendor catalog is generated.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Add the backend directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from app.services.pdf_parser import PDFParser, _extract_page_range, _count_pages, shutdown_process_pool
+
+def build_sample_catalog(path: str, pages: int = 200, rows_per_page: int = 45):
+    """Write a synthetic price-list PDF resembling a vendor catalog"""
+    pdf = canvas.Canvas(path, pagesize=letter)
+    for page in range(pages):
+        y = 750
+        pdf.drawString(50, y, f"StoneCraft Supply Catalog - Page {page + 1}")
+        for row in range(rows_per_page):
+            y -= 15
+            pdf.drawString(50, y, f"Granite Slab Color {page}-{row} 3cm - ${40 + (row % 60)}.99 sq ft")
+        pdf.showPage()
+    pdf.save()
+
+async def benchmark(path: str):
+    parser = PDFParser()
+    page_count = _count_pages(path)
+
+    start = time.perf_counter()
+    serial_text = "".join(f"{page_text}\n" for page_text in _extract_page_range(path, 0, page_count))
+    serial_elapsed = time.perf_counter() - start
+
+    # Warm up the process pool so worker start-up is not measured
+    await parser._extract_text_from_pdf(path)
+
+    start = time.perf_counter()
+    parallel_text = await parser._extract_text_from_pdf(path)
+    parallel_elapsed = time.perf_counter() - start
+
+    assert serial_text == parallel_text, "parallel extraction produced different text"
+    print(f"{os.path.basename(path)}: {page_count} pages")
+    print(f"  serial:   {serial_elapsed:.2f}s ({page_count / serial_elapsed:.1f} pages/s)")
+    print(f"  parallel: {parallel_elapsed:.2f}s ({page_count / parallel_elapsed:.1f} pages/s)")
+
+async def main(paths):
+    try:
+        if paths:
+            for path in paths:
+                await benchmark(path)
+        else:
+            with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+                build_sample_catalog(tmp.name)
+                await benchmark(tmp.name)
+    finally:
+        shutdown_process_pool()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
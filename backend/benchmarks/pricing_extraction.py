@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Benchmark pricing extraction throughput (lines/sec) on a synthetic price sheet
+
+Usage:
+    python benchmarks/pricing_extraction.py [line_count]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+# Add the backend directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.pdf_parser import PDFParser
+
+MATERIALS = ["Granite", "Quartz", "Marble", "Quartzite", "Porcelain Tile", "Copper Pipe", "Install Labor"]
+COLORS = ["White", "Black Pearl", "Calacatta", "Steel Grey", "Ubatuba", "Blue Pearl", "Santa Cecilia"]
+LAYOUTS = [
+    "{name} - ${price} sq ft",
+    "{name}: ${price}",
+    "{name} {price} each",
+    "${price} {name}",
+    "Page {n} of 400",
+    "Prices subject to change without notice",
+]
+
+def build_price_sheet(line_count: int) -> str:
+    rng = random.Random(42)
+    lines = []
+    for n in range(line_count):
+        name = f"{rng.choice(MATERIALS)} {rng.choice(COLORS)} {rng.choice(['2cm', '3cm'])} {n % 5000}"
+        price = f"{rng.uniform(10, 150):.2f}"
+        lines.append(rng.choice(LAYOUTS).format(name=name, price=price, n=n))
+    return "\n".join(lines)
+
+async def main(line_count: int):
+    text = build_price_sheet(line_count)
+    parser = PDFParser()
+
+    start = time.perf_counter()
+    items = await parser.extract_pricing_from_text(text)
+    elapsed = time.perf_counter() - start
+
+    print(f"{line_count} lines -> {len(items)} items in {elapsed:.2f}s ({line_count / elapsed:,.0f} lines/sec)")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark list-endpoint serialization cost per 1,000 documents
+
+Usage:
+    python benchmarks/serialization.py [documents]
+
+"validated" is the previous path: response_model re-validation, jsonable_encoder
+and stdlib json. "serializer" is DocumentSerializer + ORJSONResponse.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+# Add the backend directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.models.client import ClientResponse
+from app.models.estimate import EstimateResponse
+from app.responses import DocumentSerializer, ORJSONResponse
+
+def build_clients(count: int):
+    now = datetime.utcnow()
+    return [{
+        "_id": ObjectId(),
+        "first_name": f"Client{n}",
+        "last_name": "Example",
+        "email": f"client{n}@example.com",
+        "phone": "+15555550100",
+        "project_type": "kitchen",
+        "project_description": "Kitchen countertop replacement with undermount sink",
+        "budget": "15000",
+        "timeline": "1-3 months",
+        "address": {"street": f"{n} Main St", "city": "Phoenix", "state": "AZ", "zip_code": "85001"},
+        "preferred_contact": "email",
+        "notes": "Prefers quartz",
+        "lead_source": "website",
+        "is_active": True,
+        "project_status": "lead",
+        "created_at": now - timedelta(days=n % 90),
+        "updated_at": now,
+    } for n in range(count)]
+
+def build_estimates(count: int):
+    now = datetime.utcnow()
+    return [{
+        "_id": ObjectId(),
+        "estimate_number": f"EST-20250101-{n:06d}",
+        "title": "Kitchen countertops",
+        "client_name": f"Client{n} Example",
+        "client_email": f"client{n}@example.com",
+        "line_items": [
+            {"description": f"Quartz slab {i}", "quantity": 42.5, "unit": "sq ft", "unit_price": 65.0,
+             "total": 2762.5, "vendor_name": "StoneCraft"}
+            for i in range(5)
+        ],
+        "subtotal": 13812.5,
+        "tax_rate": 8.6,
+        "tax_amount": 1187.875,
+        "total": 15000.375,
+        "status": "sent",
+        "created_at": now,
+        "updated_at": now,
+        "created_by": ObjectId(),
+    } for n in range(count)]
+
+async def validated(model, documents) -> bytes:
+    field = create_response_field(name="response", type_=List[model])
+    items = [{"id": str(doc["_id"]), **{k: v for k, v in doc.items() if k != "_id"}} for doc in documents]
+    content = await serialize_response(field=field, response_content=items)
+    return json.dumps(content).encode()
+
+async def serialized(model, documents) -> bytes:
+    return ORJSONResponse(DocumentSerializer(model).many(documents)).body
+
+async def timed(func, model, documents, rounds: int = 5) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await func(model, documents)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+async def main(count: int):
+    for label, model, documents in [
+        ("clients", ClientResponse, build_clients(count)),
+        ("estimates", EstimateResponse, build_estimates(count)),
+    ]:
+        before = await timed(validated, model, documents)
+        after = await timed(serialized, model, documents)
+        per_thousand = 1000 / count * 1000
+        print(f"{label:<10} validated {before * per_thousand:7.1f} ms/1k   "
+              f"serializer {after * per_thousand:6.1f} ms/1k   ({before / after:.1f}x)")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+import stripe
+
+# Settings read at import time; tests never reach SMTP, Stripe or Cloudinary
+for name, value in {
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "DATABASE_NAME": "test",
+    "MONGODB_URL": "mongodb://127.0.0.1:1",
+    "MONGODB_CONNECT_TIMEOUT_MS": "100",
+    "STRIPE_SECRET_KEY": "sk_test_x",
+    "STRIPE_WEBHOOK_SECRET": "whsec_x",
+    "SMTP_HOST": "localhost",
+    "SMTP_PORT": "25",
+    "SMTP_USERNAME": "test@example.com",
+    "SMTP_PASSWORD": "x",
+    "CLOUDINARY_CLOUD_NAME": "test",
+    "CLOUDINARY_API_KEY": "x",
+    "CLOUDINARY_API_SECRET": "x",
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion on a fresh event loop"""
+    return asyncio.run
+
+@pytest.fixture
+def db():
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()["test"]
+
+class StripeAPIStub(stripe.http_client.HTTPClient):
+    """In-process stand-in for stripe-mock, installed as the SDK's HTTP client
+
+    List endpoints page through `objects[resource]` newest first and honour
+    created[gte]; POSTs create an object from the form fields (or act on one,
+    for /v1/<resource>/<id>/<action>) and are recorded in `posts`.
+    """
+
+    name = "stub"
+
+    def __init__(self):
+        super().__init__()
+        self.objects: Dict[str, List[Dict[str, Any]]] = {}
+        self.posts: List[Tuple[str, Dict[str, Any]]] = []
+
+    def request(self, method, url, headers, post_data=None):
+        parts = urlsplit(url).path.split("/")[2:]
+        query = dict(parse_qsl(urlsplit(url).query))
+        resource = parts[0]
+        if method == "get" and len(parts) == 1:
+            items = sorted(self.objects.get(resource, []), key=lambda item: item.get("created", 0), reverse=True)
+            if "created[gte]" in query:
+                items = [item for item in items if item.get("created", 0) >= int(query["created[gte]"])]
+            if "starting_after" in query:
+                ids = [item["id"] for item in items]
+                items = items[ids.index(query["starting_after"]) + 1:]
+            limit = int(query.get("limit", 10))
+            body = {"object": "list", "url": f"/v1/{resource}", "has_more": len(items) > limit, "data": items[:limit]}
+        elif method == "post":
+            fields = dict(parse_qsl(post_data or ""))
+            self.posts.append(("/".join(parts), fields))
+            if len(parts) == 1:
+                body = {"id": f"{resource[:-1]}_{len(self.posts)}", "object": resource[:-1], **fields}
+                self.objects.setdefault(resource, []).append(body)
+            else:
+                body = next(item for item in self.objects[resource] if item["id"] == parts[1])
+                body["status"] = parts[2]
+        else:
+            body = next(item for item in self.objects[resource] if item["id"] == parts[1])
+        return json.dumps(body), 200, {}
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def stripe_api(monkeypatch):
+    stub = StripeAPIStub()
+    monkeypatch.setattr(stripe, "default_http_client", stub)
+    return stub
@@ -0,0 +1,103 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.services import dunning
+from app.services.dunning import DunningEngine, DUNNING_INVOICE_DAYS_UNTIL_DUE
+
+AS_OF = datetime(2024, 7, 1)
+
+def _contract(**fields):
+    return {
+        "_id": ObjectId(), "contract_number": "CON-1001", "client_name": "Pat Lee",
+        "client_email": "pat@example.com", "balance_due": 1250.0,
+        "payment_status": "pending", "status": "signed",
+        "payment_due_date": AS_OF - timedelta(days=10), "created_at": AS_OF - timedelta(days=60),
+        **fields
+    }
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(dunning, "DUNNING_CREATE_INVOICES", False)
+    engine = DunningEngine()
+    engine.emails = []
+
+    async def email(contract, invoice_data, stage):
+        engine.emails.append((contract["_id"], stage))
+
+    engine._email = email
+    return engine
+
+def _run():
+    return {"_id": ObjectId(), "as_of": AS_OF, "dry_run": False}
+
+def test_concurrent_runs_send_a_stage_once(run, db, engine):
+    contract = _contract()
+
+    async def scenario():
+        await db.contracts.insert_one(contract)
+        results = await asyncio.gather(engine.process(db, _run(), contract), engine.process(db, _run(), contract))
+        return results, await db.contracts.find_one({"_id": contract["_id"]})
+
+    results, stored = run(scenario())
+    assert sorted(result["reminded"] for result in results) == [0, 1]
+    assert engine.emails == [(contract["_id"], "urgent")]
+    assert stored["dunning"]["stages_sent"] == ["urgent"]
+    assert stored["payment_status"] == "overdue"
+
+def test_undelivered_stage_is_released_for_the_next_run(run, db, engine):
+    contract = _contract()
+    delivered = engine._email
+
+    async def failing(contract, invoice_data, stage):
+        raise ConnectionError("SMTP down")
+
+    async def scenario():
+        await db.contracts.insert_one(contract)
+        engine._email = failing
+        first = await engine.process(db, _run(), contract)
+        released = await db.contracts.find_one({"_id": contract["_id"]})
+        engine._email = delivered
+        second = await engine.process(db, _run(), released)
+        return first, released, second, await db.contracts.find_one({"_id": contract["_id"]})
+
+    first, released, second, stored = run(scenario())
+    assert first["undelivered"] == 1
+    assert released["dunning"]["stages_sent"] == []
+    assert released["dunning"]["failed_stages"] == ["urgent"]
+    assert second["reminded"] == 1
+    assert stored["dunning"]["stages_sent"] == ["urgent"]
+    assert stored["dunning"]["failed_stages"] == []
+
+def test_paid_contracts_are_not_claimed(run, db, engine):
+    contract = _contract()
+
+    async def scenario():
+        await db.contracts.insert_one({**contract, "payment_status": "paid"})
+        return await engine.process(db, _run(), contract)
+
+    assert run(scenario())["skipped"] == 1
+    assert engine.emails == []
+
+def test_first_stage_sends_a_stripe_invoice(run, db, engine, stripe_api, monkeypatch):
+    monkeypatch.setattr(dunning, "DUNNING_CREATE_INVOICES", True)
+    contract = _contract()
+
+    async def scenario():
+        await db.contracts.insert_one(contract)
+        counts = await engine.process(db, _run(), contract)
+        return counts, await db.contracts.find_one({"_id": contract["_id"]})
+
+    counts, stored = run(scenario())
+    assert counts["invoiced"] == 1 and counts["reminded"] == 1
+    paths = [path for path, _ in stripe_api.posts]
+    assert paths[:3] == ["customers", "invoiceitems", "invoices"]
+    assert paths[3].endswith("/send")
+    invoice = stripe_api.posts[2][1]
+    assert invoice["collection_method"] == "send_invoice"
+    assert invoice["days_until_due"] == str(DUNNING_INVOICE_DAYS_UNTIL_DUE)
+    assert invoice["pending_invoice_items_behavior"] == "include"
+    assert stripe_api.posts[1][1]["amount"] == "125000"
+    assert stored["dunning"]["invoice_id"] == "invoice_3"
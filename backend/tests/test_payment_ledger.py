@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.services.payment_ledger import PaymentLedger, run_reconciliation
+
+def _charge(number, created, contract_id=None, intent=None):
+    return {
+        "id": f"ch_{number}", "object": "charge", "created": created, "status": "succeeded", "paid": True,
+        "amount": 10000, "amount_refunded": 0, "currency": "usd", "payment_intent": intent,
+        "metadata": {"contract_id": contract_id} if contract_id else {},
+    }
+
+def _intent(number, created, contract_id):
+    return {
+        "id": f"pi_{number}", "object": "payment_intent", "created": created, "status": "succeeded",
+        "amount": 10000, "amount_received": 10000, "currency": "usd", "metadata": {"contract_id": contract_id},
+    }
+
+def _stamp(moment):
+    return int((moment - datetime(1970, 1, 1)).total_seconds())
+
+def test_never_reconciled_ledger_imports_history(run, db, stripe_api):
+    # Two years of history, more than one page of charges
+    old = _stamp(datetime.utcnow() - timedelta(days=700))
+    stripe_api.objects["payment_intents"] = [_intent(1, old, "k1")]
+    stripe_api.objects["charges"] = [_charge(n, old + n) for n in range(2, 150)] + [_charge(1, old, intent="pi_1")]
+
+    async def get_db():
+        return db
+
+    async def scenario():
+        task = asyncio.create_task(run_reconciliation(get_db))
+        for _ in range(200):
+            if await db.ledger_sync.find_one({"_id": "payments"}):
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        return (
+            await db.payments.count_documents({"object": "charge"}),
+            await db.payments.find_one({"_id": "ch_1"}),
+            await PaymentLedger(db).backfill_since(),
+        )
+
+    charges, first, next_backfill = run(scenario())
+    assert charges == 149
+    # Charges find their contract through the intent
+    assert first["contract_id"] == "k1"
+    assert next_backfill is None
+
+def test_stale_ledger_resumes_from_the_last_run(run, db):
+    reconciled_at = datetime.utcnow() - timedelta(days=5)
+
+    async def scenario():
+        await db.ledger_sync.insert_one({"_id": "payments", "reconciled_at": reconciled_at})
+        return await PaymentLedger(db).backfill_since()
+
+    since = run(scenario())
+    assert since is not None and since < reconciled_at
+
+def test_recent_reconciliation_skips_the_backfill(run, db):
+    async def scenario():
+        await db.ledger_sync.insert_one({"_id": "payments", "reconciled_at": datetime.utcnow() - timedelta(hours=1)})
+        return await PaymentLedger(db).backfill_since()
+
+    assert run(scenario()) is None
+
+def test_reconcile_only_asks_for_the_window(run, db, stripe_api):
+    now = datetime.utcnow()
+    stripe_api.objects["charges"] = [_charge(1, _stamp(now - timedelta(days=3))), _charge(2, _stamp(now - timedelta(hours=1)))]
+
+    result = run(PaymentLedger(db).reconcile(now - timedelta(hours=48)))
+    assert result == {"payment_intents": 0, "charges": 1}
@@ -0,0 +1,36 @@
+from app.services.pdf_parser import PDFParser
+
+def extract(text):
+    return {item["item_name"]: item for item in PDFParser()._extract_pricing_items(text)}
+
+def test_formats_are_read_the_right_way_round():
+    items = extract(
+        "Granite Slab - $45.00 sq ft\n"
+        "Labor: $65.00\n"
+        "Quartz White 2cm 120.70 each\n"
+        "$12.50 Tile Adhesive"
+    )
+    assert items["Granite Slab"]["price"] == 45.0
+    assert items["Granite Slab"]["unit"] == "sq ft"
+    assert items["Granite Slab"]["match_type"] == "dash"
+    assert items["Labor"]["price"] == 65.0
+    assert items["Quartz White 2cm"]["price"] == 120.7
+    assert items["Tile Adhesive"]["price"] == 12.5
+    assert items["Tile Adhesive"]["match_type"] == "price_first"
+
+def test_one_item_per_line():
+    items = extract("Quartz White 2cm 123 120.70 each")
+    assert list(items) == ["Quartz White 2cm 123"]
+    assert items["Quartz White 2cm 123"]["price"] == 120.7
+
+def test_page_markers_and_unit_only_names_are_ignored():
+    assert extract("Page 3 of 400\nPage 12\n120.70 each 123\n10 sq ft 20") == {}
+
+def test_most_confident_line_wins_for_a_repeated_name():
+    items = extract("Marble 99.00\nMarble - $89.00 each")
+    assert items["Marble"]["price"] == 89.0
+    assert items["Marble"]["confidence"] == 1.0
+
+def test_items_never_outnumber_priced_lines():
+    lines = [f"Granite Black Pearl 3cm {n} {n + 10}.50 each" for n in range(200)] + ["Page 1 of 2"] * 50
+    assert len(PDFParser()._extract_pricing_items("\n".join(lines))) <= 200
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import get_database
+from app.main import app
+from app.services.scheduling import MAX_APPOINTMENT_LENGTH, SchedulingEngine
+
+DAY = datetime(2024, 6, 3)
+AUTH = {"Authorization": "Bearer demo-token"}
+
+def _booking(start_hour, end_hour, **fields):
+    return {
+        "contractor_id": "c1", "status": "scheduled",
+        "start_time": DAY + timedelta(hours=start_hour), "end_time": DAY + timedelta(hours=end_hour),
+        **fields
+    }
+
+def test_conflicts_ignore_cancelled_and_touching_bookings(run, db):
+    async def scenario():
+        await db.appointments.insert_many([
+            _booking(9, 10),
+            _booking(10, 11, status="cancelled"),
+            _booking(11, 12),
+            _booking(8, 9),
+        ])
+        return await SchedulingEngine().conflicts(db, "c1", DAY + timedelta(hours=9, minutes=30), DAY + timedelta(hours=11))
+
+    conflicts = run(scenario())
+    assert [c["start_time"].hour for c in conflicts] == [9]
+
+def test_conflicts_only_scan_back_the_longest_allowed_booking(run, db):
+    async def scenario():
+        await db.appointments.insert_one({
+            **_booking(9, 10), "start_time": DAY - MAX_APPOINTMENT_LENGTH - timedelta(hours=1)
+        })
+        return await SchedulingEngine().conflicts(db, "c1", DAY + timedelta(hours=9), DAY + timedelta(hours=10))
+
+    assert run(scenario()) == []
+
+def test_only_the_later_of_two_racing_writes_backs_out(run, db):
+    engine = SchedulingEngine()
+
+    async def scenario():
+        checked_at = datetime.utcnow()
+        first = _booking(9, 11, booked_at=checked_at + timedelta(milliseconds=5))
+        second = _booking(10, 12, booked_at=checked_at + timedelta(milliseconds=10))
+        await db.appointments.insert_many([first, second])
+        return (
+            await engine.later_overlaps(db, first, checked_at),
+            await engine.later_overlaps(db, second, checked_at),
+        )
+
+    assert run(scenario()) == (False, True)
+
+def test_overlaps_written_before_the_check_are_not_a_race(run, db):
+    engine = SchedulingEngine()
+
+    async def scenario():
+        checked_at = datetime.utcnow()
+        await db.appointments.insert_one(_booking(9, 11, booked_at=checked_at - timedelta(minutes=5)))
+        mine = _booking(10, 12, booked_at=checked_at + timedelta(milliseconds=5))
+        await db.appointments.insert_one(mine)
+        return await engine.later_overlaps(db, mine, checked_at)
+
+    assert run(scenario()) is False
+
+@pytest.fixture
+def client(db):
+    async def get_db():
+        return db
+    app.dependency_overrides[get_database] = get_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+def _payload(start_hour, end_hour, **fields):
+    return {
+        "title": "Site visit", "appointment_type": "consultation", "contractor_id": "c1",
+        "start_time": (DAY + timedelta(hours=start_hour)).isoformat(),
+        "end_time": (DAY + timedelta(hours=end_hour)).isoformat(),
+        **fields
+    }
+
+def test_notes_only_update_of_an_allowed_overlap_succeeds(client):
+    first = client.post("/api/appointments/", json=_payload(9, 11), headers=AUTH)
+    assert first.status_code == 201
+    assert client.post("/api/appointments/", json=_payload(10, 12), headers=AUTH).status_code == 409
+    second = client.post("/api/appointments/?allow_conflicts=true", json=_payload(10, 12), headers=AUTH)
+    assert second.status_code == 201
+
+    updated = client.put(f"/api/appointments/{second.json()['id']}", json={"notes": "Gate code 1234"}, headers=AUTH)
+    assert updated.status_code == 200
+    assert updated.json()["notes"] == "Gate code 1234"
+
+def test_moving_into_a_booked_slot_is_rejected(client):
+    client.post("/api/appointments/", json=_payload(9, 11), headers=AUTH)
+    other = client.post("/api/appointments/", json=_payload(13, 14), headers=AUTH).json()
+
+    moved = client.put(f"/api/appointments/{other['id']}", json=_payload(10, 12), headers=AUTH)
+    assert moved.status_code == 409
+    assert moved.json()["detail"]["conflicts"]
+
+def test_bookings_longer_than_the_limit_are_rejected(client):
+    payload = _payload(9, 10)
+    payload["end_time"] = (DAY + MAX_APPOINTMENT_LENGTH + timedelta(hours=10)).isoformat()
+    assert client.post("/api/appointments/", json=payload, headers=AUTH).status_code == 400
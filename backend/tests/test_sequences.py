@@ -0,0 +1,64 @@
+import asyncio
+from datetime import datetime
+
+from app.services.sequences import SEQUENCE_WIDTH, SequenceAllocator
+
+DAY = datetime(2024, 1, 15, 9)
+
+def test_numbers_are_formatted_per_prefix_and_day(run, db):
+    allocator = SequenceAllocator(block_size=5)
+
+    async def scenario():
+        return [await allocator.next_number(db, prefix, DAY) for prefix in ("EST", "EST", "CON")]
+
+    assert run(scenario()) == [
+        f"EST-20240115-{1:0{SEQUENCE_WIDTH}d}",
+        f"EST-20240115-{2:0{SEQUENCE_WIDTH}d}",
+        f"CON-20240115-{1:0{SEQUENCE_WIDTH}d}",
+    ]
+
+def test_concurrent_requests_get_consecutive_numbers_from_one_round_trip_per_block(run, db):
+    allocator = SequenceAllocator(block_size=10)
+
+    async def scenario():
+        values = await asyncio.gather(*(allocator.next_value(db, "EST", "20240115") for _ in range(25)))
+        return values, await db.counters.find_one({"_id": "EST-20240115"})
+
+    values, counter = run(scenario())
+    assert sorted(values) == list(range(1, 26))
+    # Three blocks reserved; the rest of the last one is still held in memory
+    assert counter["value"] == 30
+
+def test_processes_sharing_a_counter_never_collide(run, db):
+    first, second = SequenceAllocator(block_size=4), SequenceAllocator(block_size=4)
+
+    async def scenario():
+        return await asyncio.gather(*(
+            allocator.next_value(db, "EST", "20240115")
+            for _ in range(10) for allocator in (first, second)
+        ))
+
+    values = run(scenario())
+    assert len(set(values)) == 20
+    # Blocks are disjoint, so each process only ever hands out its own ranges
+    assert max(values) <= 24
+
+def test_block_size_one_is_gap_free_across_processes(run, db):
+    allocators = [SequenceAllocator(block_size=1) for _ in range(3)]
+
+    async def scenario():
+        return await asyncio.gather(*(
+            allocator.next_value(db, "CON", "20240115") for _ in range(4) for allocator in allocators
+        ))
+
+    assert sorted(run(scenario())) == list(range(1, 13))
+
+def test_a_new_day_starts_from_one_and_drops_the_old_block(run, db):
+    allocator = SequenceAllocator(block_size=10)
+
+    async def scenario():
+        await allocator.next_value(db, "EST", "20240115")
+        return await allocator.next_value(db, "EST", "20240116")
+
+    assert run(scenario()) == 1
+    assert list(allocator._blocks) == ["EST-20240116"]
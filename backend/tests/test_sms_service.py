@@ -0,0 +1,79 @@
+import httpx
+import pytest
+
+from app.services import sms_service
+from app.services.sms_service import FakeSMSTransport, SMSError, SMSService, TwilioTransport
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    async def sleep(delay):
+        pass
+    monkeypatch.setattr(sms_service.asyncio, "sleep", sleep)
+
+def _twilio(handler):
+    transport = TwilioTransport("AC123", "token")
+    transport.client = httpx.AsyncClient(
+        base_url=transport.client.base_url,
+        transport=httpx.MockTransport(handler)
+    )
+    return transport
+
+def _send(run, transport):
+    async def scenario():
+        try:
+            return await transport.send("+15550000000", "+15551111111", "hello")
+        finally:
+            await transport.close()
+    return run(scenario())
+
+def test_server_errors_are_not_retried(run):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503, json={"message": "unavailable"})
+
+    with pytest.raises(SMSError, match="503"):
+        _send(run, _twilio(handler))
+    assert len(calls) == 1
+
+def test_read_timeouts_are_not_retried(run):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ReadTimeout("no response", request=request)
+
+    with pytest.raises(SMSError, match="not retried"):
+        _send(run, _twilio(handler))
+    assert len(calls) == 1
+
+def test_connection_failures_and_rate_limits_are_retried(run):
+    responses = iter(["connect", 429, 201])
+
+    def handler(request):
+        outcome = next(responses)
+        if outcome == "connect":
+            raise httpx.ConnectError("refused", request=request)
+        if outcome == 429:
+            return httpx.Response(429, headers={"Retry-After": "1"})
+        return httpx.Response(201, json={"sid": "SM1"})
+
+    assert _send(run, _twilio(handler)) == "SM1"
+
+def test_send_many_keeps_order_and_isolates_failures(run, monkeypatch):
+    fake = FakeSMSTransport(fail_numbers={"+15552222222"})
+    monkeypatch.setattr(sms_service, "_transport", fake)
+    monkeypatch.setattr(sms_service, "_send_slots", None)
+    monkeypatch.setattr(sms_service, "_pacers", {})
+
+    async def scenario():
+        service = SMSService()
+        results = await service.send_many([
+            ("+15551111111", "one"), ("+15552222222", "two"), ("+15553333333", "three")
+        ])
+        return results, await service.get_message_history()
+
+    results, history = run(scenario())
+    assert results == [True, False, True]
+    assert [msg["body"] for msg in history] == ["three", "one"]
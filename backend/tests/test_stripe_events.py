@@ -0,0 +1,80 @@
+from app.services.stripe_events import StripeEventProcessor, partition_key
+
+def _event(event_id, created, contract_id="c1", event_type="payment_intent.succeeded"):
+    return {
+        "id": event_id, "type": event_type, "created": created,
+        "data": {"object": {"id": f"pi_{event_id}", "metadata": {"contract_id": contract_id}}}
+    }
+
+def _processor(db, handled, fail=()):
+    processor = StripeEventProcessor(workers=2)
+    processor.db = db
+
+    async def handler(db, event, replay):
+        if event["id"] in fail:
+            raise RuntimeError("boom")
+        handled.append((event["id"], replay))
+
+    processor.on("payment_intent.succeeded", handler)
+    return processor
+
+def test_duplicate_deliveries_are_stored_once(run, db):
+    processor = _processor(db, [])
+
+    async def scenario():
+        first = await processor.ingest(db, _event("evt_1", 100))
+        again = await processor.ingest(db, _event("evt_1", 100))
+        return first, again, await db.stripe_events.count_documents({})
+
+    assert run(scenario()) == (True, False, 1)
+
+def test_contract_events_apply_in_stripe_order(run, db):
+    handled = []
+    processor = _processor(db, handled)
+
+    async def scenario():
+        # Delivered out of order
+        for event in (_event("evt_3", 300), _event("evt_1", 100), _event("evt_2", 200)):
+            await processor.ingest(db, event)
+        await processor.drain("contract:c1")
+        return await db.stripe_events.distinct("status")
+
+    assert run(scenario()) == ["processed"]
+    assert handled == [("evt_1", False), ("evt_2", False), ("evt_3", False)]
+
+def test_failure_holds_back_the_rest_of_the_contract(run, db):
+    handled = []
+    processor = _processor(db, handled, fail={"evt_2"})
+
+    async def scenario():
+        for event in (_event("evt_1", 100), _event("evt_2", 200), _event("evt_3", 300), _event("evt_9", 150, "c2")):
+            await processor.ingest(db, event)
+        await processor.drain("contract:c1")
+        await processor.drain("contract:c2")
+        statuses = {doc["_id"]: doc["status"] async for doc in db.stripe_events.find()}
+        # Once the failing event succeeds, the backlog continues in order
+        processor.on("payment_intent.succeeded", _processor(db, handled).handlers["payment_intent.succeeded"])
+        await processor.drain("contract:c1")
+        return statuses
+
+    statuses = run(scenario())
+    assert statuses == {"evt_1": "processed", "evt_2": "failed", "evt_3": "pending", "evt_9": "processed"}
+    assert [event_id for event_id, _ in handled] == ["evt_1", "evt_9", "evt_2", "evt_3"]
+
+def test_replayed_events_are_flagged_as_replays(run, db):
+    handled = []
+    processor = _processor(db, handled)
+
+    async def scenario():
+        await processor.ingest(db, _event("evt_1", 100))
+        await processor.drain("contract:c1")
+        replayed = await processor.replay(db, event_ids=["evt_1"])
+        await processor.drain("contract:c1")
+        return replayed
+
+    assert run(scenario()) == 1
+    assert handled == [("evt_1", False), ("evt_1", True)]
+
+def test_events_without_a_contract_get_their_own_partition():
+    assert partition_key({"_id": "evt_1", "contract_id": None}) == "event:evt_1"
+    assert partition_key({"_id": "evt_1", "contract_id": "c1"}) == "contract:c1"
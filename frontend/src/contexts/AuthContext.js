@@ -1,5 +1,5 @@
 import React, { createContext, useContext, useState, useEffect } from 'react';
-import api from '../services/api';
+import api, { authAPI } from '../services/api';
 
 const AuthContext = createContext();
 
@@ -76,9 +76,12 @@ export const AuthProvider = ({ children }) => {
       
       try {
         const response = await api.post('/auth/token', formData);
-        const { access_token } = response.data;
+        const { access_token, refresh_token } = response.data;
         
         localStorage.setItem('token', access_token);
+        if (refresh_token) {
+          localStorage.setItem('refresh_token', refresh_token);
+        }
         api.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
         
         try {
@@ -137,7 +140,13 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    // Revoke the refresh session server-side; the local state is cleared regardless
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+      authAPI.logout(refreshToken).catch(() => {});
+    }
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     localStorage.removeItem('user');
     delete api.defaults.headers.common['Authorization'];
     setUser(null);
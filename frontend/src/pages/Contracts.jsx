@@ -140,11 +140,12 @@ const Contracts = () => {
     }
   );
 
-  // Fetch estimates for conversion to contracts
+  // Fetch estimates for conversion to contracts; the list endpoint returns only
+  // summary columns by default, and conversion needs line items and terms
   const { data: estimates = [] } = useQuery(
-    'estimates',
+    ['estimates', 'full'],
     async () => {
-      const response = await api.get('/estimates');
+      const response = await api.get('/estimates', { params: { fields: '*' } });
       return response.data;
     }
   );
@@ -192,17 +193,22 @@ const Contracts = () => {
     }
   );
 
-  const handleView = (contract) => {
-    setSelectedContract(contract);
-    setIsViewMode(true);
-    setContractDialogOpen(true);
+  // List rows only carry summary columns, so load the full contract before the
+  // dialog resets its form from it (and saves every field back)
+  const openContract = async (contract, viewMode) => {
+    try {
+      const response = await api.get(`/contracts/${contract.id}`);
+      setSelectedContract(response.data);
+      setIsViewMode(viewMode);
+      setContractDialogOpen(true);
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Failed to load contract');
+    }
   };
 
-  const handleEdit = (contract) => {
-    setSelectedContract(contract);
-    setIsViewMode(false);
-    setContractDialogOpen(true);
-  };
+  const handleView = (contract) => openContract(contract, true);
+
+  const handleEdit = (contract) => openContract(contract, false);
 
   const handleSend = (id) => {
     if (window.confirm('Are you sure you want to send this contract?')) {
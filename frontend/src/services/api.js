@@ -58,10 +58,37 @@ api.interceptors.request.use(
   }
 );
 
+// Access tokens are short-lived; a 401 is answered by exchanging the stored
+// refresh token for a new pair (one exchange at a time) and retrying once
+let refreshing = null;
+
+const refreshAccessToken = () => {
+  if (!refreshing) {
+    const refreshToken = localStorage.getItem('refresh_token');
+    refreshing = (refreshToken
+      ? axios.post(`${API_BASE_URL}/auth/refresh`, { refresh_token: refreshToken })
+      : Promise.reject(new Error('No refresh token'))
+    )
+      .then((response) => {
+        const { access_token, refresh_token } = response.data;
+        localStorage.setItem('token', access_token);
+        if (refresh_token) {
+          localStorage.setItem('refresh_token', refresh_token);
+        }
+        api.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+        return access_token;
+      })
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+};
+
 // Response interceptor for error handling
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
     // Log the full error for debugging
     console.error('API Error:', {
       url: error.config?.url,
@@ -71,8 +98,21 @@ api.interceptors.response.use(
       message: error.message
     });
     
+    const request = error.config;
+    if (error.response?.status === 401 && request && !request._retried && !request.url?.startsWith('/auth/')) {
+      request._retried = true;
+      try {
+        const accessToken = await refreshAccessToken();
+        request.headers.Authorization = `Bearer ${accessToken}`;
+        return api(request);
+      } catch (refreshError) {
+        // Fall through to the login redirect below
+      }
+    }
+    
     if (error.response?.status === 401) {
       localStorage.removeItem('token');
+      localStorage.removeItem('refresh_token');
       window.location.href = '/login';
     }
     return Promise.reject(error);
@@ -105,9 +145,9 @@ export const marketingApi = {
 export const authAPI = {
   login: (credentials) => api.post('/auth/login/', credentials),
   register: (userData) => api.post('/auth/register/', userData),
-  logout: () => api.post('/auth/logout/'),
+  logout: (refreshToken) => api.post('/auth/logout', { refresh_token: refreshToken }),
   me: () => api.get('/auth/me/'),
-  refreshToken: () => api.post('/auth/refresh/'),
+  refreshToken: (refreshToken) => api.post('/auth/refresh', { refresh_token: refreshToken }),
 };
 
 export const clientsAPI = {